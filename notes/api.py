@@ -0,0 +1,483 @@
+"""JSON API для пакетной работы с заметками.
+
+Один POST на ``notes:api_batch`` создаёт, изменяет и удаляет сразу
+много заметок. Вся пачка укладывается в фиксированное число запросов
+к базе: цели изменений и занятые slug загружаются заранее, запись идёт
+через bulk_create, bulk_update и один DELETE в одной транзакции.
+"""
+import json
+import time
+from http import HTTPStatus
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views import generic
+
+from . import slugs
+from .forms import BatchNoteForm, TagsField
+from .models import (
+    AuthorStats, AuthorVersion, Note, NoteChange, NoteRevision, NoteTag, Tag,
+)
+from .views import NoteBase
+
+MAX_BATCH_ITEMS = 1000
+CHANGES_PAGE_SIZE = 200
+MAX_CHANGES_PAGE_SIZE = 1000
+MAX_WAIT_SECONDS = 25
+POLL_INTERVAL = 0.5
+UPDATE_FIELDS = (
+    'title', 'text', 'text_html', 'text_hash', 'text_length', 'slug',
+    'updated_at', 'version',
+)
+
+
+class SlugClaims:
+    """Кто владеет slug в рамках пачки: id заметки или токен новой."""
+
+    def __init__(self, existing):
+        self.owners = dict(existing)
+
+    def is_taken(self, slug, owner):
+        current = self.owners.get(slug)
+        return current is not None and current != owner
+
+    def claim(self, slug, owner):
+        self.owners[slug] = owner
+
+
+def parse_int(value, default, minimum=0, maximum=None):
+    """Число из GET-параметра; None, если в параметре мусор."""
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    if number < minimum:
+        return None
+    if maximum is not None:
+        number = min(number, maximum)
+    return number
+
+
+def error(status, message):
+    return {'status': status, 'errors': {'__all__': [message]}}
+
+
+def form_errors(form):
+    return {
+        'status': HTTPStatus.BAD_REQUEST,
+        'errors': {
+            field: list(messages) for field, messages in form.errors.items()
+        },
+    }
+
+
+class NoteBatch(NoteBase, generic.View):
+    """Пакетное создание, изменение и удаление заметок.
+
+    Тело запроса::
+
+        {"create": [{"title": ..., "text": ..., "slug": ...}],
+         "update": [{"slug": ..., "title": ..., "text": ...,
+                     "new_slug": ...}],
+         "delete": ["slug", ...]}
+
+    В ответе для каждого элемента - свой статус и slug или ошибки.
+    """
+    http_method_names = ('post',)
+    raise_exception = True
+
+    def post(self, request, *args, **kwargs):
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return self.bad_request('Тело запроса - не JSON.')
+        if not isinstance(payload, dict):
+            return self.bad_request('Ожидается JSON-объект.')
+        creates = payload.get('create', [])
+        updates = payload.get('update', [])
+        deletes = payload.get('delete', [])
+        if not all(isinstance(part, list)
+                   for part in (creates, updates, deletes)):
+            return self.bad_request(
+                'create, update и delete должны быть списками.'
+            )
+        if len(creates) + len(updates) + len(deletes) > MAX_BATCH_ITEMS:
+            return self.bad_request(
+                f'В пачке больше {MAX_BATCH_ITEMS} элементов.'
+            )
+
+        queryset = self.get_queryset()
+        target_slugs = [
+            item['slug'] for item in updates
+            if isinstance(item, dict) and isinstance(item.get('slug'), str)
+        ] + [slug for slug in deletes if isinstance(slug, str)]
+        targets = queryset.in_bulk(target_slugs, field_name='slug')
+
+        results = {'create': [], 'update': [], 'delete': []}
+        deleted = []
+        deleted_pks = []
+        for slug in deletes:
+            note = targets.get(slug) if isinstance(slug, str) else None
+            if note is None:
+                results['delete'].append(
+                    error(HTTPStatus.NOT_FOUND, 'Заметка не найдена.')
+                )
+            elif note.pk in deleted_pks:
+                results['delete'].append(
+                    error(HTTPStatus.BAD_REQUEST, 'Заметка уже в пачке.')
+                )
+            else:
+                deleted.append(note)
+                deleted_pks.append(note.pk)
+                results['delete'].append(
+                    {'status': HTTPStatus.NO_CONTENT, 'slug': slug}
+                )
+
+        explicit = [
+            value for value in (
+                [item.get('slug') for item in creates
+                 if isinstance(item, dict)]
+                + [item.get('new_slug') for item in updates
+                   if isinstance(item, dict)]
+            ) if isinstance(value, str) and value
+        ]
+        claims = SlugClaims(
+            Note.objects.using(queryset.db).filter(slug__in=explicit).exclude(
+                pk__in=deleted_pks
+            ).values_list('slug', 'pk')
+        )
+
+        to_update = self.validate_updates(
+            updates, targets, deleted_pks, claims, results['update']
+        )
+        to_create = self.validate_creates(
+            creates, claims, results['create']
+        )
+
+        try:
+            with transaction.atomic(using=queryset.db):
+                self.write(queryset, to_create, to_update, deleted)
+        except IntegrityError:
+            return JsonResponse(
+                error(
+                    HTTPStatus.CONFLICT,
+                    'Пачка конфликтует с параллельным изменением.',
+                ),
+                status=HTTPStatus.CONFLICT,
+            )
+
+        created_ids = dict(
+            Note.objects.using(queryset.db).filter(
+                slug__in=[note.slug for _, note in to_create]
+            ).values_list('slug', 'id')
+        ) if to_create else {}
+        for index, note in to_create:
+            results['create'][index] = {
+                'status': HTTPStatus.CREATED,
+                'id': created_ids.get(note.slug),
+                'slug': note.slug,
+            }
+        for index, note, _ in to_update:
+            results['update'][index] = {
+                'status': HTTPStatus.OK, 'id': note.pk, 'slug': note.slug,
+            }
+        return JsonResponse(results)
+
+    def bad_request(self, message):
+        return JsonResponse(
+            error(HTTPStatus.BAD_REQUEST, message),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    def validate_updates(self, updates, targets, deleted_pks, claims,
+                         results):
+        """Проверяет изменения формой, возвращает (индекс, заметка, slug)."""
+        valid = []
+        seen = set()
+        for index, item in enumerate(updates):
+            note = (
+                targets.get(item.get('slug'))
+                if isinstance(item, dict) else None
+            )
+            if note is None:
+                results.append(
+                    error(HTTPStatus.NOT_FOUND, 'Заметка не найдена.')
+                )
+                continue
+            if note.pk in seen or note.pk in deleted_pks:
+                results.append(
+                    error(HTTPStatus.BAD_REQUEST, 'Заметка уже в пачке.')
+                )
+                continue
+            seen.add(note.pk)
+            old_slug = note.slug
+            form = BatchNoteForm(
+                data={
+                    'title': item.get('title', note.title),
+                    'text': item.get('text', note.text),
+                    'slug': item.get('new_slug', note.slug),
+                },
+                instance=note,
+                slug_claims=claims,
+            )
+            if not form.is_valid():
+                results.append(form_errors(form))
+                continue
+            note = form.save(commit=False)
+            if note.slug:
+                claims.claim(note.slug, note.pk)
+            results.append(None)
+            valid.append((index, note, old_slug))
+        return valid
+
+    def validate_creates(self, creates, claims, results):
+        """Проверяет новые заметки формой, возвращает (индекс, заметка)."""
+        valid = []
+        for index, item in enumerate(creates):
+            if not isinstance(item, dict):
+                results.append(
+                    error(HTTPStatus.BAD_REQUEST, 'Ожидается JSON-объект.')
+                )
+                continue
+            owner = object()
+            form = BatchNoteForm(data=item, slug_claims=claims)
+            if not form.is_valid():
+                results.append(form_errors(form))
+                continue
+            note = form.save(commit=False)
+            note.author = self.request.user
+            if note.slug:
+                claims.claim(note.slug, owner)
+            results.append(None)
+            valid.append((index, note))
+        return valid
+
+    def write(self, queryset, to_create, to_update, deleted):
+        """Применяет всю пачку фиксированным числом запросов."""
+        deleted_pks = [note.pk for note in deleted]
+        if deleted_pks:
+            queryset.filter(pk__in=deleted_pks).delete()
+
+        auto = []
+        for _, note, old_slug in to_update:
+            if not note.slug:
+                if slugs.base_slug(note.title) == old_slug:
+                    note.slug = old_slug
+                else:
+                    auto.append(note)
+        auto.extend(note for _, note in to_create if not note.slug)
+        if auto:
+            allocated = slugs.allocate_slugs(
+                [note.title for note in auto],
+                Note.objects.using(queryset.db),
+                reserved=[
+                    note.slug for _, note in to_create if note.slug
+                ] + [note.slug for _, note, _ in to_update if note.slug],
+            )
+            for note, slug in zip(auto, allocated):
+                note.slug = slug
+
+        if to_update:
+            now = timezone.now()
+            notes = [note for _, note, _ in to_update]
+            history = []
+            for note in notes:
+                revision = note.prepare_revision(queryset.db)
+                if revision is not None:
+                    history.append(revision)
+                note.render_text()
+                note.updated_at = now
+            AuthorStats.shift(
+                self.request.user.pk,
+                chars=sum(note.text_length for note in notes),
+                replaced=queryset.filter(pk__in=[note.pk for note in notes]),
+                edited=False,
+                using=queryset.db,
+            )
+            Note.objects.using(queryset.db).bulk_update(notes, UPDATE_FIELDS)
+            NoteRevision.objects.using(queryset.db).bulk_create(history)
+        if to_create:
+            for _, note in to_create:
+                note.render_text()
+            Note.objects.using(queryset.db).bulk_create(
+                note for _, note in to_create
+            )
+        if to_create or to_update or deleted_pks:
+            Note.after_bulk_write(
+                self.request.user.pk,
+                created=queryset.filter(
+                    slug__in=[note.slug for _, note in to_create]
+                ) if to_create else None,
+                updated=queryset.filter(
+                    pk__in=[note.pk for _, note, _ in to_update]
+                ) if to_update else None,
+                deleted=deleted,
+                using=queryset.db,
+            )
+
+
+class NoteTagsBatch(NoteBase, generic.View):
+    """Массовое назначение меток.
+
+    Тело запроса::
+
+        {"notes": ["slug", ...], "add": ["метка", ...],
+         "remove": ["метка", ...]}
+
+    Недостающие метки из add создаются, неизвестные метки из remove
+    пропускаются. Вся пачка - несколько запросов независимо от числа
+    заметок: связи пишутся одним bulk_create и одним DELETE, счётчики
+    меток сдвигаются через F().
+    """
+    http_method_names = ('post',)
+    raise_exception = True
+
+    def post(self, request, *args, **kwargs):
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return self.bad_request('Тело запроса - не JSON.')
+        if not isinstance(payload, dict):
+            return self.bad_request('Ожидается JSON-объект.')
+        note_slugs = payload.get('notes', [])
+        parts = [note_slugs, payload.get('add', []), payload.get('remove', [])]
+        if not all(
+            isinstance(part, list)
+            and all(isinstance(value, str) for value in part)
+            for part in parts
+        ):
+            return self.bad_request(
+                'notes, add и remove должны быть списками строк.'
+            )
+        if len(note_slugs) > MAX_BATCH_ITEMS:
+            return self.bad_request(
+                f'В пачке больше {MAX_BATCH_ITEMS} заметок.'
+            )
+        field = TagsField(required=False)
+        try:
+            add, remove = (
+                field.clean(', '.join(part)) for part in parts[1:]
+            )
+        except ValidationError as exc:
+            return self.bad_request(exc.messages[0])
+
+        queryset = self.get_queryset()
+        notes = list(
+            queryset.filter(slug__in=note_slugs).values_list('id', 'slug')
+        )
+        with transaction.atomic(using=queryset.db):
+            changed = NoteTag.assign(
+                request.user.pk,
+                notes,
+                add=Tag.for_names(request.user.pk, add, using=queryset.db),
+                remove=list(Tag.objects.using(queryset.db).filter(
+                    author=request.user,
+                    slug__in=[Tag.slug_for(name) for name in remove],
+                )),
+                using=queryset.db,
+            )
+        found = {slug for _, slug in notes}
+        return JsonResponse({
+            'changed': changed,
+            'not_found': [slug for slug in note_slugs if slug not in found],
+        })
+
+    def bad_request(self, message):
+        return JsonResponse(
+            error(HTTPStatus.BAD_REQUEST, message),
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+
+class NoteChanges(NoteBase, generic.View):
+    """Лента изменений заметок автора начиная с курсора.
+
+    ``?since=<seq>`` - последний уже полученный номер изменения,
+    ``?limit=`` - размер страницы, ``?wait=<секунды>`` - долгий опрос:
+    если изменений нет, ответ придёт, как только они появятся, или по
+    истечении времени ожидания.
+    """
+    http_method_names = ('get',)
+    raise_exception = True
+    read_only = True
+
+    def get(self, request, *args, **kwargs):
+        since = parse_int(request.GET.get('since'), 0)
+        limit = parse_int(
+            request.GET.get('limit'), CHANGES_PAGE_SIZE, minimum=1,
+            maximum=MAX_CHANGES_PAGE_SIZE,
+        )
+        wait = parse_int(
+            request.GET.get('wait'), 0, maximum=MAX_WAIT_SECONDS
+        )
+        if since is None or limit is None or wait is None:
+            return JsonResponse(
+                error(HTTPStatus.BAD_REQUEST, 'Некорректные параметры.'),
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        if wait:
+            self.wait_for_changes(since, wait)
+
+        changes = list(
+            NoteChange.objects.using(self.get_shard()).filter(
+                author=request.user, seq__gt=since
+            ).order_by('seq').values_list(
+                'seq', 'note_id', 'slug', 'action'
+            )[:limit + 1]
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        # Несколько изменений одной заметки в странице сворачиваются в
+        # последнее: клиенту нужно только итоговое состояние.
+        latest = {}
+        for seq, note_id, slug, action in changes:
+            latest[note_id] = (seq, slug, action)
+        alive = self.get_queryset().only(
+            'id', 'title', 'text', 'slug', 'updated_at'
+        ).in_bulk([
+            note_id for note_id, (_, _, action) in latest.items()
+            if action != NoteChange.DELETE
+        ])
+
+        deltas = []
+        for note_id, (seq, slug, action) in sorted(
+            latest.items(), key=lambda item: item[1][0]
+        ):
+            note = alive.get(note_id)
+            if note is None:
+                deltas.append({
+                    'seq': seq, 'action': NoteChange.DELETE,
+                    'id': note_id, 'slug': slug,
+                })
+                continue
+            deltas.append({
+                'seq': seq,
+                'action': action,
+                'id': note_id,
+                'slug': note.slug,
+                'title': note.title,
+                'text': note.text,
+                'updated_at': note.updated_at.isoformat(),
+            })
+        return JsonResponse({
+            'changes': deltas,
+            'cursor': changes[-1][0] if changes else since,
+            'has_more': has_more,
+        })
+
+    def wait_for_changes(self, since, wait):
+        """Опрашивает версию автора, пока она не обгонит курсор."""
+        deadline = time.monotonic() + wait
+        versions = AuthorVersion.objects.using(self.get_shard()).filter(
+            author=self.request.user
+        )
+        while time.monotonic() < deadline:
+            version = versions.values_list('version', flat=True).first()
+            if version is not None and version > since:
+                return
+            time.sleep(POLL_INTERVAL)
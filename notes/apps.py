@@ -1,6 +1,48 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.core import checks
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class NotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'notes'
+
+    def ready(self):
+        from yanote import auth, ratelimit
+        from yanote.staticfiles import check_vendor_assets
+        from yanote.sqlite import configure_connection
+
+        from .fields import register_sqlite_functions
+        from .sharding import delete_author_notes
+
+        checks.register(check_vendor_assets, deploy=True)
+        checks.register(auth.check_shared_cache, deploy=True)
+        checks.register(ratelimit.check_rate_limit_cache, deploy=True)
+        connection_created.connect(
+            configure_connection, dispatch_uid='yanote_sqlite_pragmas'
+        )
+        connection_created.connect(
+            register_sqlite_functions,
+            dispatch_uid='notes_sqlite_functions',
+        )
+        pre_delete.connect(
+            delete_author_notes,
+            sender=settings.AUTH_USER_MODEL,
+            dispatch_uid='notes_delete_author_notes',
+        )
+        post_save.connect(
+            auth.user_changed,
+            sender=settings.AUTH_USER_MODEL,
+            dispatch_uid='yanote_auth_user_saved',
+        )
+        post_delete.connect(
+            auth.user_changed,
+            sender=settings.AUTH_USER_MODEL,
+            dispatch_uid='yanote_auth_user_deleted',
+        )
+        user_logged_out.connect(
+            auth.user_logged_out, dispatch_uid='yanote_auth_logged_out'
+        )
@@ -0,0 +1,297 @@
+"""Сценарии нагрузочного прогона через тестовый клиент Django.
+
+Каждый сценарий - последовательность запросов одного пользователя к
+одной странице. Для каждого запроса меряется время ответа и число
+SQL-запросов; по сценарию считаются p50/p95/p99 и среднее/максимум
+запросов. Результат сравнивается с сохранённым JSON-эталоном.
+
+sqlite_throughput() отдельно меряет саму SQLite под смешанной нагрузкой
+из нескольких потоков, чтобы сравнивать профили DATABASE_PROFILES, а
+ratelimit_overhead() - цену проверки ограничителя частоты на запрос.
+"""
+import json
+import math
+import random
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from time import monotonic, perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.test import Client, RequestFactory
+from django.urls import resolve, reverse
+
+from yanote import ratelimit
+from yanote.metrics import QueryStats
+from yanote.sqlite import apply_pragmas
+
+from . import sharding
+from .models import Note
+
+SCENARIOS = ('home', 'list', 'detail', 'add', 'edit', 'delete')
+
+
+def percentile(values, q):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, queries):
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+class Runner:
+    """Прогоняет сценарии от имени одного автора."""
+
+    def __init__(self, author, requests=50, client=None):
+        self.author = author
+        self.requests = requests
+        self.client = client or Client()
+        self.client.force_login(author)
+        # Прогрев: сессия и пользователь оседают в кэше, как у живого
+        # пользователя, и число запросов меряется уже для тёплых ответов.
+        self.client.get(reverse('notes:home'))
+        self.slugs = list(
+            Note.objects.using(sharding.shard_for(author)).filter(
+                author=author
+            ).order_by('id').values_list(
+                'slug', flat=True
+            )
+        )
+
+    def measure(self, method, url, data=None):
+        stats = QueryStats()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            start = perf_counter()
+            response = getattr(self.client, method)(url, data or {})
+            elapsed = perf_counter() - start
+        if response.status_code >= 400:
+            raise AssertionError(
+                f'{method.upper()} {url}: ответ {response.status_code}'
+            )
+        return elapsed, stats.count
+
+    def requests_for(self, name):
+        """Запросы сценария: (метод, url, данные)."""
+        slugs = self.slugs
+        if not slugs and name in ('detail', 'edit', 'delete'):
+            raise AssertionError(f'Для сценария {name} нет заметок.')
+        for index in range(self.requests):
+            if name == 'home':
+                yield 'get', reverse('notes:home'), None
+            elif name == 'list':
+                yield 'get', reverse('notes:list'), None
+            elif name == 'detail':
+                slug = slugs[index % len(slugs)]
+                yield 'get', reverse('notes:detail', args=(slug,)), None
+            elif name == 'add':
+                yield 'post', reverse('notes:add'), {
+                    'title': f'Заметка бенчмарка {index}',
+                    'text': 'Текст заметки бенчмарка.',
+                }
+            elif name == 'edit':
+                slug = slugs[index % len(slugs)]
+                yield 'post', reverse('notes:edit', args=(slug,)), {
+                    'title': f'Правка {index}',
+                    'text': f'Новый текст {index}.',
+                    'slug': slug,
+                }
+            elif name == 'delete':
+                if not slugs:
+                    return
+                slug = slugs.pop()
+                yield 'post', reverse('notes:delete', args=(slug,)), None
+            else:
+                raise ValueError(f'Неизвестный сценарий {name}')
+
+    def run(self, name):
+        latencies, queries = [], []
+        for method, url, data in self.requests_for(name):
+            elapsed, count = self.measure(method, url, data)
+            latencies.append(elapsed)
+            queries.append(count)
+        return summarize(latencies, queries)
+
+    def run_all(self, names=SCENARIOS):
+        return {name: self.run(name) for name in names}
+
+
+def unlimited(rules):
+    """Те же вёдра RATE_LIMITS, но такие большие, что не срабатывают:
+    сценарии платят за проверку, но не получают 429."""
+    return {
+        name: tuple(
+            (kind, 10 ** 9, seconds) for kind, _, seconds in buckets
+        )
+        for name, buckets in rules.items()
+    }
+
+
+def ratelimit_overhead(author, checks=1000, view_name='notes:add'):
+    """p50/p95 одной проверки ограничителя для POST на view_name, мкс."""
+    url = reverse(view_name)
+    request = RequestFactory().post(url)
+    request.user = author
+    request.resolver_match = resolve(url)
+    rules = unlimited(settings.RATE_LIMITS).get(view_name, ())
+    timings = []
+    for _ in range(checks):
+        start = perf_counter()
+        ratelimit.check(request, view_name, rules)
+        timings.append(perf_counter() - start)
+    return {
+        'view': view_name,
+        'buckets': len(rules),
+        'checks': checks,
+        'p50_us': round(percentile(timings, 50) * 1e6, 2),
+        'p95_us': round(percentile(timings, 95) * 1e6, 2),
+    }
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as stream:
+        return json.load(stream)
+
+
+def save_baseline(path, report):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(report, stream, ensure_ascii=False, indent=2)
+        stream.write('\n')
+
+
+def compare(report, baseline, latency_tolerance=None):
+    """Список регрессий относительно эталона.
+
+    Число запросов не зависит от железа, поэтому сравнивается всегда и
+    строго. Задержка сравнивается, только если задан допуск: p95
+    не должен превышать эталонный больше чем в latency_tolerance раз.
+    """
+    problems = []
+    if report.get('dataset') != baseline.get('dataset'):
+        problems.append(
+            f'набор данных {report.get("dataset")} не совпадает с '
+            f'эталонным {baseline.get("dataset")}'
+        )
+    for name, result in report['scenarios'].items():
+        expected = baseline.get('scenarios', {}).get(name)
+        if expected is None:
+            continue
+        if result['queries_max'] > expected['queries_max']:
+            problems.append(
+                f'{name}: {result["queries_max"]} SQL-запросов на ответ '
+                f'вместо {expected["queries_max"]}'
+            )
+        if latency_tolerance and (
+            result['p95_ms'] > expected['p95_ms'] * latency_tolerance
+        ):
+            problems.append(
+                f'{name}: p95 {result["p95_ms"]} мс при эталоне '
+                f'{expected["p95_ms"]} мс (допуск x{latency_tolerance})'
+            )
+    return problems
+
+
+SQLITE_SCHEMA = (
+    'CREATE TABLE note (id INTEGER PRIMARY KEY, author_id INTEGER, '
+    'title TEXT, text TEXT, slug TEXT UNIQUE)',
+    'CREATE INDEX note_author_id ON note (author_id, id)',
+)
+SQLITE_READ = (
+    'SELECT id, title, slug FROM note WHERE author_id = ? '
+    'ORDER BY id LIMIT 50'
+)
+SQLITE_WRITE = 'UPDATE note SET text = ? WHERE id = ?'
+
+
+def prepare_sqlite(path, rows=5000, authors=50):
+    """Файл базы со схемой, похожей на notes_note."""
+    connection = sqlite3.connect(path)
+    with connection:
+        for statement in SQLITE_SCHEMA:
+            connection.execute(statement)
+        connection.executemany(
+            'INSERT INTO note (author_id, title, text, slug) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                (index % authors, f'Заметка {index}', 'Текст ' * 50,
+                 f'note-{index}')
+                for index in range(rows)
+            ),
+        )
+    connection.close()
+
+
+def sqlite_throughput(path, pragmas, persistent, threads=8, seconds=3.0,
+                      write_ratio=0.2, rows=5000, authors=50, seed=0,
+                      timeout=5.0):
+    """Операций в секунду при смешанной нагрузке из нескольких потоков.
+
+    persistent=False открывает соединение на каждую операцию, как при
+    CONN_MAX_AGE=0; True - держит одно соединение на поток.
+    """
+    def connect():
+        connection = sqlite3.connect(
+            path, timeout=timeout, check_same_thread=False
+        )
+        apply_pragmas(connection, pragmas)
+        return connection
+
+    start_barrier = threading.Barrier(threads)
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        own = connect() if persistent else None
+        reads = writes = errors = 0
+        start_barrier.wait()
+        deadline = monotonic() + seconds
+        while monotonic() < deadline:
+            connection = own or connect()
+            try:
+                if rng.random() < write_ratio:
+                    with connection:
+                        connection.execute(
+                            SQLITE_WRITE,
+                            (f'Правка {rng.random()}', rng.randint(1, rows)),
+                        )
+                    writes += 1
+                else:
+                    connection.execute(
+                        SQLITE_READ, (rng.randrange(authors),)
+                    ).fetchall()
+                    reads += 1
+            except sqlite3.OperationalError:
+                errors += 1
+            finally:
+                if own is None:
+                    connection.close()
+        if own is not None:
+            own.close()
+        return reads, writes, errors
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    reads = sum(result[0] for result in results)
+    writes = sum(result[1] for result in results)
+    return {
+        'threads': threads,
+        'reads_per_s': round(reads / seconds, 1),
+        'writes_per_s': round(writes / seconds, 1),
+        'ops_per_s': round((reads + writes) / seconds, 1),
+        'errors': sum(result[2] for result in results),
+    }
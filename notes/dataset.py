@@ -0,0 +1,77 @@
+"""Воспроизводимый набор данных для нагрузочных проверок.
+
+Один и тот же seed всегда даёт одних и тех же пользователей и одни и
+те же заметки с кириллическими заголовками; slug для них получаются
+через pytils так же, как в обычной работе сайта.
+"""
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from . import exchange
+
+WORDS = (
+    'заметка', 'список', 'покупки', 'молоко', 'хлеб', 'встреча', 'проект',
+    'отчёт', 'идея', 'книга', 'фильм', 'поездка', 'билеты', 'дача',
+    'ремонт', 'задача', 'план', 'неделя', 'понедельник', 'пятница',
+    'звонок', 'письмо', 'счёт', 'оплата', 'рецепт', 'пирог', 'борщ',
+    'тренировка', 'бег', 'врач', 'подарок', 'праздник', 'отпуск', 'море',
+    'горы', 'кошка', 'собака', 'машина', 'шины', 'документы', 'паспорт',
+    'учёба', 'экзамен', 'лекция', 'код', 'сервер', 'база', 'данные',
+)
+DEFAULT_PASSWORD = 'benchmark-password'
+USERNAME_TEMPLATE = 'bench-{seed}-{index}'
+
+
+def _phrase(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def note_rows(rng, count):
+    """Поток строк заметок в формате exchange.import_notes()."""
+    for _ in range(count):
+        yield {
+            'title': _phrase(rng, 2, 5).capitalize(),
+            'text': '. '.join(
+                _phrase(rng, 4, 12).capitalize()
+                for _ in range(rng.randint(1, 20))
+            ) + '.',
+            'slug': '',
+        }
+
+
+def generate(users, notes_per_user, seed=0, batch_size=None,
+             password=DEFAULT_PASSWORD, using=None):
+    """Создаёт users пользователей по notes_per_user заметок у каждого.
+
+    Пользователи, уже созданные с тем же seed, переиспользуются.
+    Возвращает список пользователей.
+    """
+    User = get_user_model()
+    rng = random.Random(seed)
+    manager = User.objects.db_manager(using)
+    usernames = [
+        USERNAME_TEMPLATE.format(seed=seed, index=index)
+        for index in range(users)
+    ]
+    existing = set(
+        manager.filter(username__in=usernames).values_list(
+            'username', flat=True
+        )
+    )
+    # Хэширование пароля дорогое, поэтому хэш один на всех.
+    password_hash = make_password(password)
+    manager.bulk_create(
+        User(username=username, password=password_hash)
+        for username in usernames if username not in existing
+    )
+    authors = list(manager.filter(username__in=usernames).order_by('id'))
+    for author in authors:
+        exchange.import_notes(
+            note_rows(rng, notes_per_user),
+            author,
+            batch_size=batch_size or exchange.DEFAULT_BATCH_SIZE,
+            using=using,
+        )
+    return authors
@@ -0,0 +1,183 @@
+"""Потоковый импорт и экспорт заметок в JSONL и CSV.
+
+Все функции работают с генераторами, поэтому память не зависит от
+числа заметок: чтение идёт построчно, запись в базу - пачками через
+bulk_create, выгрузка - через QuerySet.iterator().
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+
+from . import sharding, slugs
+from .models import Note
+
+FIELDS = ('title', 'text', 'slug')
+FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class ImportRowError(ValueError):
+    """Строка импорта не прошла проверку."""
+
+
+def guess_format(path, default='jsonl'):
+    """Определяет формат по расширению файла."""
+    if path and str(path).lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def batched(iterable, size):
+    """Разбивает поток на списки длиной не больше size."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_jsonl(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Битая строка дойдёт до clean_row и будет пропущена.
+            yield None
+
+
+def read_csv(lines):
+    yield from csv.DictReader(lines)
+
+
+def read_rows(lines, fmt):
+    return read_csv(lines) if fmt == 'csv' else read_jsonl(lines)
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def write_jsonl(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n'
+
+
+def write_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_rows(rows, fmt):
+    return write_csv(rows) if fmt == 'csv' else write_jsonl(rows)
+
+
+def iter_notes(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Кортежи (title, text, slug) в порядке id, без кэша QuerySet."""
+    return queryset.order_by('id').values_list(*FIELDS).iterator(
+        chunk_size=chunk_size
+    )
+
+
+def export_notes(author, fmt='jsonl', chunk_size=DEFAULT_CHUNK_SIZE,
+                 using=None):
+    """Генератор строк выгрузки всех заметок автора."""
+    queryset = Note.objects.using(
+        using or sharding.shard_for(author)
+    ).filter(author=author)
+    return write_rows(iter_notes(queryset, chunk_size), fmt)
+
+
+def _text_field(row, name):
+    """Строковое поле строки импорта; отсутствующее или null - пустое."""
+    value = row.get(name)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ImportRowError(f'поле {name} должно быть строкой')
+    return value
+
+
+def clean_row(row):
+    """Проверяет строку импорта по ограничениям модели Note."""
+    if not isinstance(row, dict):
+        raise ImportRowError('строка должна быть объектом')
+    title = _text_field(row, 'title').strip()
+    text = _text_field(row, 'text')
+    slug = _text_field(row, 'slug').strip()
+    if not text:
+        raise ImportRowError('пустой текст')
+    title = title or Note._meta.get_field('title').default
+    if len(title) > Note._meta.get_field('title').max_length:
+        raise ImportRowError('слишком длинный заголовок')
+    if len(slug) > Note._meta.get_field('slug').max_length:
+        raise ImportRowError('слишком длинный slug')
+    return {'title': title, 'text': text, 'slug': slug}
+
+
+def import_batch(rows, author, using=None):
+    """Создаёт пачку заметок одним bulk_create в одной транзакции.
+
+    Slug выдаются всей пачке заранее одним запросом: явно заданный
+    slug сохраняется, если свободен, иначе получает суффикс. HTML
+    текста считается здесь же, как при Note.save().
+    """
+    using = using or sharding.shard_for(author)
+    queryset = Note.objects.using(using)
+    with transaction.atomic(using=using):
+        batch_slugs = slugs.allocate_slugs(
+            [row['slug'] or row['title'] for row in rows], queryset
+        )
+        notes = [
+            Note(
+                title=row['title'],
+                text=row['text'],
+                slug=slug,
+                author=author,
+            )
+            for row, slug in zip(rows, batch_slugs)
+        ]
+        for note in notes:
+            note.render_text()
+        queryset.bulk_create(notes)
+        Note.after_bulk_write(
+            author.pk, created=queryset.filter(slug__in=batch_slugs),
+            using=using,
+        )
+    return len(rows)
+
+
+def import_notes(rows, author, batch_size=DEFAULT_BATCH_SIZE, using=None,
+                 on_error=None):
+    """Импортирует поток строк пачками, возвращает число заметок.
+
+    Некорректные строки пропускаются; on_error(номер, ошибка) узнаёт
+    о каждой из них.
+    """
+    def valid_rows():
+        for number, row in enumerate(rows, start=1):
+            try:
+                yield clean_row(row)
+            except ImportRowError as error:
+                if on_error is not None:
+                    on_error(number, error)
+
+    created = 0
+    for batch in batched(valid_rows(), batch_size):
+        created += import_batch(batch, author, using=using)
+    return created
@@ -0,0 +1,70 @@
+"""Текстовое поле, которое хранит длинные значения сжатыми zlib.
+
+Короткий текст лежит в колонке как обычная строка, длинный - как BLOB
+со сжатыми UTF-8 байтами. SQLite хранит BLOB в колонке любого типа,
+поэтому схема таблицы не меняется, а отличить сжатое значение от
+несжатого можно по типу: строку пользователь ввести может, байты - нет.
+На других СУБД поле ведёт себя как обычный TextField.
+
+Чтобы SQL мог читать такие колонки (INSERT ... SELECT в поисковый
+индекс), в каждое соединение SQLite добавляется функция zlib_text().
+"""
+import zlib
+
+from django.db import models
+
+SQL_FUNCTION = 'zlib_text'
+DEFAULT_MIN_LENGTH = 1024
+COMPRESS_LEVEL = 6
+
+
+def decompress(value):
+    """Текст из значения колонки: BLOB распаковывается, строка - как есть."""
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value
+
+
+class CompressedTextField(models.TextField):
+    """TextField, сжимающий значения от min_length байт в UTF-8."""
+
+    def __init__(self, *args, min_length=DEFAULT_MIN_LENGTH, **kwargs):
+        self.min_length = min_length
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.min_length != DEFAULT_MIN_LENGTH:
+            kwargs['min_length'] = self.min_length
+        return name, path, args, kwargs
+
+    def compress(self, value):
+        """Сжатые байты или сама строка, если сжимать невыгодно."""
+        data = value.encode()
+        if len(data) < self.min_length:
+            return value
+        compressed = zlib.compress(data, COMPRESS_LEVEL)
+        return compressed if len(compressed) < len(data) else value
+
+    def from_db_value(self, value, expression, connection):
+        return decompress(value)
+
+    def to_python(self, value):
+        return super().to_python(decompress(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if isinstance(value, str) and connection.vendor == 'sqlite':
+            return self.compress(value)
+        return value
+
+
+def register_sqlite_functions(sender, connection, **kwargs):
+    """connection_created: добавляет zlib_text() в соединения SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    connection.connection.create_function(
+        SQL_FUNCTION, 1, decompress, deterministic=True
+    )
@@ -1,28 +1,187 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from pytils.translit import slugify
+from django.db import router, transaction
 
-from .models import Note
+from .models import Note, NoteTag, Tag
 
 WARNING = ' - такой slug уже существует, придумайте уникальное значение!'
+MAX_TAGS = 20
+MAX_BULK_NOTES = 1000
+
+
+class TagsField(forms.CharField):
+    """Метки через запятую; значение - список названий без повторов."""
+
+    def to_python(self, value):
+        names = []
+        for name in super().to_python(value).split(','):
+            name = ' '.join(name.split())
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    def validate(self, value):
+        super().validate(value)
+        if len(value) > MAX_TAGS:
+            raise ValidationError(f'Не больше {MAX_TAGS} меток у заметки.')
+        max_length = Tag._meta.get_field('name').max_length
+        for name in value:
+            if len(name) > max_length:
+                raise ValidationError(
+                    f'{name} - метка длиннее {max_length} символов.'
+                )
 
 
 class NoteForm(forms.ModelForm):
     """Форма для создания или обновления заметки."""
+    tags = TagsField(
+        label='Метки',
+        required=False,
+        help_text='Через запятую, например: работа, идеи',
+    )
 
     class Meta:
         model = Note
         fields = ('title', 'text', 'slug')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.editing = self.instance.pk is not None
+        if self.editing and not self.is_bound and 'tags' in self.fields:
+            self.initial['tags'] = ', '.join(
+                tag.name for tag in self.instance.tags.all()
+            )
+
+    def save(self, commit=True):
+        """Заметка и её метки пишутся одной транзакцией.
+
+        Note.save() увеличивает версию автора; если бы метки писались
+        после фиксации, список, отрисованный между ними, лёг бы в кэш
+        фрагментов и ETag новой версии со старыми метками.
+        """
+        if not commit:
+            return super().save(commit=False)
+        with transaction.atomic(
+            using=router.db_for_write(Note, instance=self.instance)
+        ):
+            return super().save()
+
+    def _save_m2m(self):
+        """Метки пишутся после заметки: связям нужен её id.
+
+        Если поля меток в запросе нет вовсе, метки не трогаются. При
+        save(commit=False) транзакцию вокруг заметки и save_m2m()
+        открывает вызывающий код.
+        """
+        super()._save_m2m()
+        names = self.cleaned_data.get('tags')
+        if names is None or self.add_prefix('tags') not in self.data:
+            return
+        if not names and not self.editing:
+            return
+        using = self.instance._state.db
+        NoteTag.set_for_note(
+            self.instance,
+            Tag.for_names(self.instance.author_id, names, using=using),
+            using=using,
+        )
+
     def clean_slug(self):
-        """Обрабатывает случай, если slug не уникален."""
+        """Обрабатывает случай, если slug не уникален.
+
+        Пустой slug не проверяется: свободный вариант подберёт
+        Note.save() в той же транзакции, что и INSERT.
+        """
         cleaned_data = super().clean()
         slug = cleaned_data.get('slug')
         if not slug:
-            title = cleaned_data.get('title')
-            slug = slugify(title)[:100]
-        if Note.objects.filter(
+            return ''
+        using = router.db_for_write(Note, instance=self.instance)
+        if Note.objects.using(using).filter(
                 slug=slug
         ).exclude(id=self.instance.pk).exists():
             raise ValidationError(slug + WARNING)
         return slug
+
+
+class BatchNoteForm(NoteForm):
+    """Форма для пакетного API.
+
+    Правила те же, что у NoteForm, но занятость slug проверяется по
+    заранее загруженным данным всей пачки, а не запросом на каждую
+    заметку. Метки пачкой назначает отдельный вызов API.
+    """
+    tags = None
+
+    def __init__(self, *args, slug_claims, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slug_claims = slug_claims
+
+    def clean_slug(self):
+        slug = self.cleaned_data.get('slug')
+        if not slug:
+            return ''
+        if self.slug_claims.is_taken(slug, self.instance.pk):
+            raise ValidationError(slug + WARNING)
+        return slug
+
+    def validate_unique(self):
+        """Уникальность уже проверена в clean_slug по всей пачке."""
+
+
+class NoteIdsField(forms.Field):
+    """id заметок из повторяющегося параметра (флажки списка)."""
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        if not value:
+            return []
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        try:
+            return list(dict.fromkeys(int(item) for item in value))
+        except (TypeError, ValueError):
+            raise ValidationError('Некорректный список заметок.')
+
+    def validate(self, value):
+        if not value:
+            raise ValidationError('Отметьте хотя бы одну заметку.')
+        if len(value) > MAX_BULK_NOTES:
+            raise ValidationError(
+                f'Не больше {MAX_BULK_NOTES} заметок за раз.'
+            )
+
+
+class BulkActionForm(forms.Form):
+    """Действие над заметками, отмеченными в списке."""
+    DELETE = 'delete'
+    ADD_TAG = 'add_tag'
+    REMOVE_TAG = 'remove_tag'
+
+    action = forms.ChoiceField(
+        label='Действие',
+        choices=(
+            (ADD_TAG, 'Добавить метку'),
+            (REMOVE_TAG, 'Снять метку'),
+            (DELETE, 'Удалить'),
+        ),
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    notes = NoteIdsField()
+    tag = forms.CharField(
+        label='Метка',
+        required=False,
+        max_length=Tag._meta.get_field('name').max_length,
+        widget=forms.TextInput(
+            attrs={'class': 'form-control', 'placeholder': 'Метка'}
+        ),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        tag = ' '.join(cleaned_data.get('tag', '').split())
+        cleaned_data['tag'] = tag
+        if cleaned_data.get('action') in (self.ADD_TAG, self.REMOVE_TAG):
+            if not tag:
+                self.add_error('tag', 'Укажите метку.')
+        return cleaned_data
@@ -0,0 +1,255 @@
+"""Фоновые задачи заметок в таблице базы, без внешнего брокера.
+
+Задача - строка notes.Job в шарде автора заметки. Воркеры
+(``manage.py run_workers``) забирают готовые задачи одним UPDATE с
+арендой locked_until: если воркер умер, по истечении аренды задачу
+заберёт другой. Поэтому доставка - «хотя бы один раз», и задачи должны
+быть идемпотентными. Упавшая задача откладывается с экспоненциальной
+задержкой, после JOBS_MAX_ATTEMPTS попыток помечается failed_at и
+остаётся в таблице для разбора.
+
+Повторные постановки одной задачи для одной заметки схлопываются по
+dedup_key, пока задача ждёт. Взятая в работу задача ключ освобождает,
+так что изменение во время её выполнения поставит новую задачу.
+
+Note.save() отдаёт в очередь отрисовку Markdown и поисковый индекс
+только внутри deferred() - его включают представления создания и
+правки заметки, если включён settings.JOBS_DEFERRED.
+"""
+import os
+import random
+import socket
+import traceback
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import search, sharding
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 3600
+DEFAULT_LEASE_SECONDS = 300
+CLAIM_BATCH_SIZE = 10
+
+_tasks = {}
+_deferred = ContextVar('notes_jobs_deferred', default=False)
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(name):
+    """Декоратор: регистрирует функцию f(note_id, using) как задачу."""
+    def register(func):
+        _tasks[name] = func
+        return func
+    return register
+
+
+def is_deferred():
+    return _deferred.get()
+
+
+@contextmanager
+def deferred(enabled=True):
+    """Внутри блока Note.save() ставит медленные шаги в очередь."""
+    token = _deferred.set(
+        enabled and setting('JOBS_DEFERRED', False)
+    )
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+
+
+def enqueue(name, note, using=None, delay=0):
+    """Ставит задачу name для заметки note.
+
+    Строка пишется в текущую транзакцию базы using: поставленная из
+    Note.save() задача появится только вместе с самой правкой. Если
+    такая задача заметки уже ждёт, новая не создаётся.
+    """
+    from .models import Job
+
+    if name not in _tasks:
+        raise KeyError(f'Неизвестная задача: {name}')
+    Job.objects.using(
+        using or note._state.db or sharding.shard_for(note.author_id)
+    ).bulk_create(
+        [Job(
+            author_id=note.author_id,
+            task=name,
+            note_id=note.pk,
+            dedup_key=f'{name}:{note.pk}',
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )],
+        ignore_conflicts=True,
+    )
+
+
+def enqueue_on_commit(name, note, using=None, delay=0):
+    """enqueue() после фиксации текущей транзакции базы using.
+
+    Для кода, которому задача нужна, только если его транзакция
+    зафиксирована, но который не может писать задачу в неё саму.
+    Вне транзакции задача ставится сразу.
+    """
+    using = using or note._state.db or sharding.shard_for(note.author_id)
+    transaction.on_commit(
+        lambda: enqueue(name, note, using=using, delay=delay), using=using
+    )
+
+
+def backoff(attempts):
+    """Задержка перед следующей попыткой: растёт вдвое, со случайностью."""
+    delay = min(
+        setting('JOBS_BACKOFF_SECONDS', DEFAULT_BACKOFF_SECONDS)
+        * 2 ** (attempts - 1),
+        MAX_BACKOFF_SECONDS,
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+class Worker:
+    """Забирает и выполняет готовые задачи всех шардов по очереди."""
+
+    def __init__(self, databases=None, batch_size=CLAIM_BATCH_SIZE,
+                 log=None):
+        self.databases = databases or sharding.get_shards()
+        self.batch_size = batch_size
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.log = log or (lambda message: None)
+
+    def claim(self, using):
+        """Берёт до batch_size готовых задач одним UPDATE.
+
+        Каждому захвату - свой токен в locked_by: по нему читаются
+        взятые строки, и по нему же воркер потом закрывает задачу,
+        не трогая её, если аренда истекла и задачу взял другой.
+        """
+        from .models import Job
+
+        jobs = Job.objects.using(using)
+        now = timezone.now()
+        ready = jobs.filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+            failed_at__isnull=True,
+            run_at__lte=now,
+        ).order_by('run_at').values('pk')[:self.batch_size]
+        token = f'{self.name}:{uuid.uuid4().hex[:12]}'
+        lease = setting('JOBS_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+        if not jobs.filter(pk__in=ready).update(
+            locked_by=token,
+            locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1,
+            dedup_key=None,
+        ):
+            return []
+        return list(jobs.filter(locked_by=token).order_by('run_at'))
+
+    def execute(self, job, using):
+        """Выполняет задачу; True, если она завершилась успешно."""
+        from .models import Job
+
+        jobs = Job.objects.using(using).filter(
+            pk=job.pk, locked_by=job.locked_by
+        )
+        try:
+            func = _tasks.get(job.task)
+            if func is None:
+                raise KeyError(f'Неизвестная задача: {job.task}')
+            func(job.note_id, using=using)
+        except Exception:
+            now = timezone.now()
+            values = {
+                'locked_by': '',
+                'locked_until': None,
+                'last_error': traceback.format_exc(),
+            }
+            if job.attempts >= setting(
+                'JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS
+            ):
+                values['failed_at'] = now
+            else:
+                values['run_at'] = now + backoff(job.attempts)
+            jobs.update(**values)
+            self.log(
+                f'{using}: задача {job.pk} {job.task} упала '
+                f'(попытка {job.attempts})'
+            )
+            return False
+        jobs.delete()
+        return True
+
+    def run_once(self):
+        """Один проход по всем шардам: (выполнено, упало)."""
+        done = failed = 0
+        for using in self.databases:
+            for job in self.claim(using):
+                if self.execute(job, using):
+                    done += 1
+                else:
+                    failed += 1
+        return done, failed
+
+    def run(self, stop, poll_interval=1.0, burst=False):
+        """Работает, пока не выставлен stop (threading/multiprocessing
+        Event); в режиме burst - пока в очереди есть готовые задачи."""
+        done = failed = 0
+        while not stop.is_set():
+            step_done, step_failed = self.run_once()
+            done += step_done
+            failed += step_failed
+            if not step_done and not step_failed:
+                if burst:
+                    break
+                stop.wait(poll_interval)
+        return done, failed
+
+
+@task('render_note')
+def render_note(note_id, using):
+    """Отрисовывает Markdown заметки, если HTML устарел.
+
+    HTML пишется, только пока text_hash не изменился с момента чтения:
+    свежая правка уже поставила новую задачу.
+    """
+    from .models import Note
+
+    note = Note.objects.using(using).only(
+        'id', 'author_id', 'text', 'text_hash', 'text_length'
+    ).filter(pk=note_id).first()
+    if note is None:
+        return
+    old_hash = note.text_hash
+    if note.render_text():
+        Note.objects.using(using).filter(
+            pk=note.pk, text_hash=old_hash
+        ).update(
+            text_html=note.text_html,
+            text_hash=note.text_hash,
+            text_length=note.text_length,
+        )
+
+
+@task('index_note')
+def index_note(note_id, using):
+    """Переиндексирует заметку; удалённую заметку INSERT ... SELECT
+    просто не найдёт.
+
+    Без общей транзакции: отложенная транзакция SQLite, начатая чтением
+    подзапроса, не ждёт чужую запись, а сразу падает с «database is
+    locked». Задача идемпотентна, и прерванную между DELETE и INSERT
+    переиндексацию доделает повтор.
+    """
+    from .models import Note
+
+    search.index_queryset(Note.objects.using(using).filter(pk=note_id))
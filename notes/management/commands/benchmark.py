@@ -0,0 +1,127 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from notes import benchmark, dataset
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет сценарии home/list/detail/add/edit/delete на '
+        'сгенерированных данных во временной тестовой базе и сравнивает '
+        'результат с эталоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=3)
+        parser.add_argument('--notes', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Запросов на каждый сценарий.',
+        )
+        parser.add_argument(
+            '--scenario', action='append', choices=benchmark.SCENARIOS,
+            help='Сценарий для прогона, можно несколько раз.',
+        )
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результат как новый эталон.',
+        )
+        parser.add_argument(
+            '--latency-tolerance', type=float,
+            help='Во сколько раз p95 может превысить эталонный.',
+        )
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть положительным.')
+        report = self.run(options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False,
+                                         indent=2))
+        else:
+            self.print_report(report)
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            benchmark.save_baseline(baseline_path, report)
+            self.stdout.write(self.style.SUCCESS(
+                f'Эталон сохранён в {baseline_path}'
+            ))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(
+                f'Эталон {baseline_path} не найден, сравнение пропущено.'
+            ))
+            return
+        problems = benchmark.compare(
+            report,
+            benchmark.load_baseline(baseline_path),
+            options['latency_tolerance'],
+        )
+        if problems:
+            raise CommandError(
+                'Регрессия относительно эталона:\n  '
+                + '\n  '.join(problems)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+
+    def run(self, options):
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            authors = dataset.generate(
+                options['users'], options['notes'], seed=options['seed']
+            )
+            if not authors:
+                raise CommandError('Нужен хотя бы один пользователь.')
+            with override_settings(
+                RATE_LIMITS=benchmark.unlimited(settings.RATE_LIMITS)
+            ):
+                scenarios = benchmark.Runner(
+                    authors[0], requests=options['requests']
+                ).run_all(options['scenario'] or benchmark.SCENARIOS)
+                ratelimit = benchmark.ratelimit_overhead(authors[0])
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+        return {
+            'dataset': {
+                'users': options['users'],
+                'notes': options['notes'],
+                'seed': options['seed'],
+            },
+            'scenarios': scenarios,
+            'ratelimit': ratelimit,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"сценарий":<10}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"p99, мс":>10}{"SQL ср.":>10}{"SQL макс.":>11}'
+        )
+        for name, result in report['scenarios'].items():
+            self.stdout.write(
+                f'{name:<10}{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                f'{result["p99_ms"]:>10}{result["queries_mean"]:>10}'
+                f'{result["queries_max"]:>11}'
+            )
+        ratelimit = report.get('ratelimit')
+        if ratelimit:
+            self.stdout.write(
+                f'ограничитель частоты ({ratelimit["view"]}, вёдер '
+                f'{ratelimit["buckets"]}): p50 {ratelimit["p50_us"]} мкс, '
+                f'p95 {ratelimit["p95_us"]} мкс на проверку'
+            )
@@ -0,0 +1,54 @@
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite при смешанной нагрузке '
+        'из нескольких потоков для профилей из DATABASE_PROFILES.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, action='append')
+        parser.add_argument('--seconds', type=float, default=3.0)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument(
+            '--profile', action='append',
+            choices=sorted(settings.DATABASE_PROFILES),
+            help='Профиль для сравнения, по умолчанию - все.',
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--write-ratio должен быть от 0 до 1.')
+        profiles = options['profile'] or sorted(settings.DATABASE_PROFILES)
+        self.stdout.write(
+            f'{"профиль":<12}{"потоков":>8}{"чтений/с":>12}'
+            f'{"записей/с":>12}{"всего/с":>12}{"ошибок":>8}'
+        )
+        for threads in options['threads'] or (1, 4, 8):
+            for name in profiles:
+                profile = settings.DATABASE_PROFILES[name]
+                with tempfile.TemporaryDirectory() as directory:
+                    path = str(Path(directory) / 'bench.sqlite3')
+                    benchmark.prepare_sqlite(path, rows=options['rows'])
+                    result = benchmark.sqlite_throughput(
+                        path,
+                        profile['PRAGMAS'],
+                        persistent=bool(profile['CONN_MAX_AGE']),
+                        threads=threads,
+                        seconds=options['seconds'],
+                        write_ratio=options['write_ratio'],
+                        rows=options['rows'],
+                    )
+                self.stdout.write(
+                    f'{name:<12}{threads:>8}{result["reads_per_s"]:>12}'
+                    f'{result["writes_per_s"]:>12}'
+                    f'{result["ops_per_s"]:>12}{result["errors"]:>8}'
+                )
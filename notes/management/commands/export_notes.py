@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import exchange
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает заметки автора в JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--author', required=True, help='Имя пользователя-автора.'
+        )
+        parser.add_argument(
+            '--output', help='Файл для выгрузки, по умолчанию - stdout.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=exchange.FORMATS,
+            help='Формат выгрузки, по умолчанию - по расширению файла.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=exchange.DEFAULT_CHUNK_SIZE,
+            help='Сколько строк читать из базы за раз.',
+        )
+        parser.add_argument(
+            '--database',
+            help='База с заметками; по умолчанию - шард автора.',
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["author"]} не найден.'
+            )
+        output = options['output']
+        fmt = options['format'] or exchange.guess_format(output)
+        lines = exchange.export_notes(
+            author,
+            fmt,
+            chunk_size=options['chunk_size'],
+            using=options['database'],
+        )
+        if not output:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(output, 'w', encoding='utf-8', newline='') as stream:
+            stream.writelines(lines)
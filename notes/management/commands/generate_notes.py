@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import dataset, exchange
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт воспроизводимый набор данных: N пользователей '
+        'по M заметок у каждого.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--notes', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size', type=int, default=exchange.DEFAULT_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--database',
+            help='База для пользователей и заметок; по умолчанию '
+                 'пользователи - в default, заметки - в шардах авторов.',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['notes']) < 0:
+            raise CommandError('Число пользователей и заметок - не меньше 0.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        authors = dataset.generate(
+            options['users'],
+            options['notes'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            using=options['database'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(authors)}, заметок у каждого: '
+            f'{options["notes"]} (seed={options["seed"]})'
+        ))
@@ -0,0 +1,68 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes import exchange
+
+
+class Command(BaseCommand):
+    help = 'Потоково импортирует заметки автора из JSONL или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл с заметками, «-» - стандартный ввод.'
+        )
+        parser.add_argument(
+            '--author', required=True, help='Имя пользователя-автора.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=exchange.FORMATS,
+            help='Формат файла, по умолчанию - по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=exchange.DEFAULT_BATCH_SIZE,
+            help='Сколько заметок создавать одним INSERT.',
+        )
+        parser.add_argument(
+            '--database',
+            help='База для заметок; по умолчанию - шард автора.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        User = get_user_model()
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["author"]} не найден.'
+            )
+        path = options['path']
+        fmt = options['format'] or exchange.guess_format(path)
+
+        def on_error(number, error):
+            self.stderr.write(f'Строка {number} пропущена: {error}')
+
+        if path == '-':
+            stream = sys.stdin
+        else:
+            stream = open(path, encoding='utf-8', newline='')
+        try:
+            created = exchange.import_notes(
+                exchange.read_rows(stream, fmt),
+                author,
+                batch_size=options['batch_size'],
+                using=options['database'],
+                on_error=on_error,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано заметок: {created}'
+        ))
@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.utils import timezone
+
+from notes import sharding
+from notes.models import Note, NoteRevision
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет старые ревизии заметок по правилам хранения. Удаляются '
+        'только самые старые версии, поэтому оставшиеся по-прежнему '
+        'собираются из дельт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep', type=int,
+            help='Сколько последних ревизий оставлять у каждой заметки.',
+        )
+        parser.add_argument(
+            '--days', type=int,
+            help='Удалять ревизии, заменённые больше стольких дней назад.',
+        )
+        parser.add_argument(
+            '--database',
+            help='Алиас базы; по умолчанию - все шарды заметок.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, сколько ревизий будет удалено.',
+        )
+
+    def handle(self, *args, **options):
+        keep, days = options['keep'], options['days']
+        if keep is not None and keep < 0 or days is not None and days < 0:
+            raise CommandError('--keep и --days не могут быть меньше нуля.')
+        databases = (
+            [options['database']] if options['database']
+            else sharding.get_shards()
+        )
+        for using in databases:
+            with transaction.atomic(using=using):
+                orphans, expired = self.prune(
+                    using, keep, days, options['dry_run']
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'{using}: ревизий удалённых заметок: {orphans}, '
+                f'устаревших ревизий: {expired}'
+            ))
+
+    def prune(self, using, keep, days, dry_run):
+        """Число ревизий без заметок и ревизий, вышедших за правила.
+
+        Если заданы и --keep, и --days, удаляются ревизии, которые
+        нарушают оба правила: старше срока и не среди последних keep.
+        """
+        revisions = NoteRevision.objects.using(using)
+        notes = Note.objects.filter(pk=OuterRef('note_id'))
+        orphans = revisions.filter(~Exists(notes))
+        expired = None
+        if keep is not None or days is not None:
+            expired = revisions.filter(Exists(notes))
+            if keep is not None:
+                expired = expired.alias(
+                    current=Subquery(notes.values('version')[:1])
+                ).filter(number__lt=F('current') - keep)
+            if days is not None:
+                expired = expired.filter(
+                    created_at__lt=timezone.now() - timedelta(days=days)
+                )
+        if expired is None:
+            expired = revisions.none()
+        if dry_run:
+            return orphans.count(), expired.count()
+        return orphans.delete()[0], expired.delete()[0]
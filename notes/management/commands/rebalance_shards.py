@@ -0,0 +1,207 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from notes import exchange, search, sharding, slugs
+from notes.models import (
+    AuthorStats, AuthorVersion, Job, Note, NoteChange, NoteRevision, NoteTag,
+    Tag,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит авторов в шарды, положенные им по хэшу author_id, '
+        'например после изменения NOTE_SHARDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, кого и куда нужно перенести.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=exchange.DEFAULT_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        shards = sharding.get_shards()
+        moves = []
+        for source in dict.fromkeys([DEFAULT_DB_ALIAS, *shards]):
+            author_ids = set(
+                Note.objects.using(source).values_list(
+                    'author_id', flat=True
+                ).distinct()
+            ) | set(
+                AuthorVersion.objects.using(source).values_list(
+                    'author_id', flat=True
+                )
+            )
+            for author_id in sorted(author_ids):
+                target = sharding.shard_for(author_id, shards)
+                if target != source:
+                    moves.append((author_id, source, target))
+
+        for author_id, source, target in moves:
+            self.stdout.write(f'Автор {author_id}: {source} -> {target}')
+            if not options['dry_run']:
+                renamed = self.move(
+                    author_id, source, target, options['batch_size']
+                )
+                if renamed:
+                    self.stdout.write(self.style.WARNING(
+                        f'\tslug изменён у заметок: {renamed}'
+                    ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Авторов к переносу: {len(moves)}'
+            + (' (пробный запуск)' if options['dry_run'] else '')
+        ))
+
+    def move(self, author_id, source, target, batch_size):
+        """Копирует данные автора в target и удаляет их из source.
+
+        Копирование начинается с очистки target от прошлой неудачной
+        попытки, поэтому прерванный перенос можно просто повторить.
+        Журнал изменений продолжает ту же последовательность seq:
+        старые id заметок получают надгробия, новые - записи create.
+        История правок и метки переезжают вместе с заметками под новыми
+        id; счётчики меток копируются как есть.
+        """
+        source_notes = Note.objects.using(source).filter(author_id=author_id)
+        target_notes = Note.objects.using(target).filter(author_id=author_id)
+        version = AuthorVersion.objects.using(source).filter(
+            author_id=author_id
+        ).values_list('version', flat=True).first() or 0
+        last_edit_at = AuthorStats.objects.using(source).filter(
+            author_id=author_id
+        ).values_list('last_edit_at', flat=True).first()
+        renamed = 0
+        with transaction.atomic(using=target):
+            search.unindex_pks(
+                target_notes.values_list('id', flat=True), using=target
+            )
+            Tag.objects.using(target).filter(author_id=author_id).delete()
+            target_notes.delete()
+            NoteChange.objects.using(target).filter(
+                author_id=author_id
+            ).delete()
+            NoteRevision.objects.using(target).filter(
+                author_id=author_id
+            ).delete()
+            AuthorStats.objects.using(target).filter(
+                author_id=author_id
+            ).delete()
+            AuthorVersion.objects.using(target).update_or_create(
+                author_id=author_id, defaults={'version': version}
+            )
+            tag_ids = self.copy_tags(author_id, source, target)
+            rows = source_notes.order_by('id').values_list(
+                'id', 'title', 'text', 'slug', 'version', 'text_html',
+                'text_hash', 'text_length',
+            ).iterator(chunk_size=batch_size)
+            for batch in exchange.batched(rows, batch_size):
+                new_slugs = slugs.allocate_slugs(
+                    [row[3] for row in batch],
+                    Note.objects.using(target),
+                )
+                renamed += sum(
+                    1 for row, slug in zip(batch, new_slugs) if row[3] != slug
+                )
+                Note.objects.using(target).bulk_create(
+                    Note(author_id=author_id, title=title, text=text,
+                         slug=slug, version=version, text_html=text_html,
+                         text_hash=text_hash, text_length=text_length)
+                    for (_, title, text, _, version, text_html, text_hash,
+                         text_length), slug in zip(batch, new_slugs)
+                )
+                NoteChange.record(
+                    author_id,
+                    [(row[0], row[3], NoteChange.DELETE) for row in batch],
+                    using=target,
+                )
+                new_ids = dict(
+                    Note.objects.using(target).filter(
+                        slug__in=new_slugs
+                    ).values_list('slug', 'id')
+                )
+                mapping = {
+                    row[0]: new_ids[slug]
+                    for row, slug in zip(batch, new_slugs)
+                }
+                self.move_revisions(mapping, source, target, batch_size)
+                self.move_tag_links(mapping, tag_ids, source, target)
+                Note.after_bulk_write(
+                    author_id,
+                    created=target_notes.filter(slug__in=new_slugs),
+                    using=target,
+                )
+            # Сводку пересчитали created-записи; время правки - исходное.
+            AuthorStats.objects.using(target).filter(
+                author_id=author_id
+            ).update(last_edit_at=last_edit_at)
+        with transaction.atomic(using=source):
+            search.unindex_pks(
+                source_notes.values_list('id', flat=True), using=source
+            )
+            Tag.objects.using(source).filter(author_id=author_id).delete()
+            source_notes.delete()
+            NoteChange.objects.using(source).filter(
+                author_id=author_id
+            ).delete()
+            NoteRevision.objects.using(source).filter(
+                author_id=author_id
+            ).delete()
+            AuthorVersion.objects.using(source).filter(
+                author_id=author_id
+            ).delete()
+            AuthorStats.objects.using(source).filter(
+                author_id=author_id
+            ).delete()
+            # Задачи ссылаются на старые id; в target заметки уже
+            # отрисованы и проиндексированы при копировании.
+            Job.objects.using(source).filter(author_id=author_id).delete()
+        return renamed
+
+    def copy_tags(self, author_id, source, target):
+        """Копирует метки автора; возвращает {старый id: новый id}."""
+        tags = list(
+            Tag.objects.using(source).filter(author_id=author_id).values_list(
+                'id', 'name', 'slug', 'note_count'
+            )
+        )
+        Tag.objects.using(target).bulk_create(
+            Tag(author_id=author_id, name=name, slug=slug,
+                note_count=note_count)
+            for _, name, slug, note_count in tags
+        )
+        new_ids = dict(
+            Tag.objects.using(target).filter(
+                author_id=author_id
+            ).values_list('slug', 'id')
+        )
+        return {pk: new_ids[slug] for pk, _, slug, _ in tags}
+
+    def move_tag_links(self, mapping, tag_ids, source, target):
+        """Копирует связи пачки заметок с метками под новыми id."""
+        NoteTag.objects.using(target).bulk_create(
+            NoteTag(note_id=mapping[note_id], tag_id=tag_ids[tag_id])
+            for note_id, tag_id in NoteTag.objects.using(source).filter(
+                note_id__in=mapping
+            ).values_list('note_id', 'tag_id')
+        )
+
+    def move_revisions(self, mapping, source, target, batch_size):
+        """Копирует ревизии пачки заметок, подменяя note_id на новые."""
+        fields = [
+            field.attname for field in NoteRevision._meta.concrete_fields
+            if not field.primary_key
+        ]
+        revisions = NoteRevision.objects.using(source).filter(
+            note_id__in=mapping
+        ).values(*fields).iterator(chunk_size=batch_size)
+        for chunk in exchange.batched(revisions, batch_size):
+            NoteRevision.objects.using(target).bulk_create(
+                NoteRevision(
+                    **{**values, 'note_id': mapping[values['note_id']]}
+                )
+                for values in chunk
+            )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notes import search, sharding
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает полнотекстовый индекс заметок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            help=(
+                'Алиас базы, в которой перестраивается индекс; '
+                'по умолчанию - все шарды заметок.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        databases = (
+            [options['database']] if options['database']
+            else sharding.get_shards()
+        )
+        for using in databases:
+            if not search.is_supported(using):
+                self.stdout.write(self.style.WARNING(
+                    f'{using}: полнотекстовый поиск поддерживается '
+                    'только на SQLite.'
+                ))
+                continue
+            with transaction.atomic(using=using):
+                count = search.rebuild_index(using=using)
+            self.stdout.write(self.style.SUCCESS(
+                f'{using}: проиндексировано заметок: {count}'
+            ))
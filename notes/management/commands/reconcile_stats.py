@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from notes import sharding
+from notes.models import AuthorStats, Note
+
+STAT_FIELDS = ('note_count', 'char_count', 'last_edit_at')
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сводку AuthorStats по заметкам одним агрегатом на '
+        'шард и сообщает о расхождениях с хранимыми счётчиками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            help='Алиас базы; по умолчанию - все шарды заметок.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не исправляя.',
+        )
+
+    def handle(self, *args, **options):
+        databases = (
+            [options['database']] if options['database']
+            else sharding.get_shards()
+        )
+        for using in databases:
+            with transaction.atomic(using=using):
+                drift = self.reconcile(using, options['dry_run'])
+            for author_id, stored, actual in drift:
+                self.stdout.write(self.style.WARNING(
+                    f'{using}: автор {author_id}: {stored} -> {actual}'
+                ))
+            self.stdout.write(self.style.SUCCESS(
+                f'{using}: авторов с расхождениями: {len(drift)}'
+                + (' (пробный запуск)' if options['dry_run'] else '')
+            ))
+
+    def reconcile(self, using, dry_run):
+        """Список (автор, хранимые, настоящие) и исправление сводки.
+
+        Выполняется в одной транзакции: запись сводки, начатая после
+        чтения агрегатов, не затирается пересчитанными значениями.
+        Время последней правки ставится при записи, а не берётся из
+        updated_at, поэтому сверяются счётчики, а пустое время
+        заполняется по MAX(updated_at).
+        """
+        actual = {
+            author_id: (note_count, char_count or 0, last_edit_at)
+            for author_id, note_count, char_count, last_edit_at in (
+                Note.objects.using(using).order_by().values(
+                    'author_id'
+                ).annotate(
+                    note_count=Count('id'),
+                    char_count=Sum('text_length'),
+                    last_edit_at=Max('updated_at'),
+                ).values_list(
+                    'author_id', 'note_count', 'char_count', 'last_edit_at'
+                )
+            )
+        }
+        stored = {
+            stats.author_id: stats
+            for stats in AuthorStats.objects.using(using).all()
+        }
+        drift = []
+        changed = []
+        missing = []
+        for author_id in sorted(actual.keys() | stored.keys()):
+            stats = stored.get(author_id)
+            values = actual.get(author_id, (0, 0, None))
+            if stats is not None and stats.last_edit_at is not None:
+                values = (*values[:2], stats.last_edit_at)
+            current = (
+                tuple(getattr(stats, name) for name in STAT_FIELDS)
+                if stats is not None else None
+            )
+            if current == values:
+                continue
+            drift.append((author_id, current, values))
+            if stats is None:
+                missing.append(AuthorStats(
+                    author_id=author_id, **dict(zip(STAT_FIELDS, values))
+                ))
+            else:
+                for name, value in zip(STAT_FIELDS, values):
+                    setattr(stats, name, value)
+                changed.append(stats)
+        if not dry_run:
+            AuthorStats.objects.using(using).bulk_create(missing)
+            AuthorStats.objects.using(using).bulk_update(changed, STAT_FIELDS)
+        return drift
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notes import exchange, sharding
+from notes.models import Note
+
+
+class Command(BaseCommand):
+    help = (
+        'Перерисовывает HTML заметок, сделанный другой версией рендерера '
+        'или для другого текста. Запускать после смены '
+        'notes.rendering.RENDERER_VERSION.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            help='Алиас базы; по умолчанию - все шарды заметок.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=exchange.DEFAULT_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перерисовать все заметки, даже с актуальным HTML.',
+        )
+
+    def handle(self, *args, **options):
+        databases = (
+            [options['database']] if options['database']
+            else sharding.get_shards()
+        )
+        for using in databases:
+            checked, rendered = self.rerender(
+                using, options['batch_size'], options['force']
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'{using}: проверено заметок: {checked}, '
+                f'перерисовано: {rendered}'
+            ))
+
+    def rerender(self, using, batch_size, force):
+        """Идёт по заметкам пачками по id; пишет только изменившийся HTML.
+
+        Каждая пачка - своя транзакция, поэтому прерванный прогон можно
+        просто повторить: уже перерисованные заметки будут пропущены.
+        Как и задача render_note, HTML пишется, только пока text_hash не
+        изменился с момента чтения: иначе правка, сохранённая во время
+        прогона, получила бы HTML старого текста под новым хэшем.
+        """
+        notes = Note.objects.using(using).only(
+            'id', 'text', 'text_hash', 'text_length'
+        ).order_by('id')
+        checked = rendered = 0
+        last = 0
+        while True:
+            batch = list(notes.filter(id__gt=last)[:batch_size])
+            if not batch:
+                break
+            last = batch[-1].id
+            checked += len(batch)
+            changed = []
+            for note in batch:
+                old_hash = note.text_hash
+                if force:
+                    note.text_hash = ''
+                if note.render_text():
+                    changed.append((note, old_hash))
+            if changed:
+                with transaction.atomic(using=using):
+                    for note, old_hash in changed:
+                        rendered += Note.objects.using(using).filter(
+                            pk=note.pk, text_hash=old_hash
+                        ).update(
+                            text_html=note.text_html,
+                            text_hash=note.text_hash,
+                            text_length=note.text_length,
+                        )
+        return checked, rendered
@@ -0,0 +1,145 @@
+import multiprocessing
+import signal
+import sys
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# Как часто главный процесс проверяет, живы ли воркеры.
+SUPERVISE_INTERVAL = 1.0
+
+
+def worker_main(stop, databases, batch_size, poll_interval, burst):
+    """Точка входа процесса-воркера.
+
+    Модули с моделями импортируются здесь, уже после django.setup():
+    при запуске через spawn процесс начинает с чистого интерпретатора.
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    from notes.jobs import Worker
+
+    # Ctrl+C получает вся группа процессов; останавливает воркеры
+    # главный процесс через stop, чтобы задачи доделывались.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = Worker(
+        databases, batch_size,
+        log=lambda message: print(message, file=sys.stderr, flush=True),
+    )
+    worker.run(stop, poll_interval=poll_interval, burst=burst)
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает пул процессов, выполняющих фоновые задачи заметок '
+        'из таблицы notes_job всех шардов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int,
+            default=getattr(settings, 'JOBS_WORKER_PROCESSES', 1),
+            help='Число процессов; 1 - работать в текущем процессе.',
+        )
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Алиас базы (можно несколько); по умолчанию - все шарды.',
+        )
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах, когда готовых задач нет.',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда готовых задач не останется.',
+        )
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes должен быть не меньше 1.')
+        if options['processes'] == 1:
+            self.run_inline(options)
+        else:
+            self.run_pool(options)
+
+    def run_inline(self, options):
+        from notes.jobs import Worker
+
+        stop = threading.Event()
+        worker = Worker(
+            options['databases'], options['batch_size'],
+            log=lambda message: self.stderr.write(message),
+        )
+        with self.stop_on_signals(stop):
+            done, failed = worker.run(
+                stop, poll_interval=options['poll_interval'],
+                burst=options['burst'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {done}, упало: {failed}'
+        ))
+
+    def run_pool(self, options):
+        """Держит processes воркеров; упавший процесс перезапускается.
+
+        Соединения с базами закрываются до запуска процессов: дочерний
+        процесс не должен делить сокет или файл SQLite с родителем.
+        """
+        context = multiprocessing.get_context()
+        stop = context.Event()
+        args = (
+            stop, options['databases'], options['batch_size'],
+            options['poll_interval'], options['burst'],
+        )
+        connections.close_all()
+        with self.stop_on_signals(stop):
+            processes = []
+            for _ in range(options['processes']):
+                process = context.Process(target=worker_main, args=args)
+                process.start()
+                processes.append(process)
+            self.stdout.write(f'Запущено воркеров: {len(processes)}')
+            while processes and not stop.is_set():
+                for index, process in enumerate(processes):
+                    if process.is_alive():
+                        continue
+                    process.join()
+                    if options['burst'] and process.exitcode == 0:
+                        processes[index] = None
+                        continue
+                    self.stderr.write(
+                        f'Воркер {process.pid} завершился с кодом '
+                        f'{process.exitcode}, перезапуск'
+                    )
+                    processes[index] = context.Process(
+                        target=worker_main, args=args
+                    )
+                    processes[index].start()
+                processes = [process for process in processes if process]
+                stop.wait(SUPERVISE_INTERVAL)
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены'))
+
+    @contextmanager
+    def stop_on_signals(self, stop):
+        """SIGINT и SIGTERM дают воркерам доделать текущие задачи."""
+        def request_stop(signum, frame):
+            stop.set()
+
+        previous = {
+            signum: signal.signal(signum, request_stop)
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            yield
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
@@ -0,0 +1,184 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+PHASE_MARKER = 'startup_profile: phase '
+
+# Выполняется в чистом интерпретаторе с -X importtime: строки импорта
+# идут в stderr вперемешку с метками фаз, итог фаз - JSON в stdout.
+CHILD_SCRIPT = '''
+import json, sys
+from time import perf_counter
+
+timings = {}
+
+def phase(name):
+    sys.stderr.write('%(marker)s' + name + '\\n')
+    sys.stderr.flush()
+    return perf_counter()
+
+started = phase('setup')
+import django
+django.setup()
+timings['setup'] = perf_counter() - started
+
+started = phase('application')
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+timings['application'] = perf_counter() - started
+
+if %(warmup)r:
+    started = phase('warmup')
+    from yanote import warmup
+    warmup.warm_up()
+    timings['warmup'] = perf_counter() - started
+
+from wsgiref.util import setup_testing_defaults
+
+def request(url):
+    environ = {'PATH_INFO': url, 'REQUEST_METHOD': 'GET'}
+    setup_testing_defaults(environ)
+    statuses = []
+    body = application(environ, lambda status, headers: statuses.append(
+        status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        getattr(body, 'close', lambda: None)()
+    return int(statuses[0].split()[0])
+
+status = {}
+for name in ('first_request', 'second_request'):
+    started = phase(name)
+    status[name] = request(%(url)r)
+    timings[name] = perf_counter() - started
+print(json.dumps({'timings': timings, 'status': status}))
+'''
+
+
+def parse_importtime(stderr):
+    """{фаза: [(модуль, self мкс, cumulative мкс)]} из вывода importtime."""
+    phases = defaultdict(list)
+    phase = 'interpreter'
+    for line in stderr.splitlines():
+        if line.startswith(PHASE_MARKER):
+            phase = line[len(PHASE_MARKER):].strip()
+            continue
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        phases[phase].append((
+            parts[2].strip(), int(parts[0]), int(parts[1]),
+        ))
+    return phases
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает приложение в чистом процессе с python -X importtime и '
+        'показывает, сколько стоят импорт, загрузка WSGI-приложения и '
+        'первый запрос, с разбивкой импортов по модулям.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес первого запроса; по умолчанию - главная страница.',
+        )
+        parser.add_argument(
+            '--warmup', action='store_true',
+            help='Выполнить yanote.warmup перед первым запросом.',
+        )
+        parser.add_argument(
+            '--group', choices=('package', 'module'), default='package',
+            help='Сводить время импорта по пакетам верхнего уровня '
+                 'или показывать каждый модуль.',
+        )
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--json', action='store_true')
+
+    def handle(self, *args, **options):
+        script = CHILD_SCRIPT % {
+            'marker': PHASE_MARKER,
+            'warmup': options['warmup'],
+            'url': options['url'] or reverse('notes:home'),
+        }
+        environment = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'yanote.settings'
+            ),
+            # Прогрев из wsgi.py здесь не нужен: его включает --warmup.
+            'YANOTE_WARMUP': '0',
+        }
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=settings.BASE_DIR, env=environment,
+            capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(
+                'Процесс приложения упал:\n' + result.stderr[-2000:]
+            )
+        report = self.build_report(
+            json.loads(result.stdout.strip().splitlines()[-1]),
+            parse_importtime(result.stderr),
+            options['group'], options['top'],
+        )
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False,
+                                         indent=2))
+        else:
+            self.print_report(report)
+
+    def build_report(self, child, imports, group, top):
+        """Фазы по порядку: время, число импортов и самые дорогие из них.
+
+        Время модуля - собственное (self) время importtime: сумма по
+        пакету не считает вложенные импорты дважды.
+        """
+        phases = []
+        for name, seconds in child['timings'].items():
+            costs = defaultdict(int)
+            for module, self_us, _ in imports.get(name, ()):
+                if group == 'package':
+                    module = module.split('.')[0]
+                costs[module] += self_us
+            phases.append({
+                'phase': name,
+                'seconds': round(seconds, 4),
+                'status': child['status'].get(name),
+                'imports': len(imports.get(name, ())),
+                'import_seconds': round(sum(costs.values()) / 1e6, 4),
+                'top': [
+                    {'module': module, 'seconds': round(us / 1e6, 4)}
+                    for module, us in sorted(
+                        costs.items(), key=lambda item: -item[1]
+                    )[:top]
+                ],
+            })
+        return {'group': group, 'phases': phases}
+
+    def print_report(self, report):
+        for phase in report['phases']:
+            status = (
+                f', ответ {phase["status"]}' if phase['status'] else ''
+            )
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{phase["phase"]}: {phase["seconds"] * 1000:.1f} мс, '
+                f'импортов {phase["imports"]} '
+                f'({phase["import_seconds"] * 1000:.1f} мс){status}'
+            ))
+            for item in phase['top']:
+                self.stdout.write(
+                    f'  {item["seconds"] * 1000:9.1f} мс  {item["module"]}'
+                )
@@ -0,0 +1,62 @@
+import base64
+import hashlib
+from pathlib import Path
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from yanote.staticfiles import VENDOR_ASSETS
+
+DOWNLOAD_TIMEOUT = 30
+
+
+def integrity_of(content, algorithm):
+    """Хэш SRI вида 'sha384-<base64>' для содержимого файла."""
+    digest = hashlib.new(algorithm, content).digest()
+    return f'{algorithm}-{base64.b64encode(digest).decode()}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Скачивает сторонние статические файлы из '
+        'yanote.staticfiles.VENDOR_ASSETS в static/ и сверяет их хэш SRI. '
+        'Файлы коммитятся в репозиторий; после команды нужен collectstatic.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить уже лежащие файлы, ничего не скачивая.',
+        )
+
+    def handle(self, *args, **options):
+        root = Path(settings.STATICFILES_DIRS[0])
+        problems = 0
+        for name, asset in VENDOR_ASSETS.items():
+            path = root / name
+            expected = asset['integrity']
+            algorithm = expected.split('-', 1)[0]
+            if options['check']:
+                if not path.is_file():
+                    self.stderr.write(f'{name}: нет файла')
+                    problems += 1
+                elif integrity_of(path.read_bytes(), algorithm) != expected:
+                    self.stderr.write(f'{name}: хэш не совпадает')
+                    problems += 1
+                else:
+                    self.stdout.write(f'{name}: в порядке')
+                continue
+            with urlopen(asset['url'], timeout=DOWNLOAD_TIMEOUT) as response:
+                content = response.read()
+            if integrity_of(content, algorithm) != expected:
+                raise CommandError(
+                    f'{name}: хэш скачанного файла не совпадает с {expected}'
+                )
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: скачано {len(content)} байт'
+            ))
+        if problems:
+            raise CommandError(f'Файлов с проблемами: {problems}')
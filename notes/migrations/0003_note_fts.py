@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from notes import search
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(search.CREATE_SQL)
+    schema_editor.execute(
+        f'INSERT INTO {search.FTS_TABLE} (rowid, title, text, author_id) '
+        'SELECT id, title, text, author_id FROM notes_note'
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(search.DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0002_note_author_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
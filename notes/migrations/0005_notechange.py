@@ -0,0 +1,36 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0004_note_updated_at_authorversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField(verbose_name='Номер изменения')),
+                ('note_id', models.BigIntegerField(verbose_name='ID заметки')),
+                ('slug', models.SlugField(db_index=False, max_length=100, verbose_name='Slug заметки')),
+                ('action', models.CharField(choices=[('create', 'Создание'), ('update', 'Изменение'), ('delete', 'Удаление')], max_length=6, verbose_name='Действие')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Когда')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='note_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('author', 'seq'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notechange',
+            constraint=models.UniqueConstraint(fields=('author', 'seq'), name='note_change_author_seq_uniq'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:22
+
+from django.db import migrations
+import notes.fields
+
+BATCH_SIZE = 500
+
+
+def convert_texts(apps, schema_editor, compress):
+    """Пересохраняет тексты пачками по id, не поднимая в память всю таблицу.
+
+    Вперёд сжимаются строки от порога поля и длиннее, назад
+    распаковываются все BLOB.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    Note = apps.get_model('notes', 'Note')
+    field = Note._meta.get_field('text')
+    table = connection.ops.quote_name(Note._meta.db_table)
+    if compress:
+        condition = (
+            "typeof(text) = 'text' AND length(CAST(text AS BLOB)) >= %s"
+        )
+        condition_params = [field.min_length]
+    else:
+        condition = "typeof(text) = 'blob'"
+        condition_params = []
+    last = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                f'SELECT id, text FROM {table} WHERE id > %s AND {condition} '
+                'ORDER BY id LIMIT %s',
+                [last, *condition_params, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                f'UPDATE {table} SET text = %s WHERE id = %s',
+                [
+                    (
+                        field.compress(text) if compress
+                        else notes.fields.decompress(text),
+                        pk,
+                    )
+                    for pk, text in rows
+                ],
+            )
+            last = rows[-1][0]
+
+
+def compress_texts(apps, schema_editor):
+    convert_texts(apps, schema_editor, compress=True)
+
+
+def decompress_texts(apps, schema_editor):
+    convert_texts(apps, schema_editor, compress=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0006_author_no_db_constraint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='note',
+            name='text',
+            field=notes.fields.CompressedTextField(help_text='Добавьте подробностей', verbose_name='Текст'),
+        ),
+        migrations.RunPython(compress_texts, decompress_texts),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import notes.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0007_note_text_compressed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='version',
+            field=models.PositiveIntegerField(default=1, verbose_name='Версия'),
+        ),
+        migrations.CreateModel(
+            name='NoteRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('note_id', models.BigIntegerField(verbose_name='ID заметки')),
+                ('number', models.PositiveIntegerField(verbose_name='Номер версии')),
+                ('title', models.CharField(max_length=100, verbose_name='Заголовок')),
+                ('snapshot', models.BooleanField(default=False, verbose_name='Полная копия')),
+                ('data', notes.fields.CompressedTextField(verbose_name='Текст или дельта')),
+                ('saved_at', models.DateTimeField(verbose_name='Версия сохранена')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Заменена')),
+                ('author', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='note_revisions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('note_id', '-number'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='noterevision',
+            constraint=models.UniqueConstraint(fields=('note_id', 'number'), name='note_revision_note_number_uniq'),
+        ),
+    ]
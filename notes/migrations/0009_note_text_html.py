@@ -0,0 +1,24 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:29
+
+from django.db import migrations, models
+import notes.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_noterevision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='text_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=72, verbose_name='Хэш текста'),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='text_html',
+            field=notes.fields.CompressedTextField(blank=True, default='', editable=False, verbose_name='HTML текста'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0009_note_text_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='Название')),
+                ('slug', models.SlugField(db_index=False, max_length=60, verbose_name='Slug')),
+                ('note_count', models.PositiveIntegerField(default=0, verbose_name='Заметок')),
+                ('author', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='note_tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('author', 'slug'),
+            },
+        ),
+        migrations.CreateModel(
+            name='NoteTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('note', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='tag_links', to='notes.note')),
+                ('tag', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='note_links', to='notes.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='notes', through='notes.NoteTag', to='notes.Tag', verbose_name='Метки'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('author', 'slug'), name='tag_author_slug_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='notetag',
+            constraint=models.UniqueConstraint(fields=('tag', 'note'), name='note_tag_tag_note_uniq'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    """Длина текстов и сводка по авторам одним проходом SQL.
+
+    Сжатые тексты читаются функцией zlib_text(), как в поисковом индексе.
+    """
+    connection = schema_editor.connection
+    Note = apps.get_model('notes', 'Note')
+    AuthorStats = apps.get_model('notes', 'AuthorStats')
+    notes = connection.ops.quote_name(Note._meta.db_table)
+    stats = connection.ops.quote_name(AuthorStats._meta.db_table)
+    text = 'zlib_text(text)' if connection.vendor == 'sqlite' else 'text'
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {notes} SET text_length = length({text})')
+        cursor.execute(
+            f'INSERT INTO {stats} '
+            '(author_id, note_count, char_count, last_edit_at) '
+            'SELECT author_id, COUNT(*), SUM(text_length), MAX(updated_at) '
+            f'FROM {notes} GROUP BY author_id'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0010_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notes_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('note_count', models.BigIntegerField(default=0, verbose_name='Заметок')),
+                ('char_count', models.BigIntegerField(default=0, verbose_name='Символов')),
+                ('last_edit_at', models.DateTimeField(null=True, verbose_name='Последняя правка')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='text_length',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Длина текста'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
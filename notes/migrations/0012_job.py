@@ -0,0 +1,42 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0011_author_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=50, verbose_name='Задача')),
+                ('note_id', models.BigIntegerField(null=True, verbose_name='ID заметки')),
+                ('dedup_key', models.CharField(max_length=100, null=True, unique=True, verbose_name='Ключ повтора')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Запустить после')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Кем взята')),
+                ('locked_until', models.DateTimeField(null=True, verbose_name='Аренда до')),
+                ('failed_at', models.DateTimeField(null=True, verbose_name='Упала')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Поставлена')),
+                ('author', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='note_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['run_at'], name='job_run_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['locked_by'], name='job_locked_by_idx'),
+        ),
+    ]
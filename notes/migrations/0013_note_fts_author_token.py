@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from notes import search
+
+
+def reindex_author(apps, schema_editor):
+    """Пересоздаёт индекс с проиндексированной колонкой author_id."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(search.DROP_SQL)
+    schema_editor.execute(search.CREATE_SQL)
+    search.rebuild_index(using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0012_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_author, migrations.RunPython.noop),
+    ]
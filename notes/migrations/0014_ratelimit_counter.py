@@ -0,0 +1,21 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0013_note_fts_author_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitCounter',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('value', models.BigIntegerField(verbose_name='Значение')),
+                ('expires', models.FloatField(db_index=True, verbose_name='Истекает (unix time)')),
+            ],
+        ),
+    ]
@@ -1,6 +1,33 @@
+from collections import Counter, defaultdict
+
 from django.conf import settings
-from django.db import models
-from pytils.translit import slugify
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Count, F, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import jobs, rendering, revisions, search, sharding, slugs
+from .fields import CompressedTextField
+
+# Сколько раз пересчитывать slug, если параллельное сохранение успело
+# занять выбранный вариант раньше нас.
+SLUG_ATTEMPTS = 5
+# Каждая такая по счёту ревизия хранит текст целиком, поэтому для сборки
+# любой версии применяется не больше SNAPSHOT_EVERY - 1 дельт.
+SNAPSHOT_EVERY = 20
+# Поля, по которым ревизия восстанавливает прежнюю версию заметки.
+REVISION_FIELDS = ('title', 'text', 'updated_at', 'version')
+
+
+class NoteQuerySet(models.QuerySet):
+
+    def create(self, **kwargs):
+        """Без явного using() заметка создаётся в шарде своего автора."""
+        if self._db is None:
+            return self.using(router.db_for_write(
+                self.model, instance=self.model(**kwargs)
+            )).create(**kwargs)
+        return super().create(**kwargs)
 
 
 class Note(models.Model):
@@ -10,7 +37,8 @@ class Note(models.Model):
         default='Название заметки',
         help_text='Дайте короткое название заметке'
     )
-    text = models.TextField(
+    # Длинные тексты (логи, выгрузки) хранятся сжатыми.
+    text = CompressedTextField(
         'Текст',
         help_text='Добавьте подробностей'
     )
@@ -22,16 +50,773 @@ class Note(models.Model):
         help_text=('Укажите адрес для страницы заметки. Используйте только '
                    'латиницу, цифры, дефисы и знаки подчёркивания')
     )
+    # Заметки могут лежать в шарде без таблицы пользователей, поэтому
+    # ограничение внешнего ключа в самой базе не создаётся.
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    updated_at = models.DateTimeField('Изменена', auto_now=True)
+    version = models.PositiveIntegerField('Версия', default=1)
+    # Markdown текста, отрисованный один раз на версию текста.
+    text_html = CompressedTextField(
+        'HTML текста', blank=True, default='', editable=False
+    )
+    text_hash = models.CharField(
+        'Хэш текста', max_length=72, blank=True, default='', editable=False
     )
+    # Длина текста в символах: по ней ведётся AuthorStats.char_count.
+    text_length = models.PositiveIntegerField(
+        'Длина текста', default=0, editable=False
+    )
+    tags = models.ManyToManyField(
+        'Tag',
+        through='NoteTag',
+        related_name='notes',
+        blank=True,
+        verbose_name='Метки',
+    )
+
+    objects = NoteQuerySet.as_manager()
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('author', 'id'),
+                name='note_author_id_idx',
+            ),
+        )
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминает загруженные значения - основу для следующей ревизии."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # Перечитанные поля могли разойтись с запомненными.
+        self.__dict__.pop('_loaded', None)
+
+    def _remember_state(self):
+        self._loaded = {name: getattr(self, name) for name in REVISION_FIELDS}
+
+    def render_text(self, deferred=False):
+        """Пересчитывает text_html и длину текста, если текст или рендерер
+        поменялись.
+
+        Возвращает True, если HTML пересчитан. С deferred=True HTML
+        только помечается устаревшим (пустой text_hash): его отрисует
+        фоновая задача или первый просмотр заметки.
+        """
+        text_hash = rendering.content_hash(self.text)
+        if text_hash == self.text_hash:
+            return False
+        self.text_length = len(self.text)
+        if deferred:
+            self.text_hash = ''
+            return True
+        self.text_html = rendering.render(self.text)
+        self.text_hash = text_hash
+        return True
+
+    def ensure_rendered(self):
+        """Ленивый рендер для заметок, записанных в обход save().
+
+        Пишутся только HTML и хэш одним UPDATE: это не правка заметки,
+        поэтому updated_at, история и журнал изменений не меняются.
+        """
+        if rendering.is_current(self.text_hash):
+            return
+        old_hash = self.text_hash
+        if self.render_text():
+            type(self)._default_manager.using(
+                sharding.shard_for(self.author_id)
+            ).filter(pk=self.pk, text_hash=old_hash).update(
+                text_html=self.text_html, text_hash=self.text_hash
+            )
+
+    def prepare_revision(self, using=None):
+        """Ревизия с прежней версией заметки, если заголовок или текст
+        изменились; заодно увеличивает version.
+
+        Прежние значения берутся из загруженной модели, а если их там
+        нет (текст был отложен через defer) - одним запросом из базы.
+        """
+        loaded = getattr(self, '_loaded', {})
+        if not all(name in loaded for name in REVISION_FIELDS):
+            loaded = type(self)._default_manager.using(
+                using or self._state.db
+            ).filter(pk=self.pk).values(*REVISION_FIELDS).first()
+            if loaded is None:
+                return None
+        if self.title == loaded['title'] and self.text == loaded['text']:
+            return None
+        self.version = loaded['version'] + 1
+        return NoteRevision.for_change(
+            self, loaded['version'], loaded['title'], loaded['text'],
+            loaded['updated_at'],
+        )
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            max_slug_length = self._meta.get_field('slug').max_length
-            self.slug = slugify(self.title)[:max_slug_length]
-        super().save(*args, **kwargs)
+        if self.slug:
+            return self._save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        queryset = type(self)._default_manager.using(using)
+        max_slug_length = self._meta.get_field('slug').max_length
+        # Откаченная попытка уже пересчитала HTML; без возврата хэша
+        # повтор не увидит изменения текста и не сдвинет сводку.
+        rendered_state = (self.text_html, self.text_hash, self.text_length)
+        for attempt in range(SLUG_ATTEMPTS):
+            self.slug = slugs.allocate_slug(
+                self.title, queryset, max_slug_length, exclude_pk=self.pk
+            )
+            try:
+                return self._save(*args, **kwargs)
+            except IntegrityError:
+                collided = queryset.filter(
+                    slug=self.slug
+                ).exclude(pk=self.pk).exists()
+                self.slug = ''
+                self.text_html, self.text_hash, self.text_length = (
+                    rendered_state
+                )
+                if not collided or attempt == SLUG_ATTEMPTS - 1:
+                    raise
+
+    def _save(self, *args, **kwargs):
+        """Сохраняет заметку вместе с поисковым индексом и журналом."""
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        track = not adding and (
+            update_fields is None or {'title', 'text'} & set(update_fields)
+        )
+        render = 'text' not in self.get_deferred_fields() and (
+            update_fields is None or 'text' in update_fields
+        )
+        deferred = jobs.is_deferred()
+        rendered = render and self.render_text(deferred=deferred)
+        if rendered and update_fields is not None:
+            update_fields = {
+                *update_fields, 'text_html', 'text_hash', 'text_length'
+            }
+            kwargs['update_fields'] = update_fields
+        with transaction.atomic(using=using):
+            revision = self.prepare_revision(using) if track else None
+            if revision is not None and update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+            # Прежняя длина вычитается подзапросом до UPDATE заметки.
+            AuthorStats.shift(
+                self.author_id,
+                notes=int(adding),
+                chars=self.text_length if rendered else 0,
+                replaced=type(self)._default_manager.using(using).filter(
+                    pk=self.pk
+                ) if rendered and not adding else None,
+                using=using,
+            )
+            super().save(*args, **kwargs)
+            if revision is not None:
+                revision.save(using=self._state.db)
+            self._remember_state()
+            if deferred:
+                if rendered:
+                    jobs.enqueue('render_note', self, using=self._state.db)
+                jobs.enqueue('index_note', self, using=self._state.db)
+            else:
+                search.index_note(self, using=self._state.db)
+            NoteChange.record(
+                self.author_id,
+                [(
+                    self.pk,
+                    self.slug,
+                    NoteChange.CREATE if adding else NoteChange.UPDATE,
+                )],
+                using=self._state.db,
+            )
+
+    @classmethod
+    def after_bulk_write(cls, author_id, created=None, updated=None,
+                         deleted=(), using=None):
+        """Обновляет производные данные после массовых операций.
+
+        bulk_create, bulk_update и QuerySet.delete() не вызывают save()
+        и delete(), поэтому вызывающий код передаёт сюда выборки
+        созданных и изменённых заметок и уже загруженные удалённые.
+        Изменение длины текстов при bulk_update вызывающий код учитывает
+        сам, до записи: AuthorStats.shift(..., replaced=...).
+        """
+        using = using or sharding.shard_for(author_id)
+        AuthorStats.shift(
+            author_id,
+            notes=-len(deleted),
+            chars=-sum(note.text_length for note in deleted),
+            added=created,
+            edited=created is not None or updated is not None,
+            using=using,
+        )
+        entries = []
+        for queryset, action in (
+            (created, NoteChange.CREATE), (updated, NoteChange.UPDATE)
+        ):
+            if queryset is None:
+                continue
+            search.index_queryset(queryset)
+            entries.extend(
+                (pk, slug, action)
+                for pk, slug in queryset.order_by('id').values_list(
+                    'id', 'slug'
+                )
+            )
+        search.unindex_pks([note.pk for note in deleted], using=using)
+        NoteTag.unlink([note.pk for note in deleted], using=using)
+        edited = [note.pk for note in deleted if note.version > 1]
+        if edited:
+            NoteRevision.objects.using(using).filter(
+                note_id__in=edited
+            ).delete()
+        entries.extend(
+            (note.pk, note.slug, NoteChange.DELETE) for note in deleted
+        )
+        NoteChange.record(author_id, entries, using=using)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        using = kwargs.get('using') or self._state.db
+        with transaction.atomic(using=using):
+            AuthorStats.shift(
+                self.author_id,
+                notes=-1,
+                replaced=type(self)._default_manager.using(using).filter(
+                    pk=pk
+                ),
+                edited=False,
+                using=using,
+            )
+            result = super().delete(*args, **kwargs)
+            search.unindex_note(pk, using=using)
+            NoteTag.unlink([pk], using=using)
+            # У заметки, которую ни разу не правили, истории нет.
+            if self.version > 1:
+                NoteRevision.objects.using(using).filter(note_id=pk).delete()
+            NoteChange.record(
+                self.author_id,
+                [(pk, self.slug, NoteChange.DELETE)],
+                using=using,
+            )
+        return result
+
+
+class AuthorVersion(models.Model):
+    """Счётчик изменений заметок автора.
+
+    Увеличивается на каждое сохранение и удаление заметки; по нему
+    строятся валидаторы условного GET для списка заметок.
+    """
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notes_version',
+        db_constraint=False,
+    )
+    version = models.PositiveBigIntegerField('Версия', default=0)
+    updated_at = models.DateTimeField('Изменена', default=timezone.now)
+
+    def __str__(self):
+        return f'{self.author_id}: {self.version}'
+
+    @classmethod
+    def bump(cls, author_id, by=1, using=None):
+        """Атомарно увеличивает счётчик и возвращает новое значение.
+
+        Увеличение идёт через F() без чтения текущего значения, поэтому
+        параллельные записи не теряют друг друга; читается счётчик уже
+        под блокировкой записи текущей транзакции.
+        """
+        manager = cls.objects.db_manager(using)
+        values = {
+            'version': F('version') + by, 'updated_at': timezone.now()
+        }
+        if not manager.filter(author_id=author_id).update(**values):
+            manager.get_or_create(author_id=author_id)
+            manager.filter(author_id=author_id).update(**values)
+        return manager.filter(author_id=author_id).values_list(
+            'version', flat=True
+        ).get()
+
+
+class AuthorStats(models.Model):
+    """Сводка по заметкам автора для домашней страницы.
+
+    Счётчики меняются при каждой записи заметок одним UPDATE через F()
+    без чтения текущих значений, поэтому страница читает одну строку
+    по ключу вместо агрегатов по notes_note. Расхождения, если они
+    всё же накопятся, исправляет ``manage.py reconcile_stats``.
+    """
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notes_stats',
+        db_constraint=False,
+    )
+    note_count = models.BigIntegerField('Заметок', default=0)
+    char_count = models.BigIntegerField('Символов', default=0)
+    last_edit_at = models.DateTimeField('Последняя правка', null=True)
+
+    def __str__(self):
+        return f'{self.author_id}: {self.note_count}/{self.char_count}'
+
+    @classmethod
+    def shift(cls, author_id, notes=0, chars=0, added=None, replaced=None,
+              edited=True, using=None):
+        """Сдвигает счётчики автора одним UPDATE.
+
+        added - выборка новых заметок: их число и длина прибавляются
+        подзапросом; replaced - выборка заметок, чья прежняя длина
+        вычитается подзапросом, пока их строки ещё не переписаны.
+        """
+        note_count = F('note_count') + notes
+        char_count = F('char_count') + chars
+        if added is not None:
+            note_count = note_count + cls._total(added, Count('id'))
+            char_count = char_count + cls._total(added, Sum('text_length'))
+        if replaced is not None:
+            char_count = char_count - cls._total(
+                replaced, Sum('text_length')
+            )
+        values = {'note_count': note_count, 'char_count': char_count}
+        if edited:
+            values['last_edit_at'] = timezone.now()
+        manager = cls.objects.db_manager(using)
+        if not manager.filter(author_id=author_id).update(**values):
+            manager.get_or_create(author_id=author_id)
+            manager.filter(author_id=author_id).update(**values)
+
+    @staticmethod
+    def _total(queryset, aggregate):
+        return Coalesce(
+            Subquery(
+                queryset.order_by().values('author_id').annotate(
+                    total=aggregate
+                ).values('total')[:1]
+            ),
+            0,
+        )
+
+
+class NoteChange(models.Model):
+    """Запись журнала изменений заметок автора для синхронизации.
+
+    seq монотонно растёт в пределах автора и совпадает с версией
+    AuthorVersion после изменения. Удаления хранятся как надгробия:
+    самой заметки уже нет, но id и slug остаются в журнале.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = (
+        (CREATE, 'Создание'),
+        (UPDATE, 'Изменение'),
+        (DELETE, 'Удаление'),
+    )
+
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='note_changes',
+        db_constraint=False,
+    )
+    seq = models.PositiveBigIntegerField('Номер изменения')
+    note_id = models.BigIntegerField('ID заметки')
+    slug = models.SlugField('Slug заметки', max_length=100, db_index=False)
+    action = models.CharField('Действие', max_length=6, choices=ACTIONS)
+    created_at = models.DateTimeField('Когда', default=timezone.now)
+
+    class Meta:
+        ordering = ('author', 'seq')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('author', 'seq'),
+                name='note_change_author_seq_uniq',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.author_id}#{self.seq}: {self.action} {self.note_id}'
+
+    @classmethod
+    def record(cls, author_id, entries, using=None):
+        """Пишет записи (id, slug, действие) и сдвигает версию автора.
+
+        Номера выдаются одним увеличением счётчика на всю пачку.
+        """
+        entries = list(entries)
+        if not entries:
+            return AuthorVersion.bump(author_id, by=0, using=using)
+        last = AuthorVersion.bump(author_id, by=len(entries), using=using)
+        first = last - len(entries) + 1
+        now = timezone.now()
+        cls.objects.db_manager(using).bulk_create(
+            cls(
+                author_id=author_id,
+                seq=seq,
+                note_id=pk,
+                slug=slug,
+                action=action,
+                created_at=now,
+            )
+            for seq, (pk, slug, action) in enumerate(entries, start=first)
+        )
+        return last
+
+
+class Job(models.Model):
+    """Фоновая задача для заметки (см. notes.jobs).
+
+    Лежит в шарде автора, как и заметка. Успешно выполненная задача
+    удаляется; упавшая окончательно остаётся с failed_at и last_error.
+    """
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='note_jobs',
+        db_constraint=False,
+    )
+    task = models.CharField('Задача', max_length=50)
+    note_id = models.BigIntegerField('ID заметки', null=True)
+    # Ключ ждущей задачи: повторная постановка её не дублирует.
+    dedup_key = models.CharField(
+        'Ключ повтора', max_length=100, null=True, unique=True
+    )
+    run_at = models.DateTimeField('Запустить после', default=timezone.now)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    locked_by = models.CharField(
+        'Кем взята', max_length=100, blank=True, default=''
+    )
+    locked_until = models.DateTimeField('Аренда до', null=True)
+    failed_at = models.DateTimeField('Упала', null=True)
+    last_error = models.TextField('Последняя ошибка', blank=True, default='')
+    created_at = models.DateTimeField('Поставлена', default=timezone.now)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=('run_at',), name='job_run_at_idx'),
+            models.Index(fields=('locked_by',), name='job_locked_by_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.task} {self.note_id}'
+
+
+class RateLimitCounter(models.Model):
+    """Счётчик окна ограничения частоты (yanote.ratelimit).
+
+    Таблица кэша DatabaseCounterCache: значение меняется одним
+    UPDATE ... SET value = value + n, поэтому счёт общий для всех
+    воркеров и процессов.
+    """
+    key = models.CharField('Ключ', max_length=255, primary_key=True)
+    value = models.BigIntegerField('Значение')
+    expires = models.FloatField('Истекает (unix time)', db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class NoteRevision(models.Model):
+    """Прежняя версия заметки.
+
+    number - номер версии, которую заменила правка. Текст хранится
+    обратной дельтой к следующей версии (см. notes.revisions), а каждая
+    SNAPSHOT_EVERY-я ревизия и ревизии, у которых дельта не меньше
+    самого текста, - целиком (snapshot). Заметки на ревизии нет внешнего
+    ключа, как и у NoteChange: история удаляется вместе с заметкой в
+    Note.delete() и Note.after_bulk_write().
+    """
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='note_revisions',
+        db_constraint=False,
+    )
+    note_id = models.BigIntegerField('ID заметки')
+    number = models.PositiveIntegerField('Номер версии')
+    title = models.CharField('Заголовок', max_length=100)
+    snapshot = models.BooleanField('Полная копия', default=False)
+    data = CompressedTextField('Текст или дельта')
+    saved_at = models.DateTimeField('Версия сохранена')
+    created_at = models.DateTimeField('Заменена', default=timezone.now)
+
+    class Meta:
+        ordering = ('note_id', '-number')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('note_id', 'number'),
+                name='note_revision_note_number_uniq',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.note_id} v{self.number}'
+
+    @classmethod
+    def for_change(cls, note, number, title, text, saved_at):
+        """Несохранённая ревизия версии number, заменяемой текстом note."""
+        snapshot = number % SNAPSHOT_EVERY == 0
+        data = text
+        if not snapshot:
+            delta = revisions.encode(revisions.make_delta(note.text, text))
+            snapshot = len(delta) >= len(text)
+            data = text if snapshot else delta
+        return cls(
+            author_id=note.author_id,
+            note_id=note.pk,
+            number=number,
+            title=title,
+            snapshot=snapshot,
+            data=data,
+            saved_at=saved_at,
+        )
+
+    @classmethod
+    def rebuild(cls, note, number, using=None):
+        """(заголовок, текст) версии number заметки note.
+
+        Читается не больше SNAPSHOT_EVERY ревизий: от нужной версии до
+        ближайшей полной копии или до текущего текста заметки.
+        """
+        chain = list(
+            cls.objects.using(using or note._state.db).filter(
+                note_id=note.pk,
+                number__gte=number,
+                number__lt=number + SNAPSHOT_EVERY,
+            ).order_by('number')
+        )
+        if not chain or chain[0].number != number:
+            raise cls.DoesNotExist(f'Нет версии {number} заметки {note.pk}')
+        for end, revision in enumerate(chain):
+            if revision.snapshot:
+                chain = chain[:end + 1]
+                text = revision.data
+                break
+        else:
+            text = note.text
+        for revision in reversed(chain):
+            if not revision.snapshot:
+                text = revisions.apply_delta(
+                    text, revisions.decode(revision.data)
+                )
+        return chain[0].title, text
+
+
+class Tag(models.Model):
+    """Метка, которой автор группирует заметки.
+
+    note_count хранится в самой метке и меняется вместе со связями
+    (NoteTag.link/unlink) через F(), поэтому список меток с числами -
+    это чтение строк автора по индексу, без COUNT(*) по связям.
+    """
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='note_tags',
+        db_constraint=False,
+    )
+    name = models.CharField('Название', max_length=50)
+    slug = models.SlugField('Slug', max_length=60, db_index=False)
+    note_count = models.PositiveIntegerField('Заметок', default=0)
+
+    class Meta:
+        ordering = ('author', 'slug')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('author', 'slug'),
+                name='tag_author_slug_uniq',
+            ),
+        )
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def slug_for(cls, name):
+        return slugs.base_slug(name, cls._meta.get_field('slug').max_length)
+
+    @classmethod
+    def for_names(cls, author_id, names, using=None):
+        """Метки автора с такими названиями; недостающие создаются.
+
+        Названия, дающие один slug, считаются одной меткой.
+        """
+        wanted = {}
+        for name in names:
+            wanted.setdefault(cls.slug_for(name), name)
+        if not wanted:
+            return []
+        manager = cls.objects.db_manager(using)
+        found = {
+            tag.slug: tag for tag in manager.filter(
+                author_id=author_id, slug__in=wanted
+            )
+        }
+        missing = [slug for slug in wanted if slug not in found]
+        if missing:
+            manager.bulk_create(
+                (cls(author_id=author_id, name=wanted[slug], slug=slug)
+                 for slug in missing),
+                ignore_conflicts=True,
+            )
+            found.update(
+                (tag.slug, tag) for tag in manager.filter(
+                    author_id=author_id, slug__in=missing
+                )
+            )
+        return [found[slug] for slug in wanted]
+
+    @classmethod
+    def shift_counts(cls, counts, sign, using=None):
+        """Сдвигает note_count на counts[tag_id] в сторону sign.
+
+        Один UPDATE на каждое различное значение сдвига: при правке
+        одной заметки это всегда один запрос.
+        """
+        by_amount = defaultdict(list)
+        for tag_id, amount in counts.items():
+            by_amount[amount].append(tag_id)
+        for amount, tag_ids in by_amount.items():
+            cls.objects.db_manager(using).filter(pk__in=tag_ids).update(
+                note_count=F('note_count') + sign * amount
+            )
+
+
+class NoteTag(models.Model):
+    """Связь заметки с меткой.
+
+    Уникальный индекс (tag, note) обслуживает фильтр списка по метке:
+    заметки метки читаются по нему сразу в порядке id. Связи удаляются
+    вместе с заметкой в Note.delete() и Note.after_bulk_write(), где
+    заодно уменьшаются счётчики, поэтому удаление заметки не каскадное.
+    """
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.DO_NOTHING,
+        related_name='tag_links',
+        db_constraint=False,
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='note_links',
+        db_index=False,
+    )
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('tag', 'note'),
+                name='note_tag_tag_note_uniq',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.note_id}: {self.tag_id}'
+
+    @classmethod
+    def link(cls, note_ids, tag_ids, using=None):
+        """Привязывает метки ко всем заметкам; новые пары (заметка, метка).
+        """
+        if not note_ids or not tag_ids:
+            return []
+        manager = cls.objects.db_manager(using)
+        existing = set(
+            manager.filter(
+                note_id__in=note_ids, tag_id__in=tag_ids
+            ).values_list('note_id', 'tag_id')
+        )
+        links = [
+            cls(note_id=note_id, tag_id=tag_id)
+            for note_id in note_ids for tag_id in tag_ids
+            if (note_id, tag_id) not in existing
+        ]
+        if links:
+            manager.bulk_create(links)
+            Tag.shift_counts(
+                Counter(link.tag_id for link in links), 1, using=using
+            )
+        return [(link.note_id, link.tag_id) for link in links]
+
+    @classmethod
+    def unlink(cls, note_ids, tag_ids=None, using=None):
+        """Отвязывает метки (по умолчанию все) от заметок; удалённые
+        пары (заметка, метка).
+
+        Для заметок без меток это один SELECT по индексу note_id.
+        """
+        links = cls.objects.db_manager(using).filter(note_id__in=note_ids)
+        if tag_ids is not None:
+            links = links.filter(tag_id__in=tag_ids)
+        removed = list(links.values_list('note_id', 'tag_id'))
+        if removed:
+            links.delete()
+            Tag.shift_counts(
+                Counter(tag_id for _, tag_id in removed), -1, using=using
+            )
+        return removed
+
+    @classmethod
+    def set_for_note(cls, note, tags, using=None):
+        """Делает набор меток заметки равным tags."""
+        using = using or note._state.db
+        wanted = {tag.pk for tag in tags}
+        current = set(
+            cls.objects.db_manager(using).filter(
+                note_id=note.pk
+            ).values_list('tag_id', flat=True)
+        )
+        if current - wanted:
+            cls.unlink([note.pk], current - wanted, using=using)
+        if wanted - current:
+            cls.link([note.pk], wanted - current, using=using)
+
+    @classmethod
+    def assign(cls, author_id, notes, add=(), remove=(), using=None):
+        """Массово привязывает add и отвязывает remove у заметок notes.
+
+        notes - пары (id, slug) заметок автора. Заметки, у которых
+        связи действительно изменились, получают новое updated_at и
+        запись в журнале изменений, чтобы сбросились страницы с условным
+        GET и кэш фрагментов; остальных клиентам синхронизации
+        перечитывать незачем. Возвращает число изменённых связей.
+        """
+        note_ids = [pk for pk, _ in notes]
+        changed = cls.link(note_ids, [tag.pk for tag in add], using=using)
+        if remove:
+            changed += cls.unlink(
+                note_ids, [tag.pk for tag in remove], using=using
+            )
+        changed_ids = {note_id for note_id, _ in changed}
+        if changed_ids:
+            Note.objects.using(using).filter(pk__in=changed_ids).update(
+                updated_at=timezone.now()
+            )
+            NoteChange.record(
+                author_id,
+                [
+                    (pk, slug, NoteChange.UPDATE) for pk, slug in notes
+                    if pk in changed_ids
+                ],
+                using=using,
+            )
+        return len(changed)
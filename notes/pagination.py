@@ -0,0 +1,82 @@
+from django.http import Http404
+
+AFTER = 'after'
+BEFORE = 'before'
+
+
+class KeysetPage:
+    """Страница выборки, отрезанная по курсору (id), а не по OFFSET.
+
+    Стоимость получения страницы не зависит от её номера: запрос
+    идёт по индексу (author, id) и читает не больше page_size + 1 строк.
+    """
+
+    def __init__(self, queryset, page_size, after=None, before=None):
+        self.page_size = page_size
+        if before is not None:
+            rows = list(
+                queryset.filter(id__lt=before).order_by('-id')[:page_size + 1]
+            )
+            self._has_more = len(rows) > page_size
+            self.object_list = rows[:page_size][::-1]
+            self.has_previous = self._has_more
+            self.has_next = True
+        else:
+            if after is not None:
+                queryset = queryset.filter(id__gt=after)
+            rows = list(queryset.order_by('id')[:page_size + 1])
+            self._has_more = len(rows) > page_size
+            self.object_list = rows[:page_size]
+            self.has_previous = after is not None
+            self.has_next = self._has_more
+        if not self.object_list:
+            self.has_previous = self.has_next = False
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_previous or self.has_next
+
+    @property
+    def next_cursor(self):
+        if self.has_next:
+            return self.object_list[-1].id
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous:
+            return self.object_list[0].id
+        return None
+
+
+def get_cursor(request, name):
+    """Достаёт курсор из GET-параметра, при мусоре в нём отдаёт 404."""
+    value = request.GET.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        cursor = int(value)
+    except ValueError:
+        raise Http404('Некорректный курсор страницы.')
+    if cursor < 0:
+        raise Http404('Некорректный курсор страницы.')
+    return cursor
+
+
+class KeysetPaginationMixin:
+    """Подменяет OFFSET-пагинацию ListView на курсорную по id."""
+    paginate_by = 50
+
+    def paginate_queryset(self, queryset, page_size):
+        page = KeysetPage(
+            queryset,
+            page_size,
+            after=get_cursor(self.request, AFTER),
+            before=get_cursor(self.request, BEFORE),
+        )
+        return None, page, page.object_list, page.has_other_pages()
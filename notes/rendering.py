@@ -0,0 +1,51 @@
+"""Markdown заметок в безопасный HTML.
+
+HTML считается один раз на версию текста и хранится в самой заметке
+вместе с хэшем (Note.text_html, Note.text_hash). В хэш входит
+RENDERER_VERSION: после смены расширений или списка разрешённых тегов
+её нужно увеличить и запустить ``manage.py rerender_notes`` - до этого
+устаревший HTML перерисовывается лениво при первом просмотре заметки.
+"""
+import hashlib
+
+import bleach
+import markdown
+
+RENDERER_VERSION = 1
+
+EXTENSIONS = ('extra', 'sane_lists', 'nl2br')
+ALLOWED_TAGS = frozenset({
+    'a', 'abbr', 'blockquote', 'br', 'code', 'dd', 'del', 'dl', 'dt', 'em',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'ol', 'p', 'pre',
+    'strong', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul',
+})
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title'],
+    'abbr': ['title'],
+    'th': ['align'],
+    'td': ['align'],
+}
+ALLOWED_PROTOCOLS = frozenset({'http', 'https', 'mailto'})
+
+
+def content_hash(text):
+    """Версия рендерера и sha256 текста: меняется вместе с любым из них."""
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return f'{RENDERER_VERSION}:{digest}'
+
+
+def is_current(text_hash):
+    """Сделан ли HTML текущим рендерером - без чтения самого текста."""
+    return text_hash.startswith(f'{RENDERER_VERSION}:')
+
+
+def render(text):
+    """HTML из Markdown; всё, чего нет в списках разрешённого, вырезается."""
+    html = markdown.markdown(text, extensions=EXTENSIONS)
+    return bleach.clean(
+        html,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        protocols=ALLOWED_PROTOCOLS,
+        strip=True,
+    )
@@ -0,0 +1,141 @@
+"""Чтение с реплик с гарантией «читаю свои записи».
+
+Только читающие представления (read_only = True в NoteBase) ходят в
+реплики из settings.DATABASE_REPLICAS, изменяющие - всегда в основную
+базу. После успешного изменяющего запроса пользователь получает
+подписанную cookie, и пока она жива (REPLICA_PIN_SECONDS), его чтения
+тоже идут в основную базу, так что отставшая реплика не покажет ему
+старые данные.
+
+В реплики ходят только модели notes: пользователи и сессии всегда
+читаются из основной базы, иначе отставшая реплика «разлогинивала» бы
+только что вошедших. Реплики наполняются снаружи (копированием файла,
+litestream и т.п.), поэтому миграции на них не запускаются.
+
+Реплика выбирается по кругу один раз на запрос (на каждую основную
+базу) и дальше обслуживает все его чтения: реплики отстают по-разному,
+и валидаторы ETag, список и метки из разных реплик дали бы страницу,
+собранную из разных моментов, под версией самого свежего из них.
+"""
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .sharding import SHARDED_APP, AuthorShardRouter
+
+PIN_COOKIE = 'pin_primary'
+PIN_SALT = 'notes.replicas.pin'
+DEFAULT_PIN_SECONDS = 10
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+# None - читать из основной базы; иначе {основная база: реплика}
+# текущего запроса.
+_use_replicas = ContextVar('notes_use_replicas', default=None)
+_counter = itertools.count()
+
+
+def get_replicas(alias):
+    return list(getattr(settings, 'DATABASE_REPLICAS', {}).get(alias, ()))
+
+
+def is_replica(alias):
+    return any(
+        alias in replicas
+        for replicas in getattr(settings, 'DATABASE_REPLICAS', {}).values()
+    )
+
+
+def replica_for(alias):
+    """Реплика основной базы по кругу или сама база, если реплик нет."""
+    replicas = get_replicas(alias)
+    if not replicas:
+        return alias
+    return replicas[next(_counter) % len(replicas)]
+
+
+def read_alias(alias):
+    """Куда читать в текущем контексте: в реплику или в основную базу.
+
+    Внутри use_replicas() первая реплика, выбранная для alias, остаётся
+    за ним до конца блока.
+    """
+    chosen = _use_replicas.get()
+    if chosen is None:
+        return alias
+    if alias not in chosen:
+        chosen[alias] = replica_for(alias)
+    return chosen[alias]
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    token = _use_replicas.set({} if enabled else None)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+
+
+def is_pinned(request):
+    return request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=PIN_SALT, max_age=pin_seconds()
+    ) is not None
+
+
+def pin(response):
+    response.set_signed_cookie(
+        PIN_COOKIE, '1', salt=PIN_SALT, max_age=pin_seconds(),
+        httponly=True, samesite='Lax',
+    )
+
+
+class ReplicaRouter:
+    """Отправляет чтения в реплику, когда это разрешил use_replicas().
+
+    Стоит в DATABASE_ROUTERS перед AuthorShardRouter и спрашивает у
+    него основную базу, чтобы читать из реплики нужного шарда.
+    """
+    shard_router = AuthorShardRouter()
+
+    def db_for_read(self, model, **hints):
+        if (
+            _use_replicas.get() is None
+            or model._meta.app_label != SHARDED_APP
+        ):
+            return None
+        primary = (
+            self.shard_router.db_for_read(model, **hints)
+            or DEFAULT_DB_ALIAS
+        )
+        replica = read_alias(primary)
+        return None if replica == primary else replica
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if is_replica(db):
+            return False
+        return None
+
+
+class PinPrimaryMiddleware:
+    """Ставит cookie привязки к основной базе после успешной записи."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and getattr(request, 'user', None) is not None
+            and request.user.is_authenticated
+        ):
+            pin(response)
+        return response
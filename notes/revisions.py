@@ -0,0 +1,66 @@
+"""Построчные дельты для истории правок заметок.
+
+Ревизия хранит прежнюю версию текста как обратную дельту: набор
+операций, который превращает более новую версию в более старую.
+Текущий текст лежит в самой заметке, поэтому создание заметки ничего
+не пишет в историю, а размер ревизии зависит от размера правки, а не
+от размера заметки.
+
+Дельта - JSON-список операций над строками новой версии: целое n > 0
+копирует n строк, целое -n пропускает n строк, список строк
+вставляется как есть.
+"""
+import json
+from difflib import SequenceMatcher
+
+
+def split_lines(text):
+    return text.splitlines(keepends=True)
+
+
+def make_delta(source, target):
+    """Дельта, превращающая текст source в текст target."""
+    source_lines = split_lines(source)
+    target_lines = split_lines(target)
+    ops = []
+
+    def emit(op):
+        if ops and isinstance(op, list) and isinstance(ops[-1], list):
+            ops[-1].extend(op)
+        else:
+            ops.append(op)
+
+    matcher = SequenceMatcher(None, source_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            emit(i2 - i1)
+            continue
+        if i2 > i1:
+            emit(i1 - i2)
+        if j2 > j1:
+            emit(target_lines[j1:j2])
+    return ops
+
+
+def apply_delta(source, ops):
+    """Применяет дельту make_delta() к тексту source."""
+    source_lines = split_lines(source)
+    result = []
+    position = 0
+    for op in ops:
+        if isinstance(op, list):
+            result.extend(op)
+        elif op > 0:
+            result.extend(source_lines[position:position + op])
+            position += op
+        else:
+            position -= op
+    return ''.join(result)
+
+
+def encode(ops):
+    return json.dumps(ops, ensure_ascii=False, separators=(',', ':'))
+
+
+def decode(data):
+    return json.loads(data)
@@ -0,0 +1,172 @@
+"""Полнотекстовый поиск по заметкам на индексе SQLite FTS5.
+
+Индекс - виртуальная таблица ``notes_note_fts`` с rowid, равным id
+заметки. Она поддерживается инкрементально из ``Note.save()`` и
+``Note.delete()`` и целиком перестраивается командой
+``rebuild_search_index``. На других СУБД все функции модуля ничего не
+делают, а поиск возвращает пустой результат.
+
+Колонка ``author_id`` индексируется как обычный токен: условие на
+автора входит в само выражение MATCH, и FTS5 пересекает списки
+документов до ранжирования, а не считает bm25 по заметкам всех авторов,
+чтобы потом отбросить чужие.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.html import escape
+
+from .fields import SQL_FUNCTION
+
+FTS_TABLE = 'notes_note_fts'
+
+# Маркеры подсветки вставляет сам SQLite, поэтому берём управляющие
+# символы, которых нет в тексте, и меняем их на теги уже после escape().
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+_ELLIPSIS = '…'
+
+SNIPPET_TOKENS = 16
+TITLE_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+AUTHOR_WEIGHT = 0.0
+
+CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    "title, text, author_id, tokenize='unicode61')"
+)
+DROP_SQL = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+
+
+def is_supported(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'sqlite'
+
+
+def index_note(note, using=DEFAULT_DB_ALIAS):
+    """Добавляет заметку в индекс или обновляет её запись."""
+    if not is_supported(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [note.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, text, author_id) '
+            'VALUES (%s, %s, %s, %s)',
+            [note.pk, note.title, note.text, note.author_id],
+        )
+
+
+def unindex_note(pk, using=DEFAULT_DB_ALIAS):
+    """Убирает заметку из индекса."""
+    if not is_supported(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def unindex_pks(pks, using=DEFAULT_DB_ALIAS):
+    """Убирает из индекса несколько заметок одним запросом."""
+    pks = list(pks)
+    if not pks or not is_supported(using):
+        return
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', pks
+        )
+
+
+def index_queryset(queryset):
+    """Индексирует выборку заметок одним INSERT ... SELECT.
+
+    Нужна там, где заметки создаются через bulk_create и Note.save()
+    не вызывается.
+    """
+    using = queryset.db
+    if not is_supported(using):
+        return
+    sql, params = queryset.values('id').order_by().query.sql_with_params()
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({sql})', params
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, text, author_id) '
+            f'SELECT id, title, {SQL_FUNCTION}(text), author_id '
+            f'FROM notes_note WHERE id IN ({sql})',
+            params,
+        )
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    """Перестраивает индекс одним INSERT ... SELECT по всей таблице.
+
+    Возвращает число проиндексированных заметок.
+    """
+    if not is_supported(using):
+        return 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, text, author_id) '
+            f'SELECT id, title, {SQL_FUNCTION}(text), author_id '
+            'FROM notes_note'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) "
+                       "VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def build_match_query(query):
+    """Превращает ввод пользователя в безопасное выражение MATCH.
+
+    Каждое слово берётся в кавычки, чтобы операторы FTS5 из ввода не
+    ломали запрос; слова объединяются через AND, последнее ищется
+    как префикс.
+    """
+    terms = [
+        '"{}"'.format(term.replace('"', '""')) for term in query.split()
+    ]
+    if not terms:
+        return ''
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _highlight(value):
+    return str(escape(value)).replace(
+        _MARK_START, '<mark>'
+    ).replace(_MARK_END, '</mark>')
+
+
+def search(author, query, limit=50, using=DEFAULT_DB_ALIAS):
+    """Ищет заметки автора, отсортированные по bm25.
+
+    Возвращает список кортежей ``(id, заголовок, сниппет)``, в которых
+    заголовок и сниппет - уже экранированный HTML с тегами <mark>.
+    """
+    match = build_match_query(query)
+    if not match or not is_supported(using):
+        return []
+    # Слова пользователя ищутся только в заголовке и тексте, чтобы число
+    # в запросе не совпало с токеном автора.
+    match = f'author_id : "{author.pk:d}" AND {{title text}} : ({match})'
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, '
+            f'highlight({FTS_TABLE}, 0, %s, %s), '
+            f'snippet({FTS_TABLE}, 1, %s, %s, %s, %s) '
+            f'FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s, %s) '
+            'LIMIT %s',
+            [
+                _MARK_START, _MARK_END,
+                _MARK_START, _MARK_END, _ELLIPSIS, SNIPPET_TOKENS,
+                match,
+                TITLE_WEIGHT, TEXT_WEIGHT, AUTHOR_WEIGHT,
+                limit,
+            ],
+        )
+        return [
+            (pk, _highlight(title), _highlight(snippet))
+            for pk, title, snippet in cursor.fetchall()
+        ]
@@ -0,0 +1,102 @@
+"""Шардирование заметок по авторам между несколькими базами.
+
+Все данные приложения notes одного автора (заметки, поисковый индекс,
+счётчик версий, журнал изменений) живут в одной базе из
+settings.NOTE_SHARDS, выбранной по хэшу author_id. Пользователи,
+сессии и прочие приложения остаются в default. При одном шарде
+(по умолчанию это сам default) поведение не отличается от обычного.
+
+Новый шард-база мигрируется отдельно: ``manage.py migrate --database
+notes_N``; после изменения числа шардов авторов переносит команда
+``rebalance_shards``.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+SHARDED_APP = 'notes'
+
+
+def get_shards():
+    return list(getattr(settings, 'NOTE_SHARDS', None) or [DEFAULT_DB_ALIAS])
+
+
+def shard_for(author, shards=None):
+    """Алиас базы для автора (пользователя или его id).
+
+    Хэш берётся от десятичной записи id через md5, а не через hash(),
+    чтобы выбор шарда не зависел от процесса и версии Python.
+    """
+    shards = shards or get_shards()
+    if len(shards) == 1:
+        return shards[0]
+    author_id = getattr(author, 'pk', author)
+    if author_id is None:
+        return DEFAULT_DB_ALIAS
+    digest = hashlib.md5(str(author_id).encode()).digest()
+    return shards[int.from_bytes(digest[:8], 'big') % len(shards)]
+
+
+def _is_user(instance):
+    return instance._meta.label == settings.AUTH_USER_MODEL
+
+
+class AuthorShardRouter:
+    """Роутер: модели notes идут в шард автора, остальное - в default."""
+
+    def _db_for(self, model, **hints):
+        if model._meta.app_label != SHARDED_APP:
+            return None
+        shards = get_shards()
+        if len(shards) == 1:
+            return shards[0]
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if _is_user(instance):
+            return shard_for(instance.pk, shards)
+        author_id = getattr(instance, 'author_id', None)
+        if author_id is not None:
+            return shard_for(author_id, shards)
+        return instance._state.db
+
+    db_for_read = _db_for
+    db_for_write = _db_for
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Связи автор-заметка пересекают базы, и это ожидаемо."""
+        if SHARDED_APP in (obj1._meta.app_label, obj2._meta.app_label):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == SHARDED_APP:
+            return db == DEFAULT_DB_ALIAS or db in get_shards()
+        return db == DEFAULT_DB_ALIAS
+
+
+def delete_author_notes(sender, instance, using, **kwargs):
+    """pre_delete пользователя: каскад в шард, куда не дотянется ORM.
+
+    Collector удаляет связанные объекты только в базе пользователя,
+    поэтому данные в другом шарде чистятся здесь.
+    """
+    shard = shard_for(instance.pk)
+    if shard == using:
+        return
+    from .models import (
+        AuthorStats, AuthorVersion, Job, Note, NoteChange, NoteRevision, Tag,
+    )
+    from . import search
+
+    notes = Note.objects.using(shard).filter(author_id=instance.pk)
+    search.unindex_pks(notes.values_list('id', flat=True), using=shard)
+    # Связи с метками удаляются каскадом от меток.
+    Tag.objects.using(shard).filter(author_id=instance.pk).delete()
+    notes.delete()
+    NoteChange.objects.using(shard).filter(author_id=instance.pk).delete()
+    NoteRevision.objects.using(shard).filter(author_id=instance.pk).delete()
+    AuthorVersion.objects.using(shard).filter(author_id=instance.pk).delete()
+    AuthorStats.objects.using(shard).filter(author_id=instance.pk).delete()
+    Job.objects.using(shard).filter(author_id=instance.pk).delete()
@@ -0,0 +1,93 @@
+"""Выдача уникальных slug для заметок.
+
+Вместо пары «slugify + exists()» на каждый вариант свободный slug
+ищется одним запросом по диапазону индекса slug: берутся все занятые
+значения вида ``base`` и ``base-N`` и выбирается первое свободное.
+Гонку между параллельными сохранениями закрывает повтор в
+``Note.save()`` при IntegrityError уникального индекса.
+"""
+from functools import lru_cache
+
+from django.db.models import Q
+from pytils.translit import slugify
+
+SLUG_MAX_LENGTH = 100
+FALLBACK_SLUG = 'note'
+# Место под суффикс вида «-12345», чтобы не упираться в max_length.
+SUFFIX_RESERVE = 6
+# Символ, следующий за «-» в ASCII: slug__lt=stem + '.' закрывает диапазон.
+_RANGE_END = chr(ord('-') + 1)
+
+
+@lru_cache(maxsize=4096)
+def transliterate(title):
+    """Транслитерация заголовка через pytils с кэшированием."""
+    return slugify(title)
+
+
+def base_slug(title, max_length=SLUG_MAX_LENGTH):
+    """Базовый slug заголовка без суффикса уникальности."""
+    return transliterate(title or '')[:max_length] or FALLBACK_SLUG
+
+
+def _stem(base, max_length):
+    return base[:max_length - SUFFIX_RESERVE].rstrip('-') or FALLBACK_SLUG
+
+
+def _range_q(base, stem):
+    return Q(slug=base) | Q(slug__gt=stem + '-', slug__lt=stem + _RANGE_END)
+
+
+def _pick(base, stem, taken, start=2):
+    if base not in taken:
+        return base, start
+    number = start
+    while f'{stem}-{number}' in taken:
+        number += 1
+    return f'{stem}-{number}', number + 1
+
+
+def allocate_slug(title, queryset, max_length=SLUG_MAX_LENGTH,
+                  exclude_pk=None):
+    """Возвращает свободный slug для заголовка одним запросом.
+
+    queryset - выборка, среди которой slug должен быть уникален
+    (обычно Note.objects нужной базы).
+    """
+    base = base_slug(title, max_length)
+    stem = _stem(base, max_length)
+    taken = queryset.filter(_range_q(base, stem))
+    if exclude_pk is not None:
+        taken = taken.exclude(pk=exclude_pk)
+    slug, _ = _pick(base, stem, set(taken.values_list('slug', flat=True)))
+    return slug
+
+
+def allocate_slugs(titles, queryset, max_length=SLUG_MAX_LENGTH,
+                   reserved=()):
+    """Выдаёт slug сразу для пачки заголовков одним запросом.
+
+    Slug уникальны и относительно базы, и внутри пачки. reserved -
+    slug, которые уже заняты в пачке (например, заданы явно).
+    """
+    bases = [base_slug(title, max_length) for title in titles]
+    stems = {base: _stem(base, max_length) for base in bases}
+    taken = set(reserved)
+    if stems:
+        condition = Q()
+        for base, stem in stems.items():
+            condition |= _range_q(base, stem)
+        taken.update(
+            queryset.filter(condition).values_list('slug', flat=True)
+        )
+    result = []
+    # Следующий номер суффикса по каждой основе, чтобы повторяющиеся
+    # заголовки в пачке не перебирали занятые номера заново.
+    next_numbers = {}
+    for base in bases:
+        slug, next_numbers[base] = _pick(
+            base, stems[base], taken, next_numbers.get(base, 2)
+        )
+        taken.add(slug)
+        result.append(slug)
+    return result
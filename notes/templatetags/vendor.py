@@ -0,0 +1,19 @@
+from django import template
+from django.utils.html import format_html
+
+from yanote.staticfiles import vendor_asset
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendor_stylesheet(name):
+    """<link> на свою копию стороннего CSS, а без неё - на CDN с SRI."""
+    url, integrity = vendor_asset(name)
+    if integrity is None:
+        return format_html('<link rel="stylesheet" href="{}">', url)
+    return format_html(
+        '<link rel="stylesheet" href="{}" integrity="{}" '
+        'crossorigin="anonymous">',
+        url, integrity,
+    )
@@ -0,0 +1,174 @@
+import json
+from http import HTTPStatus
+
+from colorama import Fore
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from notes import search
+from notes.models import Note
+
+User = get_user_model()
+
+
+PRINT: bool = True
+
+
+class TestNoteBatch(TestCase):
+    """Тест пакетного JSON API."""
+    URL = reverse('notes:api_batch')
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.reader = User.objects.create(username='Юзер')
+        cls.note = Note.objects.create(
+            title='Старая', text='Текст', author=cls.author, slug='old'
+        )
+        cls.doomed = Note.objects.create(
+            title='Удаляемая', text='Текст', author=cls.author, slug='doomed'
+        )
+        cls.foreign = Note.objects.create(
+            title='Чужая', text='Текст', author=cls.reader, slug='foreign'
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест пакетного API.\n')
+            print('Подготовка данных для тестов:')
+            print(f'\t>созданы пользователи: {cls.author}, {cls.reader}')
+
+    def post(self, payload):
+        return self.client.post(
+            self.URL, data=json.dumps(payload),
+            content_type='application/json',
+        )
+
+    def test_anonymous_is_forbidden(self):
+        """Аноним не может пользоваться API."""
+        response = self.post({})
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+        if PRINT:
+            status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+            print(f'Тест доступа анонима к API: {status}')
+
+    def test_batch(self):
+        """Пачка применяется целиком, ошибки - по элементам."""
+        self.client.force_login(self.author)
+        creates = [
+            {'title': f'Новая {index}', 'text': 'Текст'}
+            for index in range(20)
+        ]
+        creates.append({'title': 'Без текста', 'text': ''})
+        creates.append({'title': 'Дубль', 'text': 'Т', 'slug': 'old'})
+        payload = {
+            'create': creates,
+            'update': [
+                {'slug': 'old', 'text': 'Обновлённый текст'},
+                {'slug': 'foreign', 'text': 'Взлом'},
+            ],
+            'delete': ['doomed', 'foreign'],
+        }
+        # Включая сессию и пользователя: без общего кэша - из базы.
+        with self.assertNumQueries(25):
+            response = self.post(payload)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        results = response.json()
+        statuses = [item['status'] for item in results['create']]
+        self.assertEqual(statuses.count(HTTPStatus.CREATED), 20)
+        self.assertEqual(statuses[-2:], [HTTPStatus.BAD_REQUEST] * 2)
+        self.assertEqual(
+            [item['status'] for item in results['update']],
+            [HTTPStatus.OK, HTTPStatus.NOT_FOUND],
+        )
+        self.assertEqual(
+            [item['status'] for item in results['delete']],
+            [HTTPStatus.NO_CONTENT, HTTPStatus.NOT_FOUND],
+        )
+        self.assertEqual(Note.objects.filter(author=self.author).count(), 21)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.text, 'Обновлённый текст')
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.text, 'Текст')
+        self.assertEqual(
+            len(search.search(self.author, 'Новая', limit=100)), 20
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест пакетной обработки: {status}')
+
+
+class TestNoteChanges(TestCase):
+    """Тест ленты изменений для синхронизации."""
+    URL = reverse('notes:api_changes')
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.reader = User.objects.create(username='Юзер')
+        Note.objects.create(title='Чужая', text='Текст', author=cls.reader)
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест ленты изменений.\n')
+            print('Подготовка данных для тестов:')
+            print(f'\t>созданы пользователи: {cls.author}, {cls.reader}')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def changes(self, since, **params):
+        return self.client.get(self.URL, {'since': since, **params}).json()
+
+    def test_deltas_since_cursor(self):
+        """Лента отдаёт только изменения после курсора, с надгробиями."""
+        first = Note.objects.create(
+            title='Первая', text='Текст', author=self.author
+        )
+        cursor = self.changes(0)['cursor']
+        self.assertEqual(self.changes(cursor)['changes'], [])
+
+        second = Note.objects.create(
+            title='Вторая', text='Текст', author=self.author
+        )
+        first.text = 'Новый текст'
+        first.save()
+        second_pk = second.pk
+        second.delete()
+        page = self.changes(cursor, limit=2)
+        self.assertTrue(page['has_more'])
+        self.assertEqual(
+            [(item['id'], item['action']) for item in page['changes']],
+            [(second_pk, 'delete'), (first.pk, 'update')],
+        )
+        self.assertNotIn('title', page['changes'][0])
+        self.assertEqual(page['changes'][1]['text'], 'Новый текст')
+        page = self.changes(page['cursor'])
+        self.assertFalse(page['has_more'])
+        self.assertEqual(
+            [(item['id'], item['action']) for item in page['changes']],
+            [(second_pk, 'delete')],
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест ленты изменений: {status}')
+
+    def test_long_poll_returns_at_once_when_changed(self):
+        """Долгий опрос не ждёт, если изменения уже есть."""
+        Note.objects.create(title='Заметка', text='Текст', author=self.author)
+        page = self.changes(0, wait=5)
+        self.assertEqual(len(page['changes']), 1)
+        self.assertEqual(
+            self.client.get(self.URL, {'since': 'x'}).status_code,
+            HTTPStatus.BAD_REQUEST,
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест долгого опроса: {status}')
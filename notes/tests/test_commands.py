@@ -0,0 +1,821 @@
+import json
+import random
+import shutil
+import tempfile
+from http import HTTPStatus
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from colorama import Fore
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from notes import benchmark, dataset, jobs, rendering, search, sharding
+from notes.models import (
+    AuthorStats, AuthorVersion, Job, Note, NoteChange, NoteRevision, NoteTag,
+    Tag,
+)
+from yanote import sqlite, warmup
+
+User = get_user_model()
+
+
+PRINT: bool = True
+
+
+class TestImportExport(TestCase):
+    """Тест потокового импорта и экспорта заметок."""
+    ROWS = (
+        {'title': 'Первая', 'text': 'Текст первой', 'slug': ''},
+        {'title': 'Первая', 'text': 'Текст дубля', 'slug': ''},
+        {'title': 'Со slug', 'text': 'Текст', 'slug': 'custom'},
+        {'title': 'Без текста', 'text': ''},
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='author')
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест импорта и экспорта заметок.\n')
+            print('Подготовка данных для тестов:')
+            print(f'\t>создан пользователь: {cls.author}')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name)
+
+    def import_file(self, name, content):
+        path = self.path / name
+        path.write_text(content, encoding='utf-8')
+        out, err = StringIO(), StringIO()
+        call_command(
+            'import_notes', str(path), author=self.author.username,
+            batch_size=2, stdout=out, stderr=err,
+        )
+        return err.getvalue()
+
+    def test_import_jsonl(self):
+        """Импорт создаёт заметки пачками, пропуская плохие строки."""
+        errors = self.import_file(
+            'notes.jsonl',
+            '\n'.join(json.dumps(row) for row in self.ROWS) + '\n{bad\n',
+        )
+        self.assertEqual(Note.objects.filter(author=self.author).count(), 3)
+        self.assertEqual(
+            sorted(Note.objects.values_list('slug', flat=True)),
+            ['custom', 'pervaya', 'pervaya-2'],
+        )
+        self.assertIn('Строка 4', errors)
+        self.assertIn('Строка 5', errors)
+        self.assertEqual(
+            [pk for pk, _, _ in search.search(self.author, 'дубля')],
+            list(Note.objects.filter(slug='pervaya-2').values_list(
+                'id', flat=True
+            )),
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест импорта JSONL: {status}')
+
+    def test_import_skips_non_string_fields(self):
+        """Поля не-строки пропускают строку, а не обрывают импорт."""
+        errors = self.import_file('notes.jsonl', '\n'.join(
+            json.dumps(row) for row in (
+                {'title': 1, 'text': 'Текст'},
+                {'title': 'Т', 'text': ['список']},
+                {'title': 'Т', 'text': 'Текст', 'slug': {'a': 1}},
+                {'title': None, 'text': 'Целая', 'slug': None},
+            )
+        ))
+        self.assertEqual(
+            list(Note.objects.values_list('text', flat=True)), ['Целая']
+        )
+        for number, field in ((1, 'title'), (2, 'text'), (3, 'slug')):
+            self.assertIn(
+                f'Строка {number} пропущена: поле {field} должно быть '
+                f'строкой',
+                errors,
+            )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест импорта полей не-строк: {status}')
+
+    def test_export_roundtrip_csv(self):
+        """Выгрузка в CSV читается обратно импортом."""
+        Note.objects.create(
+            title='Раз', text='Строка, с запятой', author=self.author
+        )
+        output = self.path / 'notes.csv'
+        call_command(
+            'export_notes', author=self.author.username, output=str(output)
+        )
+        Note.objects.all().delete()
+        self.import_file('notes.csv', output.read_text(encoding='utf-8'))
+        note = Note.objects.get()
+        self.assertEqual(note.text, 'Строка, с запятой')
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест выгрузки и загрузки CSV: {status}')
+
+    def test_streaming_export_endpoint(self):
+        """Выгрузка через сайт отдаётся потоком и только своих заметок."""
+        Note.objects.create(title='Моя', text='Текст', author=self.author)
+        other = User.objects.create(username='other')
+        Note.objects.create(title='Чужая', text='Текст', author=other)
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('notes:export'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.streaming)
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).decode().split(
+                '\n'
+            ) if line
+        ]
+        self.assertEqual([row['title'] for row in rows], ['Моя'])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест потоковой выгрузки: {status}')
+
+
+SHARDS = ['notes_0', 'notes_1']
+
+
+@override_settings(NOTE_SHARDS=SHARDS)
+class TestShardedCommands(TransactionTestCase):
+    """Тест команд с заметками при нескольких шардах.
+
+    Шарды - файлы SQLite во временном каталоге, которые добавляются в
+    соединения только на время теста. Схема мигрируется один раз в
+    заготовку и копируется перед каждым тестом.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = Path(tempfile.mkdtemp())
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': str(cls.tmp / f'{alias}.sqlite3'),
+            }
+            call_command('migrate', database=alias, verbosity=0)
+            connections[alias].close()
+            shutil.copy(
+                cls.tmp / f'{alias}.sqlite3', cls.tmp / f'{alias}.empty'
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections.databases[alias]
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        """Подготовка данных для тестов."""
+        for alias in SHARDS:
+            connections[alias].close()
+            shutil.copy(
+                self.tmp / f'{alias}.empty', self.tmp / f'{alias}.sqlite3'
+            )
+        # Авторы в разных шардах: id идут подряд, хэш раскладывает их
+        # по шардам, так что хватает нескольких пользователей.
+        self.authors = {}
+        index = 0
+        while len(self.authors) < len(SHARDS):
+            user = User.objects.create(username=f'author-{index}')
+            self.authors.setdefault(sharding.shard_for(user), user)
+            index += 1
+        self.path = self.tmp / 'files'
+        self.path.mkdir(exist_ok=True)
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест команд с несколькими шардами.\n')
+
+    def notes_in(self, alias, author):
+        return Note.objects.using(alias).filter(author=author)
+
+    def test_import_export_use_author_shard(self):
+        """Без --database импорт пишет, а экспорт читает шард автора."""
+        for shard, author in self.authors.items():
+            path = self.path / f'{shard}.jsonl'
+            path.write_text(
+                json.dumps({'title': f'Заметка {shard}', 'text': shard}),
+                encoding='utf-8',
+            )
+            call_command(
+                'import_notes', str(path), author=author.username,
+                stdout=StringIO(),
+            )
+        for shard, author in self.authors.items():
+            self.assertEqual(self.notes_in(shard, author).count(), 1)
+            for other in (DEFAULT_DB_ALIAS, *SHARDS):
+                if other != shard:
+                    self.assertFalse(self.notes_in(other, author).exists())
+            self.assertEqual(
+                len(search.search(author, shard, using=shard)), 1
+            )
+            output = self.path / f'{shard}-out.jsonl'
+            call_command(
+                'export_notes', author=author.username, output=str(output)
+            )
+            rows = [
+                json.loads(line)
+                for line in output.read_text(encoding='utf-8').splitlines()
+            ]
+            self.assertEqual(
+                [row['title'] for row in rows], [f'Заметка {shard}']
+            )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест импорта и экспорта по шардам: {status}')
+
+    def test_generate_uses_author_shards(self):
+        """Генератор кладёт пользователей в default, заметки - в шарды."""
+        call_command(
+            'generate_notes', users=4, notes=3, seed=5, stdout=StringIO()
+        )
+        authors = User.objects.filter(username__startswith='bench-5-')
+        self.assertEqual(len(authors), 4)
+        for author in authors:
+            self.assertEqual(
+                self.notes_in(sharding.shard_for(author), author).count(), 3
+            )
+        self.assertFalse(Note.objects.using(DEFAULT_DB_ALIAS).exists())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест генератора по шардам: {status}')
+
+    def create_in_default(self):
+        """Заметки авторов в default, как до включения шардов."""
+        with self.settings(NOTE_SHARDS=[DEFAULT_DB_ALIAS]):
+            for shard, author in self.authors.items():
+                note = Note.objects.create(
+                    title=f'Заметка {shard}', text='Первый текст',
+                    author=author,
+                )
+                note.text = f'Второй текст {shard}'
+                note.save()
+                tag = Tag.for_names(author.pk, ['Идеи'])[0]
+                NoteTag.link([note.pk], [tag.pk])
+
+    def rebalance(self, *args):
+        out = StringIO()
+        call_command('rebalance_shards', *args, stdout=out)
+        return out.getvalue()
+
+    def test_rebalance_dry_run(self):
+        """Пробный запуск только перечисляет переносы."""
+        self.create_in_default()
+        output = self.rebalance('--dry-run')
+        self.assertIn('Авторов к переносу: 2 (пробный запуск)', output)
+        for author in self.authors.values():
+            self.assertIn(f'Автор {author.pk}: default ->', output)
+        self.assertEqual(Note.objects.using(DEFAULT_DB_ALIAS).count(), 2)
+        for shard in SHARDS:
+            self.assertFalse(Note.objects.using(shard).exists())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест пробного переноса: {status}')
+
+    def test_rebalance_moves_authors(self):
+        """Перенос забирает заметки с историей, метками и сводкой."""
+        self.create_in_default()
+        old_ids = dict(
+            Note.objects.using(DEFAULT_DB_ALIAS).values_list(
+                'author_id', 'id'
+            )
+        )
+        self.assertIn('Авторов к переносу: 2', self.rebalance())
+        for shard, author in self.authors.items():
+            note = self.notes_in(shard, author).get()
+            self.assertEqual(note.text, f'Второй текст {shard}')
+            self.assertEqual(note.version, 2)
+            self.assertTrue(rendering.is_current(note.text_hash))
+            self.assertEqual(
+                NoteRevision.objects.using(shard).filter(
+                    note_id=note.pk
+                ).count(),
+                1,
+            )
+            tag = Tag.objects.using(shard).get(author=author)
+            self.assertEqual((tag.name, tag.note_count), ('Идеи', 1))
+            self.assertTrue(
+                NoteTag.objects.using(shard).filter(
+                    note_id=note.pk, tag=tag
+                ).exists()
+            )
+            stats = AuthorStats.objects.using(shard).get(author=author)
+            self.assertEqual(
+                (stats.note_count, stats.char_count),
+                (1, len(note.text)),
+            )
+            self.assertTrue(
+                AuthorVersion.objects.using(shard).filter(
+                    author=author
+                ).exists()
+            )
+            self.assertEqual(
+                list(
+                    NoteChange.objects.using(shard).filter(
+                        author=author
+                    ).order_by('seq').values_list('note_id', 'action')
+                ),
+                [
+                    (old_ids[author.pk], NoteChange.DELETE),
+                    (note.pk, NoteChange.CREATE),
+                ],
+            )
+            self.assertEqual(
+                [pk for pk, _, _ in search.search(
+                    author, 'Второй', using=shard
+                )],
+                [note.pk],
+            )
+        for model in (Note, Tag, NoteRevision, NoteChange, AuthorStats,
+                      AuthorVersion):
+            self.assertFalse(
+                model.objects.using(DEFAULT_DB_ALIAS).exists(), model
+            )
+        self.assertIn('Авторов к переносу: 0', self.rebalance())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест переноса авторов: {status}')
+
+    def test_rebalance_renames_colliding_slugs(self):
+        """Занятый в целевом шарде slug заменяется свободным."""
+        shard, author = next(iter(self.authors.items()))
+        index = 0
+        while True:
+            other = User.objects.create(username=f'neighbour-{index}')
+            if sharding.shard_for(other) == shard:
+                break
+            index += 1
+        Note.objects.using(shard).create(
+            title='Т', text='Т', slug='common', author=other
+        )
+        with self.settings(NOTE_SHARDS=[DEFAULT_DB_ALIAS]):
+            Note.objects.create(
+                title='Т', text='Т', slug='common', author=author
+            )
+        output = self.rebalance()
+        self.assertIn('slug изменён у заметок: 1', output)
+        self.assertEqual(
+            sorted(Note.objects.using(shard).values_list('slug', flat=True)),
+            ['common', 'common-2'],
+        )
+        self.assertEqual(
+            self.notes_in(shard, author).get().slug, 'common-2'
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест переноса со сменой slug: {status}')
+
+
+class TestDatasetAndBenchmark(TestCase):
+    """Тест генератора данных и нагрузочного прогона."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        call_command(
+            'generate_notes', users=2, notes=15, seed=7, stdout=StringIO()
+        )
+        cls.authors = list(
+            User.objects.filter(username__startswith='bench-7-')
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест генератора данных и бенчмарка.\n')
+            print('Подготовка данных для тестов:')
+            print(f'\t>создано пользователей: {len(cls.authors)}')
+
+    def test_dataset_is_reproducible(self):
+        """Тот же seed даёт те же заголовки, slug - через pytils."""
+        titles = list(
+            Note.objects.filter(author=self.authors[0]).order_by(
+                'id'
+            ).values_list('title', 'slug')
+        )
+        self.assertEqual(len(titles), 15)
+        rows = list(dataset.note_rows(random.Random(7), 15))
+        self.assertEqual([title for title, _ in titles],
+                         [row['title'] for row in rows])
+        self.assertTrue(all(slug.isascii() for _, slug in titles))
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест воспроизводимости данных: {status}')
+
+    def test_runner_and_regression_check(self):
+        """Прогон считает перцентили, сравнение ловит рост запросов."""
+        scenarios = benchmark.Runner(self.authors[0], requests=3).run_all()
+        self.assertEqual(set(scenarios), set(benchmark.SCENARIOS))
+        report = {'dataset': {}, 'scenarios': scenarios}
+        self.assertEqual(benchmark.compare(report, report), [])
+        worse = json.loads(json.dumps(report))
+        worse['scenarios']['list']['queries_max'] += 100
+        problems = benchmark.compare(worse, report)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('list', problems[0])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест бенчмарка: {status}')
+
+
+class TestSqliteProfile(TestCase):
+    """Тест профиля SQLite и замера пропускной способности."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест профиля SQLite.\n')
+
+    def test_pragma_statements(self):
+        """busy_timeout идёт первым, мусор в значениях не проходит."""
+        statements = sqlite.pragma_statements(
+            {'journal_mode': 'wal', 'busy_timeout': 5000}
+        )
+        self.assertEqual(statements, [
+            'PRAGMA busy_timeout = 5000', 'PRAGMA journal_mode = wal',
+        ])
+        with self.assertRaises(ValueError):
+            sqlite.pragma_statements({'journal_mode': 'wal; DROP'})
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест PRAGMA профиля: {status}')
+
+    def test_throughput_smoke(self):
+        """Замер из нескольких потоков проходит без ошибок блокировок."""
+        profile = settings.DATABASE_PROFILES['production']
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / 'bench.sqlite3')
+            benchmark.prepare_sqlite(path, rows=100)
+            result = benchmark.sqlite_throughput(
+                path, profile['PRAGMAS'], persistent=True, threads=2,
+                seconds=0.2, rows=100,
+            )
+        self.assertGreater(result['ops_per_s'], 0)
+        self.assertEqual(result['errors'], 0)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест замера SQLite: {status}')
+
+
+class TestStartup(TestCase):
+    """Тест прогрева воркера и профиля холодного старта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест холодного старта.\n')
+
+    def test_warm_up(self):
+        """Прогрев проходит все шаги и компилирует шаблоны."""
+        report = {step: count for step, count, _ in warmup.warm_up()}
+        self.assertEqual(list(report), list(warmup.STEPS))
+        self.assertNotIn(None, report.values())
+        self.assertGreaterEqual(
+            report['templates'],
+            len(list((Path(settings.BASE_DIR) / 'templates').rglob('*.html'))),
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест прогрева: {report} {status}')
+
+    def test_startup_profile(self):
+        """Профиль показывает фазы старта и импорты по пакетам."""
+        out = StringIO()
+        call_command(
+            'startup_profile', url=reverse('users:login'), json=True,
+            stdout=out,
+        )
+        phases = {
+            phase['phase']: phase
+            for phase in json.loads(out.getvalue())['phases']
+        }
+        self.assertEqual(list(phases), [
+            'setup', 'application', 'first_request', 'second_request',
+        ])
+        self.assertEqual(phases['first_request']['status'], HTTPStatus.OK)
+        self.assertIn(
+            'django', [item['module'] for item in phases['setup']['top']]
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест профиля старта: {status}')
+
+
+class TestPruneRevisions(TestCase):
+    """Тест очистки истории правок."""
+    EDITS = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.note = Note.objects.create(
+            title='Заметка', text='Версия 1', author=cls.author
+        )
+        for number in range(2, cls.EDITS + 2):
+            cls.note.text = f'Версия {number}'
+            cls.note.save()
+        NoteRevision.objects.create(
+            author=cls.author, note_id=cls.note.pk + 1000, number=1,
+            title='Сирота', data='Текст', saved_at=cls.note.updated_at,
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест очистки истории правок.\n')
+
+    def prune(self, *args):
+        out = StringIO()
+        call_command('prune_revisions', *args, stdout=out)
+        return out.getvalue()
+
+    def test_keep_latest(self):
+        """Остаются последние ревизии, и они по-прежнему собираются."""
+        self.prune('--keep', '5', '--dry-run')
+        self.assertEqual(NoteRevision.objects.count(), self.EDITS + 1)
+        self.prune('--keep', '5')
+        numbers = list(NoteRevision.objects.values_list('number', flat=True))
+        self.assertEqual(
+            sorted(numbers), list(range(self.EDITS - 4, self.EDITS + 1))
+        )
+        self.assertEqual(
+            NoteRevision.rebuild(self.note, self.EDITS - 4),
+            ('Заметка', f'Версия {self.EDITS - 4}'),
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест --keep: {status}')
+
+    def test_keep_and_age(self):
+        """Свежие ревизии не удаляются, даже если их больше --keep."""
+        self.prune('--keep', '5', '--days', '1')
+        self.assertEqual(NoteRevision.objects.count(), self.EDITS)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест --keep с --days: {status}')
+
+
+class TestRerenderNotes(TestCase):
+    """Тест массовой перерисовки HTML."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        for index in range(5):
+            Note.objects.create(
+                title=f'Заметка {index}', text=f'**{index}**',
+                author=cls.author,
+            )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест перерисовки HTML.\n')
+
+    def rerender(self, *args):
+        out = StringIO()
+        call_command('rerender_notes', '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_new_renderer_version(self):
+        """После смены версии рендерера перерисовываются все заметки."""
+        self.assertIn('перерисовано: 0', self.rerender())
+        with mock.patch.object(rendering, 'RENDERER_VERSION', 2):
+            self.assertIn('перерисовано: 5', self.rerender())
+            self.assertTrue(all(
+                rendering.is_current(text_hash)
+                for text_hash in Note.objects.values_list(
+                    'text_hash', flat=True
+                )
+            ))
+            self.assertIn('перерисовано: 0', self.rerender())
+        self.assertIn('перерисовано: 5', self.rerender())
+        self.assertIn('перерисовано: 5', self.rerender('--force'))
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест перерисовки: {status}')
+
+    def test_concurrent_edit_wins(self):
+        """Правка во время прогона не затирается HTML старого текста."""
+        note = Note.objects.order_by('id').first()
+        render = rendering.render
+        edited = []
+
+        def render_and_edit(text):
+            if not edited:
+                edited.append(True)
+                fresh = Note.objects.get(pk=note.pk)
+                fresh.text = 'Свежий текст правки'
+                fresh.save()
+            return render(text)
+
+        with mock.patch.object(rendering, 'RENDERER_VERSION', 2), \
+                mock.patch.object(rendering, 'render', render_and_edit):
+            self.assertIn('перерисовано: 4', self.rerender())
+            expected_hash = rendering.content_hash('Свежий текст правки')
+        note.refresh_from_db()
+        self.assertEqual(note.text_html, render('Свежий текст правки'))
+        self.assertEqual(note.text_length, len('Свежий текст правки'))
+        self.assertEqual(note.text_hash, expected_hash)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест перерисовки во время правки: {status}')
+
+
+class TestReconcileStats(TestCase):
+    """Тест сверки сводки авторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.reader = User.objects.create(username='Юзер')
+        for index in range(3):
+            Note.objects.create(
+                title=f'Заметка {index}', text='Текст', author=cls.author,
+            )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест сверки сводки.\n')
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_stats', *args, stdout=out)
+        return out.getvalue()
+
+    def test_drift_is_fixed(self):
+        """Расхождения находятся, а без --dry-run исправляются."""
+        self.assertIn('расхождениями: 0', self.reconcile())
+        AuthorStats.objects.filter(author=self.author).update(
+            note_count=10, char_count=1
+        )
+        AuthorStats.objects.create(author=self.reader, note_count=2)
+        self.assertIn('расхождениями: 2', self.reconcile('--dry-run'))
+        self.assertIn('расхождениями: 2', self.reconcile())
+        self.assertEqual(
+            dict(AuthorStats.objects.values_list('author', 'char_count')),
+            {self.author.pk: 15, self.reader.pk: 0},
+        )
+        self.assertIn('расхождениями: 0', self.reconcile())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест сверки: {status}')
+
+
+class TestJobs(TestCase):
+    """Тест очереди фоновых задач."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.note = Note.objects.create(
+            title='Заметка', text='Про молоко', author=cls.author,
+            slug='note',
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест фоновых задач.\n')
+
+    def run_workers(self):
+        out = StringIO()
+        call_command(
+            'run_workers', '--processes', '1', '--burst',
+            stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def test_edit_is_inline_by_default(self):
+        """Без JOBS_DEFERRED правка из формы сразу видна в поиске."""
+        self.client.force_login(self.author)
+        self.client.post(reverse('notes:edit', args=('note',)), data={
+            'title': 'Заметка', 'text': 'Про **кефир**', 'slug': 'note',
+        })
+        self.assertFalse(Job.objects.exists())
+        note = Note.objects.get()
+        self.assertIn('<strong>кефир</strong>', note.text_html)
+        self.assertEqual(
+            [pk for pk, _, _ in search.search(self.author, 'кефир')],
+            [note.pk],
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест правки без очереди: {status}')
+
+    @override_settings(JOBS_DEFERRED=True)
+    def test_edit_is_finished_by_worker(self):
+        """Правка из формы ставит задачи, воркер их выполняет."""
+        self.client.force_login(self.author)
+        url = reverse('notes:edit', args=('note',))
+        for text in ('Про **кефир**', 'Про **кефир** и хлеб'):
+            self.client.post(url, data={
+                'title': 'Заметка', 'text': text, 'slug': 'note',
+            })
+        self.assertEqual(
+            sorted(Job.objects.values_list('task', flat=True)),
+            ['index_note', 'render_note'],
+        )
+        self.assertEqual(Note.objects.get().text_hash, '')
+        self.assertEqual(search.search(self.author, 'кефир'), [])
+
+        self.assertIn('Выполнено задач: 2, упало: 0', self.run_workers())
+        self.assertFalse(Job.objects.exists())
+        note = Note.objects.get()
+        self.assertIn('<strong>кефир</strong> и хлеб', note.text_html)
+        self.assertEqual(
+            [pk for pk, _, _ in search.search(self.author, 'кефир')],
+            [note.pk],
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест правки с фоновыми задачами: {status}')
+
+    @override_settings(JOBS_MAX_ATTEMPTS=2)
+    def test_retry_and_lease(self):
+        """Упавшая задача повторяется позже, просроченная аренда
+        отдаёт задачу другому воркеру."""
+        failing = mock.Mock(side_effect=ValueError('сбой'))
+        with mock.patch.dict(jobs._tasks, {'boom': failing}):
+            jobs.enqueue('boom', self.note)
+            self.assertIn('упало: 1', self.run_workers())
+            job = Job.objects.get()
+            self.assertEqual(job.attempts, 1)
+            self.assertIn('сбой', job.last_error)
+            self.assertIsNone(job.failed_at)
+            self.assertIn('упало: 0', self.run_workers())
+
+            Job.objects.update(run_at=job.created_at)
+            self.assertIn('упало: 1', self.run_workers())
+            job = Job.objects.get()
+            self.assertEqual(job.attempts, 2)
+            self.assertIsNotNone(job.failed_at)
+
+            failing.side_effect = None
+            Job.objects.all().delete()
+            jobs.enqueue('boom', self.note)
+            self.assertEqual(len(jobs.Worker().claim('default')), 1)
+            self.assertIn('Выполнено задач: 0', self.run_workers())
+            Job.objects.update(locked_until=job.created_at)
+            self.assertIn('Выполнено задач: 1', self.run_workers())
+        self.assertEqual(failing.call_count, 3)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест повторов и аренды: {status}')
+
+    def test_enqueue_on_commit(self):
+        """Задача появляется только после фиксации транзакции."""
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue_on_commit('index_note', self.note)
+            jobs.enqueue_on_commit('index_note', self.note)
+            self.assertFalse(Job.objects.exists())
+        self.assertEqual(Job.objects.count(), 1)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест постановки после фиксации: {status}')
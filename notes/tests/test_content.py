@@ -1,9 +1,15 @@
+from http import HTTPStatus
+from unittest import mock
+
 from colorama import Fore
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from django.test import TestCase
 from django.urls import reverse
 
 from notes.models import Note
+from notes.views import NoteDetail
 
 User = get_user_model()
 
@@ -58,3 +64,160 @@ class TestNoteListPage(TestCase):
         if PRINT and response.context['form']:
             status = f'{Fore.GREEN} - да, видит.{Fore.RESET}'
             print(f'Видит ли авторизованный юзер форму? {status}')
+
+
+class TestNoteListPagination(TestCase):
+    """Тест курсорной пагинации списка заметок."""
+    LIST_URL = reverse('notes:list')
+    NOTES_COUNT = 75
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        Note.objects.bulk_create(
+            Note(
+                title=f'Заметка {index}',
+                text='Просто текст.',
+                author=cls.author,
+                slug=f'note-{index}'
+            )
+            for index in range(cls.NOTES_COUNT)
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Tест пагинации списка заметок.\n')
+            print('Подготовка данных для тестов:')
+            print(f'\t>создано заметок: {cls.NOTES_COUNT}')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def test_pages_follow_cursor(self):
+        """Страницы по курсору покрывают все заметки без повторов."""
+        seen = []
+        response = self.client.get(self.LIST_URL)
+        while True:
+            page = response.context['page_obj']
+            seen.extend(note.pk for note in page.object_list)
+            if not page.has_next:
+                break
+            response = self.client.get(
+                self.LIST_URL, {'after': page.next_cursor}
+            )
+        all_pk = list(
+            Note.objects.order_by('id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, all_pk)
+
+        previous = self.client.get(
+            self.LIST_URL, {'before': page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            [note.pk for note in previous.object_list],
+            all_pk[:len(previous.object_list)]
+        )
+
+        if PRINT and seen == all_pk:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест обхода страниц по курсору: {status}')
+
+    def test_list_does_not_load_text(self):
+        """Список не читает из базы текст заметок."""
+        response = self.client.get(self.LIST_URL)
+        note = response.context['object_list'][0]
+        self.assertIn('text', note.get_deferred_fields())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест проекции колонок списка: {status}')
+
+    def test_bad_cursor(self):
+        """Мусор в курсоре даёт 404."""
+        response = self.client.get(self.LIST_URL, {'after': 'abc'})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест некорректного курсора: {status}')
+
+
+class TestFragmentCache(TestCase):
+    """Тест кэширования фрагментов шаблонов."""
+    LIST_URL = reverse('notes:list')
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.note = Note.objects.create(
+            title='Заголовок', text='Текст', author=cls.author
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Tест кэширования фрагментов.\n')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def test_cached_fragment_is_reused(self):
+        """Повторный ответ берёт строки списка из кэша."""
+        version = self.client.get(self.LIST_URL).context['fragment_version']
+        key = make_template_fragment_key('note_list', [version])
+        self.assertIsNotNone(cache.get(key))
+        self.assertIsNotNone(cache.get(make_template_fragment_key(
+            'header', [self.author.pk, self.author.username]
+        )))
+        cache.set(key, 'из кэша')
+        response = self.client.get(self.LIST_URL)
+        self.assertContains(response, 'из кэша')
+        self.assertNotContains(response, self.note.title)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест повторного использования фрагмента: {status}')
+
+    def test_detail_key_has_user(self):
+        """Одинаковая версия у заметок разных авторов не смешивает фрагменты.
+
+        id заметок в разных шардах могут совпасть, поэтому в ключ входит
+        пользователь.
+        """
+        other = User.objects.create(username='Другой')
+        other_note = Note.objects.create(
+            title='Чужой заголовок', text='Текст', author=other
+        )
+        validators = ('1-0-same', self.note.updated_at)
+        with mock.patch.object(
+            NoteDetail, 'get_validators', return_value=validators
+        ):
+            self.client.get(reverse('notes:detail', args=(self.note.slug,)))
+            self.client.force_login(other)
+            response = self.client.get(
+                reverse('notes:detail', args=(other_note.slug,))
+            )
+        self.assertContains(response, other_note.title)
+        self.assertNotContains(response, self.note.title)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест ключа фрагмента заметки: {status}')
+
+    def test_change_bumps_version(self):
+        """Изменение заметки меняет версию, и список рендерится заново."""
+        before = self.client.get(self.LIST_URL).context['fragment_version']
+        self.note.title = 'Новый заголовок'
+        self.note.save()
+        response = self.client.get(self.LIST_URL)
+        self.assertNotEqual(response.context['fragment_version'], before)
+        self.assertContains(response, 'Новый заголовок')
+        response = self.client.get(
+            reverse('notes:detail', args=(self.note.slug,))
+        )
+        self.assertContains(response, 'Новый заголовок')
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест смены версии фрагментов: {status}')
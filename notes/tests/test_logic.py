@@ -1,11 +1,20 @@
+import json
 from http import HTTPStatus
+from unittest import mock
 
 from colorama import Fore
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from notes.models import Note
+from notes import rendering, search, sharding, slugs
+from notes.models import (
+    SNAPSHOT_EVERY, AuthorStats, AuthorVersion, Note, NoteChange, NoteRevision,
+    NoteTag, Tag,
+)
 
 User = get_user_model()
 
@@ -68,6 +77,24 @@ class TestNoteCreation(TestCase):
                 f'{status}'
             )
 
+    def test_create_is_saved_once(self):
+        """Создание через форму пишет в ленту одну запись и метки."""
+        response = self.auth_client.post(
+            self.url, data={**self.form_data, 'tags': 'Идеи'}
+        )
+        self.assertRedirects(response, reverse('notes:success'))
+        note = Note.objects.get()
+        self.assertEqual(
+            list(NoteChange.objects.values_list('note_id', 'action')),
+            [(note.pk, NoteChange.CREATE)],
+        )
+        self.assertEqual(note.version, 1)
+        self.assertEqual([tag.name for tag in note.tags.all()], ['Идеи'])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест однократного сохранения при создании: {status}')
+
 
 class TestNoteEditDelete(TestCase):
     """Тест редактирования и удаления заметок."""
@@ -159,3 +186,829 @@ class TestNoteEditDelete(TestCase):
             print(
                 f'Тест редактирования заметки другим пользователем: {status}'
             )
+
+
+class TestNoteSearch(TestCase):
+    """Тест полнотекстового поиска."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.reader = User.objects.create(username='Юзер')
+        cls.note = Note.objects.create(
+            title='Список покупок',
+            text='Купить молоко и хлеб',
+            author=cls.author,
+        )
+        Note.objects.create(
+            title='Чужая заметка',
+            text='Тоже про молоко',
+            author=cls.reader,
+        )
+        cls.url = reverse('notes:search')
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест полнотекстового поиска:\n')
+            print('Подготовка данных для тестов:')
+            print(f'\t>созданы пользователи: {cls.author}, {cls.reader}')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def search(self, query):
+        response = self.client.get(self.url, {'q': query})
+        return [note.pk for note in response.context['object_list']]
+
+    def test_search_only_own_notes(self):
+        """Поиск находит только заметки автора и подсвечивает совпадения."""
+        response = self.client.get(self.url, {'q': 'молок'})
+        object_list = response.context['object_list']
+        self.assertEqual([note.pk for note in object_list], [self.note.pk])
+        self.assertIn('<mark>', object_list[0].snippet)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест поиска только своих заметок: {status}')
+
+    def test_author_is_part_of_match(self):
+        """Автор отсекается в MATCH, а его id в запросе ничего не находит."""
+        with CaptureQueriesContext(connection) as queries:
+            self.search('молок')
+        sql = next(
+            query['sql'] for query in queries
+            if search.FTS_TABLE in query['sql']
+        )
+        self.assertIn(f'author_id : "{self.author.pk}"', sql)
+        self.assertNotIn('AND author_id =', sql)
+        self.assertEqual(self.search(str(self.author.pk)), [])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест отбора автора в индексе: {status}')
+
+    def test_index_follows_edit_and_delete(self):
+        """Индекс обновляется при сохранении и удалении заметки."""
+        self.note.text = 'Купить кефир'
+        self.note.save()
+        self.assertEqual(self.search('молоко'), [])
+        self.assertEqual(self.search('кефир'), [self.note.pk])
+        self.client.post(reverse('notes:delete', args=(self.note.slug,)))
+        self.assertEqual(self.search('кефир'), [])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест синхронизации индекса: {status}')
+
+    def test_query_syntax_is_escaped(self):
+        """Операторы FTS5 во вводе не ломают запрос."""
+        self.assertEqual(self.search('"молоко AND ('), [])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест экранирования запроса: {status}')
+
+
+class TestSlugAllocation(TestCase):
+    """Тест выдачи уникальных slug."""
+    TITLE = 'Одинаковый заголовок'
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.url = reverse('notes:add')
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест выдачи уникальных slug:\n')
+            print('Подготовка данных для тестов:')
+            print(f'\t>создан пользователь: {cls.author}')
+
+    def test_same_titles_get_suffixes(self):
+        """Одинаковые заголовки получают slug с суффиксами -2, -3."""
+        self.client.force_login(self.author)
+        for _ in range(3):
+            self.client.post(self.url, data={'title': self.TITLE, 'text': 'Т'})
+        base = slugs.base_slug(self.TITLE)
+        all_slugs = set(Note.objects.values_list('slug', flat=True))
+        self.assertEqual(all_slugs, {base, f'{base}-2', f'{base}-3'})
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест суффиксов slug: {status}')
+
+    def test_allocation_uses_one_query(self):
+        """Свободный slug подбирается одним запросом."""
+        for _ in range(5):
+            Note.objects.create(title=self.TITLE, text='Т', author=self.author)
+        with self.assertNumQueries(1):
+            slug = slugs.allocate_slug(self.TITLE, Note.objects)
+        self.assertEqual(slug, f'{slugs.base_slug(self.TITLE)}-6')
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест одного запроса на slug: {status}')
+
+    def test_batch_allocation(self):
+        """Пачка заголовков получает slug, уникальные и внутри пачки."""
+        Note.objects.create(title=self.TITLE, text='Т', author=self.author)
+        with self.assertNumQueries(1):
+            batch = slugs.allocate_slugs(
+                [self.TITLE, self.TITLE, 'Другой'], Note.objects
+            )
+        base = slugs.base_slug(self.TITLE)
+        self.assertEqual(batch, [f'{base}-2', f'{base}-3', 'drugoj'])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест выдачи slug пачкой: {status}')
+
+
+class TestSharding(TestCase):
+    """Тест выбора шарда по автору."""
+    SHARDS = ['notes_0', 'notes_1', 'notes_2']
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.router = sharding.AuthorShardRouter()
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест шардирования:\n')
+
+    def test_single_shard_is_default(self):
+        """Без настройки шардов всё лежит в default."""
+        self.assertEqual(sharding.shard_for(self.author), 'default')
+        note = Note.objects.create(title='Т', text='Т', author=self.author)
+        self.assertEqual(note._state.db, 'default')
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест одного шарда: {status}')
+
+    def test_router_follows_author(self):
+        """Заметки идут в шард автора, остальные приложения - в default."""
+        with self.settings(NOTE_SHARDS=self.SHARDS):
+            shards = {sharding.shard_for(author_id)
+                      for author_id in range(100)}
+            self.assertEqual(shards, set(self.SHARDS))
+            expected = sharding.shard_for(self.author.pk)
+            self.assertEqual(sharding.shard_for(self.author), expected)
+            note = Note(author=self.author)
+            self.assertEqual(
+                self.router.db_for_write(Note, instance=note), expected
+            )
+            self.assertEqual(
+                self.router.db_for_read(Note, instance=self.author), expected
+            )
+            self.assertIsNone(self.router.db_for_write(User))
+            self.assertTrue(
+                self.router.allow_migrate('notes_1', 'notes', 'note')
+            )
+            self.assertFalse(
+                self.router.allow_migrate('notes_1', 'auth', 'user')
+            )
+            self.assertTrue(self.router.allow_relation(note, self.author))
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест роутера шардов: {status}')
+
+
+class TestCompressedText(TestCase):
+    """Тест сжатого хранения длинных текстов."""
+    LONG_TEXT = 'ERROR соединение сброшено, повтор через 5 секунд\n' * 500
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.long = Note.objects.create(
+            title='Лог', text=cls.LONG_TEXT + 'уникальнаястрока',
+            author=cls.author,
+        )
+        cls.short = Note.objects.create(
+            title='Коротко', text='Короткий текст', author=cls.author
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест сжатия текстов:\n')
+
+    def raw_text(self, note):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT typeof(text), length(CAST(text AS BLOB)) '
+                'FROM notes_note WHERE id = %s', [note.pk]
+            )
+            return cursor.fetchone()
+
+    def test_long_text_is_compressed(self):
+        """Длинный текст лежит сжатым, короткий - как есть."""
+        kind, size = self.raw_text(self.long)
+        self.assertEqual(kind, 'blob')
+        self.assertLess(size, len(self.LONG_TEXT.encode()) // 10)
+        self.assertEqual(self.raw_text(self.short)[0], 'text')
+        self.assertEqual(
+            Note.objects.get(pk=self.long.pk).text,
+            self.LONG_TEXT + 'уникальнаястрока',
+        )
+        self.assertEqual(
+            Note.objects.filter(pk=self.long.pk).values_list(
+                'text', flat=True
+            ).get(),
+            self.LONG_TEXT + 'уникальнаястрока',
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест хранения сжатого текста: {status}')
+
+    def test_index_reads_compressed_text(self):
+        """Перестроенный в SQL индекс видит текст сжатых заметок."""
+        search.rebuild_index()
+        results = search.search(self.author, 'уникальнаястрока')
+        self.assertEqual([pk for pk, *_ in results], [self.long.pk])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест индекса по сжатому тексту: {status}')
+
+    def test_delete_does_not_load_text(self):
+        """Подтверждение удаления не читает текст заметки."""
+        self.client.force_login(self.author)
+        response = self.client.get(
+            reverse('notes:delete', args=(self.long.slug,))
+        )
+        self.assertIn('text', response.context['object'].get_deferred_fields())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест удаления без текста: {status}')
+
+
+class TestRevisions(TestCase):
+    """Тест истории правок."""
+    LINES = 200
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.reader = User.objects.create(username='Юзер')
+        cls.note = Note.objects.create(
+            title='Версия 1',
+            text=''.join(f'Строка {index}\n' for index in range(cls.LINES)),
+            author=cls.author,
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест истории правок:\n')
+
+    def edit(self, note, number):
+        lines = note.text.splitlines(keepends=True)
+        lines[number % self.LINES] = f'Правка {number}\n'
+        note.title = f'Версия {number + 1}'
+        note.text = ''.join(lines)
+        note.save()
+
+    def test_every_version_rebuilds(self):
+        """Любая версия собирается из дельт и полных копий."""
+        note = Note.objects.get(pk=self.note.pk)
+        versions = {1: (note.title, note.text)}
+        for number in range(1, 2 * SNAPSHOT_EVERY + 5):
+            self.edit(note, number)
+            versions[note.version] = (note.title, note.text)
+        self.assertEqual(note.version, 2 * SNAPSHOT_EVERY + 5)
+        for number in range(1, note.version):
+            with self.subTest(number=number):
+                self.assertEqual(
+                    NoteRevision.rebuild(note, number), versions[number]
+                )
+        revisions = NoteRevision.objects.filter(note_id=note.pk)
+        self.assertEqual(
+            list(revisions.filter(snapshot=True).values_list(
+                'number', flat=True
+            ).order_by('number')),
+            [SNAPSHOT_EVERY, 2 * SNAPSHOT_EVERY],
+        )
+        delta = revisions.filter(snapshot=False).first()
+        self.assertLess(len(delta.data), len(note.text) // 20)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест сборки версий: {status}')
+
+    def test_unchanged_save_keeps_version(self):
+        """Сохранение без изменений не создаёт ревизию."""
+        note = Note.objects.get(pk=self.note.pk)
+        note.save()
+        self.assertEqual(note.version, 1)
+        self.assertFalse(NoteRevision.objects.exists())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест сохранения без изменений: {status}')
+
+    def test_history_and_restore(self):
+        """История видна только автору, восстановление - новая правка."""
+        note = Note.objects.get(pk=self.note.pk)
+        original = note.text
+        self.edit(note, 1)
+        history_url = reverse('notes:history', args=(note.slug,))
+        revision_url = reverse('notes:revision', args=(note.slug, 1))
+
+        self.client.force_login(self.reader)
+        for url in (history_url, revision_url):
+            self.assertEqual(
+                self.client.get(url).status_code, HTTPStatus.NOT_FOUND
+            )
+
+        self.client.force_login(self.author)
+        response = self.client.get(history_url)
+        self.assertEqual(list(response.context['revisions']), [
+            NoteRevision.objects.get(note_id=note.pk, number=1)
+        ])
+        response = self.client.get(revision_url)
+        self.assertEqual(response.context['revision_text'], original)
+        self.assertEqual(
+            self.client.get(
+                reverse('notes:revision', args=(note.slug, 7))
+            ).status_code,
+            HTTPStatus.NOT_FOUND,
+        )
+        response = self.client.post(revision_url)
+        self.assertRedirects(
+            response, reverse('notes:detail', args=(note.slug,))
+        )
+        note.refresh_from_db()
+        self.assertEqual((note.title, note.text), ('Версия 1', original))
+        self.assertEqual(note.version, 3)
+
+        note.delete()
+        self.assertFalse(NoteRevision.objects.exists())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест истории и восстановления: {status}')
+
+
+class TestMarkdown(TestCase):
+    """Тест отрисовки Markdown."""
+    TEXT = 'Текст с **жирным** словом.\n\n<script>alert(1)</script>'
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.note = Note.objects.create(
+            title='Markdown', text=cls.TEXT, author=cls.author
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест отрисовки Markdown:\n')
+
+    def test_rendered_on_save(self):
+        """HTML считается при сохранении и очищается от опасных тегов."""
+        note = Note.objects.get(pk=self.note.pk)
+        self.assertIn('<strong>жирным</strong>', note.text_html)
+        self.assertNotIn('<script>', note.text_html)
+        self.assertEqual(note.text_hash, rendering.content_hash(self.TEXT))
+        with mock.patch(
+            'notes.rendering.render', wraps=rendering.render
+        ) as render:
+            note.title = 'Новый заголовок'
+            note.save()
+            self.assertEqual(render.call_count, 0)
+            note.text = 'Другой текст'
+            note.save()
+            self.assertEqual(render.call_count, 1)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест отрисовки при сохранении: {status}')
+
+    def test_rendered_lazily(self):
+        """Заметка из bulk_create отрисовывается при первом просмотре."""
+        Note.objects.bulk_create([Note(
+            title='Из импорта', text='*курсив*', author=self.author,
+            slug='imported',
+        )])
+        before = Note.objects.values_list('updated_at', 'version').get(
+            slug='imported'
+        )
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('notes:detail', args=('imported',)))
+        self.assertContains(response, '<em>курсив</em>')
+        note = Note.objects.get(slug='imported')
+        self.assertEqual(note.text_hash, rendering.content_hash('*курсив*'))
+        self.assertEqual((note.updated_at, note.version), before)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест ленивой отрисовки: {status}')
+
+
+class TestTags(TestCase):
+    """Тест меток и их счётчиков."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.reader = User.objects.create(username='Юзер')
+        cls.notes = [
+            Note.objects.create(
+                title=f'Заметка {index}', text='Текст', author=cls.author
+            )
+            for index in range(3)
+        ]
+        cls.foreign = Note.objects.create(
+            title='Чужая', text='Текст', author=cls.reader
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест меток:\n')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def counts(self):
+        return dict(
+            Tag.objects.filter(author=self.author).values_list(
+                'slug', 'note_count'
+            )
+        )
+
+    def test_form_keeps_counts(self):
+        """Метки из формы создаются, а счётчики следуют за правками."""
+        note = self.notes[0]
+        url = reverse('notes:edit', args=(note.slug,))
+        self.client.post(url, data={
+            'title': note.title, 'text': note.text, 'slug': note.slug,
+            'tags': 'Работа, идеи, работа',
+        })
+        self.assertEqual(self.counts(), {'rabota': 1, 'idei': 1})
+        response = self.client.get(url)
+        self.assertEqual(
+            response.context['form'].initial['tags'], 'идеи, Работа'
+        )
+        self.client.post(url, data={
+            'title': note.title, 'text': note.text, 'slug': note.slug,
+            'tags': 'Идеи, Планы',
+        })
+        self.assertEqual(self.counts(), {'rabota': 0, 'idei': 1, 'planyi': 1})
+        self.client.post(reverse('notes:delete', args=(note.slug,)))
+        self.assertEqual(self.counts(), {'rabota': 0, 'idei': 0, 'planyi': 0})
+        self.assertFalse(NoteTag.objects.exists())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест счётчиков при правке в форме: {status}')
+
+    def test_form_tags_in_note_transaction(self):
+        """Сбой записи меток откатывает и саму правку с версией автора."""
+        note = self.notes[1]
+        version = AuthorVersion.objects.get(author=self.author).version
+        with mock.patch.object(
+            NoteTag, 'set_for_note', side_effect=RuntimeError('сбой')
+        ), self.assertRaises(RuntimeError):
+            self.client.post(reverse('notes:edit', args=(note.slug,)), data={
+                'title': 'Новый заголовок', 'text': note.text,
+                'slug': note.slug, 'tags': 'Работа',
+            })
+        self.assertEqual(Note.objects.get(pk=note.pk).title, note.title)
+        self.assertEqual(
+            AuthorVersion.objects.get(author=self.author).version, version
+        )
+        self.assertFalse(Tag.objects.filter(author=self.author).exists())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест меток в транзакции заметки: {status}')
+
+    def test_bulk_assign(self):
+        """Пачка меток назначается и снимается фиксированным числом
+        запросов и только у своих заметок."""
+        url = reverse('notes:api_tags')
+        note_slugs = [note.slug for note in self.notes]
+        # Включая сессию и пользователя: без общего кэша - из базы.
+        with self.assertNumQueries(15):
+            response = self.client.post(url, json.dumps({
+                'notes': note_slugs + [self.foreign.slug],
+                'add': ['Общая', 'Вторая'],
+            }), content_type='application/json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json(), {
+            'changed': 6, 'not_found': [self.foreign.slug],
+        })
+        self.assertEqual(self.counts(), {'obschaya': 3, 'vtoraya': 3})
+        response = self.client.post(url, json.dumps({
+            'notes': note_slugs[:2], 'add': ['Общая'], 'remove': ['Вторая'],
+        }), content_type='application/json')
+        self.assertEqual(response.json()['changed'], 2)
+        self.assertEqual(self.counts(), {'obschaya': 3, 'vtoraya': 1})
+
+        response = self.client.post(
+            reverse('notes:api_batch'),
+            json.dumps({'delete': note_slugs[1:]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.counts(), {'obschaya': 1, 'vtoraya': 0})
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест массового назначения меток: {status}')
+
+    def test_assign_records_changed_notes_only(self):
+        """В журнал и updated_at попадают только заметки с новыми связями."""
+        tag, = Tag.for_names(self.author.pk, ['Важное'])
+        first, *rest = [(note.pk, note.slug) for note in self.notes]
+        NoteTag.assign(self.author.pk, [first], add=[tag])
+        last_seq = NoteChange.objects.filter(
+            author=self.author
+        ).order_by('-seq').values_list('seq', flat=True).first()
+        updated_at = Note.objects.get(pk=first[0]).updated_at
+
+        changed = NoteTag.assign(self.author.pk, [first, *rest], add=[tag])
+        self.assertEqual(changed, len(rest))
+        self.assertEqual(
+            sorted(NoteChange.objects.filter(
+                author=self.author, seq__gt=last_seq
+            ).values_list('note_id', flat=True)),
+            [pk for pk, _ in rest],
+        )
+        self.assertEqual(Note.objects.get(pk=first[0]).updated_at, updated_at)
+
+        last_seq = NoteChange.objects.filter(
+            author=self.author
+        ).order_by('-seq').values_list('seq', flat=True).first()
+        NoteTag.assign(self.author.pk, rest, remove=[tag])
+        NoteTag.assign(self.author.pk, rest, remove=[tag])
+        self.assertEqual(
+            sorted(NoteChange.objects.filter(
+                author=self.author, seq__gt=last_seq
+            ).values_list('note_id', flat=True)),
+            [pk for pk, _ in rest],
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест журнала при назначении меток: {status}')
+
+    def test_list_filter(self):
+        """Фильтр по метке видит только заметки автора с этой меткой."""
+        tag, = Tag.for_names(self.author.pk, ['Важное'])
+        NoteTag.assign(
+            self.author.pk, [(self.notes[1].pk, self.notes[1].slug)],
+            add=[tag],
+        )
+        url = reverse('notes:list')
+        response = self.client.get(url, {'tag': tag.slug})
+        self.assertEqual(
+            list(response.context['object_list']), [self.notes[1]]
+        )
+        self.assertContains(response, 'Важное</a>\n        (1)')
+        response = self.client.get(url, {'tag': 'net-takoy'})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.client.force_login(self.reader)
+        response = self.client.get(url, {'tag': tag.slug})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест фильтра списка по метке: {status}')
+
+
+class TestAuthorStats(TestCase):
+    """Тест сводки автора на домашней странице."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.note = Note.objects.create(
+            title='Первая', text='12345', author=cls.author, slug='first'
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест сводки автора:\n')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def stats(self):
+        return AuthorStats.objects.values_list(
+            'note_count', 'char_count'
+        ).get(author=self.author)
+
+    def test_stats_follow_writes(self):
+        """Сводка меняется вместе с заметками и не читает notes_note."""
+        self.assertEqual(self.stats(), (1, 5))
+        note = Note.objects.get(pk=self.note.pk)
+        note.text = '1234567'
+        note.save()
+        self.assertEqual(self.stats(), (1, 7))
+        note = Note.objects.defer('text').get(pk=self.note.pk)
+        note.title = 'Только заголовок'
+        note.save()
+        self.assertEqual(self.stats(), (1, 7))
+
+        response = self.client.post(
+            reverse('notes:api_batch'),
+            json.dumps({
+                'create': [{'title': 'Вторая', 'text': '123'}],
+                'update': [{'slug': 'first', 'text': '1'}],
+            }),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.stats(), (2, 4))
+        self.client.post(reverse('notes:delete', args=('first',)))
+        self.assertEqual(self.stats(), (1, 3))
+
+        # Сессия, пользователь и одна строка сводки.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('notes:home'))
+        self.assertContains(response, 'Заметок: 1, символов: 3')
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест сводки: {status}')
+
+    def test_stats_survive_slug_collision(self):
+        """Повтор сохранения после занятого slug учитывает текст."""
+        note = Note(title='Вторая', text='1234567890', author=self.author)
+        with mock.patch.object(
+            slugs, 'allocate_slug', side_effect=['first', 'vtoraya']
+        ):
+            note.save()
+        self.assertEqual(note.slug, 'vtoraya')
+        self.assertTrue(rendering.is_current(note.text_hash))
+        self.assertEqual(self.stats(), (2, 15))
+
+        note.text = '12'
+        note.slug = ''
+        with mock.patch.object(
+            slugs, 'allocate_slug', side_effect=['first', 'vtoraya-2']
+        ):
+            note.save()
+        self.assertEqual(self.stats(), (2, 7))
+        self.assertEqual(
+            Note.objects.get(pk=note.pk).text_html, rendering.render('12')
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест сводки при занятом slug: {status}')
+
+
+class TestBulkActions(TestCase):
+    """Тест действий над отмеченными в списке заметками."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.reader = User.objects.create(username='Юзер')
+        cls.notes = [
+            Note.objects.create(
+                title=f'Заметка {index}', text='Текст', author=cls.author
+            )
+            for index in range(6)
+        ]
+        cls.foreign = Note.objects.create(
+            title='Чужая', text='Текст', author=cls.reader
+        )
+        cls.url = reverse('notes:bulk')
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест массовых действий:\n')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+        # Сессия и пользователь оседают в кэше и не мешают счёту SQL.
+        self.client.get(reverse('notes:home'))
+
+    def post(self, action, notes, tag='', **extra):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {
+                'action': action,
+                'notes': [note.pk for note in notes],
+                'tag': tag,
+                **extra,
+            })
+        return response, len(queries)
+
+    def test_delete(self):
+        """Удаление стоит одинаково для 2 и 4 заметок, чужие не трогает."""
+        response, two = self.post('delete', self.notes[:2])
+        self.assertRedirects(response, reverse('notes:list'))
+        _, four = self.post('delete', self.notes[2:5] + [self.foreign])
+        self.assertEqual(two, four)
+        self.assertEqual(
+            list(Note.objects.filter(author=self.author)), self.notes[5:]
+        )
+        self.assertTrue(Note.objects.filter(pk=self.foreign.pk).exists())
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.author).note_count, 1
+        )
+        self.assertEqual(
+            [pk for pk, _, _ in search.search(self.author, 'Текст')],
+            [self.notes[5].pk],
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест массового удаления ({two} SQL): {status}')
+
+    def test_tags(self):
+        """Метка ставится и снимается у отмеченных, список обновляется."""
+        list_url = reverse('notes:list')
+        etag = self.client.get(list_url)['ETag']
+        response, _ = self.post(
+            'add_tag', self.notes[:1], tag='Важное', next=f'{list_url}?x=1'
+        )
+        self.assertRedirects(
+            response, f'{list_url}?x=1', fetch_redirect_response=False
+        )
+        _, two = self.post('add_tag', self.notes[1:3], tag='Важное')
+        _, four = self.post('add_tag', self.notes[3:6] + [self.foreign],
+                            tag='Важное')
+        self.assertEqual(two, four)
+        tag = Tag.objects.get(author=self.author)
+        self.assertEqual(tag.note_count, 6)
+        self.post('remove_tag', self.notes[1:4] + [self.foreign], tag='важное')
+        tag.refresh_from_db()
+        self.assertEqual(tag.note_count, 3)
+        self.assertEqual(
+            self.client.get(list_url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.OK,
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест массовых меток ({two} SQL): {status}')
+
+    def test_list_etag_follows_csrf_token(self):
+        """Смена CSRF-токена (как при входе) сбрасывает 304 списка."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.author)
+        list_url = reverse('notes:list')
+        etag = client.get(list_url)['ETag']
+        self.assertEqual(
+            client.get(list_url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.NOT_MODIFIED,
+        )
+        cookie = settings.CSRF_COOKIE_NAME
+        client.cookies[cookie] = Client().get(
+            reverse('users:login')
+        ).cookies[cookie].value
+        response = client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+        response = client.post(self.url, {
+            'action': 'delete',
+            'notes': [self.notes[0].pk],
+            'csrfmiddlewaretoken': response.context['csrf_token'],
+        })
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест ETag списка с CSRF-токеном: {status}')
+
+    def test_invalid(self):
+        """Без заметок или без метки ничего не меняется."""
+        for action, notes, tag in (
+            ('delete', [], ''),
+            ('add_tag', self.notes[:1], '  '),
+        ):
+            with self.subTest(action=action):
+                response, _ = self.post(action, notes, tag=tag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertTrue(response.context['form'].errors)
+        response = self.client.post(self.url, {
+            'action': 'delete', 'notes': [self.notes[0].pk],
+            'next': 'https://example.com/',
+        })
+        self.assertRedirects(response, reverse('notes:list'))
+        self.assertEqual(Note.objects.filter(author=self.author).count(), 5)
+        self.assertFalse(Tag.objects.exists())
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест некорректных массовых действий: {status}')
@@ -0,0 +1,198 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+from colorama import Fore
+from django.contrib.auth import get_user_model
+from django.db import connections, router
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from notes import replicas
+from notes.models import Note
+
+User = get_user_model()
+
+
+PRINT: bool = True
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS={'default': [REPLICA]})
+class TestReadReplicas(TransactionTestCase):
+    """Тест чтения с отстающей реплики.
+
+    Реплика - отдельный файл SQLite, который добавляется в соединения
+    только на время теста и наполняется копированием основной базы.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        connections.databases[REPLICA] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(Path(cls.tmp) / 'replica.sqlite3'),
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        """Подготовка данных для тестов."""
+        self.author = User.objects.create(username='Автор')
+        self.note = Note.objects.create(
+            title='Старый заголовок', text='Текст', author=self.author,
+            slug='note',
+        )
+        self.sync()
+        self.writer = Client()
+        self.writer.force_login(self.author)
+        self.reader = Client()
+        self.reader.force_login(self.author)
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест реплик для чтения.\n')
+
+    def sync(self):
+        """Копирует основную базу в реплику, как это делала бы репликация."""
+        replica = connections[REPLICA]
+        replica.ensure_connection()
+        connections['default'].ensure_connection()
+        connections['default'].connection.backup(replica.connection)
+
+    def edit(self):
+        return self.writer.post(
+            reverse('notes:edit', args=(self.note.slug,)),
+            {'title': 'Новый заголовок', 'text': 'Текст', 'slug': 'note'},
+        )
+
+    def title_for(self, client):
+        response = client.get(reverse('notes:detail', args=(self.note.slug,)))
+        return response.context['object'].title
+
+    def test_writes_go_to_primary(self):
+        """Запись идёт в основную базу, реплика отстаёт до синхронизации."""
+        self.edit()
+        self.assertEqual(
+            Note.objects.using('default').get(pk=self.note.pk).title,
+            'Новый заголовок',
+        )
+        self.assertEqual(
+            Note.objects.using(REPLICA).get(pk=self.note.pk).title,
+            'Старый заголовок',
+        )
+        self.assertFalse(
+            router.allow_migrate(REPLICA, 'notes', model_name='note')
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест записи в основную базу: {status}')
+
+    def test_read_your_writes(self):
+        """Автор изменения читает из основной базы, остальные - из реплики."""
+        response = self.edit()
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.title_for(self.writer), 'Новый заголовок')
+        self.assertEqual(self.title_for(self.reader), 'Старый заголовок')
+        self.sync()
+        self.assertEqual(self.title_for(self.reader), 'Новый заголовок')
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест «читаю свои записи»: {status}')
+
+    def test_pin_expires(self):
+        """Просроченная привязка снова отправляет чтения в реплику."""
+        with self.settings(REPLICA_PIN_SECONDS=0):
+            self.edit()
+            self.assertEqual(self.title_for(self.writer), 'Старый заголовок')
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест истечения привязки: {status}')
+
+
+LAGGING = ('replica_a', 'replica_b')
+
+
+@override_settings(DATABASE_REPLICAS={'default': list(LAGGING)})
+class TestLaggingReplicas(TransactionTestCase):
+    """Тест двух реплик, отстающих на разное число правок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        for alias in LAGGING:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': str(Path(cls.tmp) / f'{alias}.sqlite3'),
+            }
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in LAGGING:
+            connections[alias].close()
+            del connections.databases[alias]
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        """Подготовка данных для тестов."""
+        self.author = User.objects.create(username='Автор')
+        self.note = Note.objects.create(
+            title='Старый заголовок', text='Текст', author=self.author,
+            slug='note',
+        )
+        self.sync('replica_a')
+        self.note.title = 'Новый заголовок'
+        self.note.save()
+        self.sync('replica_b')
+        self.reader = Client()
+        self.reader.force_login(self.author)
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест реплик с разным отставанием.\n')
+
+    def sync(self, alias):
+        replica = connections[alias]
+        replica.ensure_connection()
+        connections['default'].ensure_connection()
+        connections['default'].connection.backup(replica.connection)
+
+    def test_one_replica_per_request(self):
+        """Все чтения запроса идут в одну реплику, запросы - по кругу."""
+        used = []
+        for name, args in (
+            ('notes:list', ()), ('notes:list', ()),
+            ('notes:detail', ('note',)), ('notes:detail', ('note',)),
+        ):
+            with CaptureQueriesContext(connections[LAGGING[0]]) as first, \
+                    CaptureQueriesContext(connections[LAGGING[1]]) as second:
+                response = self.reader.get(reverse(name, args=args))
+            replicas_read = [
+                alias for alias, queries in zip(LAGGING, (first, second))
+                if len(queries)
+            ]
+            self.assertEqual(len(replicas_read), 1, name)
+            used.append(replicas_read[0])
+            expected = (
+                'Старый заголовок' if replicas_read[0] == 'replica_a'
+                else 'Новый заголовок'
+            )
+            self.assertContains(response, expected)
+        self.assertEqual(set(used), set(LAGGING))
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'Тест одной реплики на запрос: {status}')
@@ -1,11 +1,23 @@
+import gzip
+import shutil
+import tempfile
+import threading
 from http import HTTPStatus
+from pathlib import Path
 
 from colorama import Fore
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.templatetags.static import static
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from notes.models import Note
+from yanote import auth, metrics, profiling, ratelimit, staticfiles
 
 User = get_user_model()
 
@@ -104,3 +116,593 @@ class TestRouters(TestCase):
                 if PRINT:
                     status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
                     print(f'\t{status} -> {redirect_url}')
+
+
+class TestConditionalGet(TestCase):
+    """Тест условного GET для списка и страницы заметки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.note = Note.objects.create(
+            title='Заголовок',
+            text='Текст',
+            author=cls.author,
+        )
+        cls.urls = (
+            reverse('notes:list'),
+            reverse('notes:detail', args=(cls.note.slug,)),
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест условного GET.\n')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def test_not_modified(self):
+        """Повторный запрос с валидаторами получает 304."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                etag = response['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+                response = self.client.get(
+                    url,
+                    HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+
+                if PRINT:
+                    status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+                    print(f'\t{status} -> {url}')
+
+    def test_modified_after_edit(self):
+        """После изменения заметки ETag меняется."""
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        self.note.text = 'Новый текст'
+        self.note.save()
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+                if PRINT:
+                    status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+                    print(f'\t{status} -> {url}')
+
+
+class TestMetrics(TestCase):
+    """Тест эндпоинта метрик."""
+    URL = reverse('metrics')
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест метрик.\n')
+
+    def test_metrics_collected(self):
+        """Запросы попадают в метрики по имени URL."""
+        self.client.force_login(self.author)
+        self.client.get(reverse('notes:list'))
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        body = response.content.decode()
+        self.assertIn(
+            'yanote_request_duration_seconds_count{view="notes:list"}', body
+        )
+        self.assertIn(
+            'yanote_db_queries_per_request_sum{view="notes:list"}', body
+        )
+
+        if PRINT:
+            status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+            print(f'\t{status} -> {self.URL}')
+
+    def test_metrics_internal_only(self):
+        """С внешнего адреса метрики не видны."""
+        response = self.client.get(self.URL, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+        if PRINT:
+            status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+            print(f'\t{status} -> {self.URL} (внешний адрес)')
+
+    def test_metrics_behind_proxy(self):
+        """Через прокси без токена метрики не видны, с токеном - видны."""
+        response = self.client.get(
+            self.URL, HTTP_X_FORWARDED_FOR='203.0.113.7'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        with override_settings(METRICS_TOKEN='secret'):
+            for authorization, expected in (
+                ('', HTTPStatus.NOT_FOUND),
+                ('Bearer wrong', HTTPStatus.NOT_FOUND),
+                ('Bearer secret', HTTPStatus.OK),
+            ):
+                with self.subTest(authorization=authorization):
+                    response = self.client.get(
+                        self.URL, HTTP_AUTHORIZATION=authorization,
+                        REMOTE_ADDR='203.0.113.7',
+                    )
+                    self.assertEqual(response.status_code, expected)
+
+        if PRINT:
+            status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+            print(f'\t{status} -> {self.URL} (токен)')
+
+    def test_dead_threads_are_retired(self):
+        """Серии завершившихся потоков сливаются и не копятся."""
+        metrics.reset()
+
+        def request():
+            metrics.observe('test:view', 0.01, queries=2)
+
+        for _ in range(20):
+            thread = threading.Thread(target=request)
+            thread.start()
+            thread.join()
+        series = metrics.snapshot()['test:view']
+        self.assertEqual((series.count, series.queries), (20, 40))
+        self.assertTrue(all(
+            thread.is_alive() for thread, _ in metrics._shards.values()
+        ))
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'\t{status} -> потоки метрик')
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['yanote.auth.CachedModelBackend'],
+)
+class TestCachedAuth(TestCase):
+    """Тест сессии и пользователя из кэша.
+
+    В тестах один процесс, поэтому кэша locmem для них достаточно.
+    """
+    # SQL-запросов на маршрут, когда сессия и пользователь уже в кэше.
+    ROUTE_QUERIES = {
+        'notes:home': 1,
+        'notes:list': 3,
+        'notes:detail': 2,
+        'notes:add': 0,
+        'notes:edit': 2,
+        'notes:delete': 1,
+        'notes:search': 0,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.note = Note.objects.create(
+            title='Заголовок', text='Текст', author=cls.author
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест кэша сессий и пользователей.\n')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+        self.client.get(reverse('notes:home'))
+
+    def url(self, name):
+        if name in ('notes:detail', 'notes:edit', 'notes:delete'):
+            return reverse(name, args=(self.note.slug,))
+        return reverse(name)
+
+    def test_route_queries(self):
+        """Тёплый запрос не читает ни django_session, ни auth_user."""
+        for name, expected in self.ROUTE_QUERIES.items():
+            with self.subTest(name=name):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(self.url(name))
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+                if PRINT:
+                    status = f'{Fore.GREEN}{expected}{Fore.RESET}'
+                    print(f'\t{status} SQL -> {name}')
+
+    def test_logout_invalidates(self):
+        """После выхода закэшированная сессия не действует."""
+        self.client.get(reverse('users:logout'))
+        response = self.client.get(self.url('notes:list'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+        if PRINT:
+            status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+            print(f'\t{status} -> после выхода')
+
+    def test_password_change_invalidates(self):
+        """Смена пароля сразу завершает старые сессии."""
+        self.author.set_password('new-password-123')
+        self.author.save()
+        response = self.client.get(self.url('notes:list'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+        if PRINT:
+            status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+            print(f'\t{status} -> после смены пароля')
+
+    def test_shared_cache_check(self):
+        """check --deploy требует общий кэш для сессий и пользователей."""
+        self.assertEqual(
+            [error.id for error in auth.check_shared_cache()],
+            ['yanote.E001', 'yanote.E001'],
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES={'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory,
+            }}):
+                self.assertEqual(auth.check_shared_cache(), [])
+        with override_settings(
+            SESSION_ENGINE='django.contrib.sessions.backends.db',
+            AUTHENTICATION_BACKENDS=[
+                'django.contrib.auth.backends.ModelBackend'
+            ],
+        ):
+            self.assertEqual(auth.check_shared_cache(), [])
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'\t{status} -> проверка общего кэша')
+
+
+class TestStaticFiles(SimpleTestCase):
+    """Тест сборки статики с хэшами и .gz и её раздачи."""
+    NAME = 'css/site.css'
+    CONTENT = b'body { margin: 0; }\n' * 50
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест статики.\n')
+
+    def setUp(self):
+        tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp)
+        (tmp / 'src' / 'css').mkdir(parents=True)
+        (tmp / 'src' / self.NAME).write_bytes(self.CONTENT)
+        settings = override_settings(
+            STATIC_ROOT=str(tmp / 'root'),
+            STATICFILES_DIRS=[str(tmp / 'src')],
+            INSTALLED_APPS=['django.contrib.staticfiles'],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.root = tmp / 'root'
+        self.src = tmp / 'src'
+
+    def test_collect_hashed_and_compressed(self):
+        """collectstatic кладёт файл с хэшем и его .gz."""
+        url = static(self.NAME)
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        path = self.root / url[len('/static/'):]
+        compressed = path.with_name(f'{path.name}.gz')
+        self.assertEqual(
+            gzip.decompress(compressed.read_bytes()), self.CONTENT
+        )
+
+        if PRINT:
+            print(f'\t{Fore.GREEN}{url}{Fore.RESET} + .gz')
+
+    def test_vendor_asset_fallback(self):
+        """Без своей копии сторонний CSS берётся с CDN, с ней - свой."""
+        name = next(iter(staticfiles.VENDOR_ASSETS))
+        url, integrity = staticfiles.vendor_asset(name)
+        self.assertTrue(url.startswith('https://'))
+        self.assertTrue(integrity.startswith('sha384-'))
+        path = self.src / name
+        path.parent.mkdir(parents=True)
+        path.write_bytes(self.CONTENT)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        url, integrity = staticfiles.vendor_asset(name)
+        self.assertRegex(url, r'^/static/vendor/.+\.[0-9a-f]{12}\.css$')
+        self.assertIsNone(integrity)
+
+        if PRINT:
+            print(f'\t{Fore.GREEN}{url}{Fore.RESET} вместо CDN')
+
+    def test_missing_manifest(self):
+        """Без манифеста исходные имена - только при
+        STATIC_MANIFEST_FALLBACK, иначе ошибка."""
+        (self.root / 'staticfiles.json').unlink()
+        storage = staticfiles.CompressedManifestStaticFilesStorage()
+        with override_settings(STATIC_MANIFEST_FALLBACK=True):
+            self.assertEqual(storage.url(self.NAME), f'/static/{self.NAME}')
+        with override_settings(STATIC_MANIFEST_FALLBACK=False):
+            with self.assertRaises(ValueError):
+                storage.url(self.NAME)
+
+        if PRINT:
+            print(f'\t{Fore.GREEN}ValueError{Fore.RESET} без манифеста')
+
+    def test_serve_compressed_immutable(self):
+        """Хэшированный файл отдаётся сжатым и кэшируется навсегда."""
+        url = static(self.NAME)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(body), self.CONTENT)
+
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+
+        if PRINT:
+            status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+            print(f'\t{status} -> {url}')
+
+    def test_serve_unhashed_and_missing(self):
+        """Имя без хэша кэшируется коротко; чужие пути не отдаются."""
+        response = self.client.get(f'/static/{self.NAME}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response.close()
+        for url in ('/static/css/none.css', '/static/../manage.py'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+                if PRINT:
+                    status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+                    print(f'\t{status} -> {url}')
+
+
+class TestProfiling(TestCase):
+    """Тест профилирования запросов по токену."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+        cls.reader = User.objects.create(username='Юзер')
+        cls.staff = User.objects.create(username='Сотрудник', is_staff=True)
+        cls.note = Note.objects.create(
+            title='Заголовок', text='Текст', author=cls.author
+        )
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест профилирования запросов.\n')
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        settings = override_settings(PROFILING_DIR=tmp, PROFILING_KEEP=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.store = profiling.ProfileStore()
+        self.url = reverse('notes:list')
+        self.client.force_login(self.author)
+
+    def test_report_with_plans(self):
+        """Запрос с токеном профилируется, SQL идут с планами."""
+        token = profiling.make_token(self.author)
+        response = self.client.get(self.url, HTTP_X_YANOTE_PROFILE=token)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        report = self.store.get(response['X-Profile-Id'])
+        self.assertEqual(report['view'], 'notes:list')
+        self.assertTrue(report['queries'])
+        self.assertTrue(any(
+            query['plan'] and 'notes_note' in ' '.join(query['plan'])
+            for query in report['queries']
+        ))
+        self.assertIn('function calls', report['profile'])
+
+        if PRINT:
+            status = f'{Fore.GREEN}{len(report["queries"])}{Fore.RESET}'
+            print(f'\t{status} SQL в отчёте -> {self.url}')
+
+    def test_no_token_or_foreign_token(self):
+        """Без токена и с чужим токеном запрос не профилируется."""
+        cases = (
+            ('без токена', {}),
+            ('чужой токен', {
+                'HTTP_X_YANOTE_PROFILE': profiling.make_token(self.reader),
+            }),
+            ('поддельный токен', {'HTTP_X_YANOTE_PROFILE': 'x:y:z'}),
+        )
+        for name, headers in cases:
+            with self.subTest(name=name):
+                response = self.client.get(self.url, **headers)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertFalse(response.has_header('X-Profile-Id'))
+
+                if PRINT:
+                    print(f'\t{Fore.GREEN}без профиля{Fore.RESET} -> {name}')
+        self.assertEqual(self.store.paths(), [])
+
+    def test_ring_buffer_and_admin(self):
+        """Хранятся последние отчёты; смотреть их может только staff."""
+        token = profiling.make_token(self.author)
+        ids = [
+            self.client.get(self.url, {'_profile': token})['X-Profile-Id']
+            for _ in range(3)
+        ]
+        self.assertEqual(
+            [path.stem for path in self.store.paths()], ids[1:]
+        )
+        list_url = reverse('profile_list')
+        detail_url = reverse('profile_detail', args=(ids[-1],))
+        response = self.client.get(list_url)
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.client.force_login(self.staff)
+        for url in (list_url, detail_url):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+                if PRINT:
+                    status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+                    print(f'\t{status} -> {url}')
+        response = self.client.post(list_url, {'username': 'Автор'})
+        self.assertEqual(
+            profiling.token_user_id(response.context['token']),
+            self.author.pk,
+        )
+        response = self.client.get(
+            reverse('profile_detail', args=(ids[0],))
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+@override_settings(RATE_LIMITS={
+    'users:login': (('ip', 2, 60),),
+    'notes:add': (('user', 1, 60),),
+})
+class TestRateLimit(TestCase):
+    """Тест ограничения частоты запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Подготовка данных для тестов."""
+        cls.author = User.objects.create(username='Автор')
+
+        if PRINT:
+            print('=============================================')
+            print('\n>>> Тест ограничения частоты.\n')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_login_by_ip(self):
+        """Третий вход за минуту с адреса получает 429."""
+        url = reverse('users:login')
+        data = {'username': 'Автор', 'password': 'неверный'}
+        for _ in range(2):
+            self.assertEqual(
+                self.client.post(url, data).status_code, HTTPStatus.OK
+            )
+        response = self.client.post(url, data)
+        self.assertEqual(
+            response.status_code, HTTPStatus.TOO_MANY_REQUESTS
+        )
+        retry = response['Retry-After']
+        self.assertGreaterEqual(int(retry), 1)
+        self.assertEqual(self.client.get(url).status_code, HTTPStatus.OK)
+        response = self.client.post(url, data, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+        if PRINT:
+            status = f'{Fore.GREEN}429{Fore.RESET}'
+            print(f'\t{status} Retry-After: {retry} -> {url}')
+
+    def test_add_by_user(self):
+        """Ведро пользователя не зависит от адреса."""
+        url = reverse('notes:add')
+        self.client.force_login(self.author)
+        data = {'title': 'Заметка', 'text': 'Текст'}
+        self.assertEqual(
+            self.client.post(url, data).status_code, HTTPStatus.FOUND
+        )
+        response = self.client.post(url, data, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(
+            response.status_code, HTTPStatus.TOO_MANY_REQUESTS
+        )
+        self.assertEqual(Note.objects.count(), 1)
+
+        if PRINT:
+            status = f'{Fore.GREEN}{response.status_code}{Fore.RESET}'
+            print(f'\t{status} -> {url}')
+
+    def test_bucket_refills(self):
+        """Токены возвращаются по мере того, как прошлое окно вытекает."""
+        request = RequestFactory().get('/')
+        rules = (('ip', 4, 60),)
+        for _ in range(4):
+            self.assertIsNone(ratelimit.check(request, 'x', rules, now=30))
+        retry = ratelimit.check(request, 'x', rules, now=30)
+        self.assertEqual(retry, 30 + 15)
+        self.assertIsNone(ratelimit.check(request, 'x', rules, now=75))
+        self.assertIsNotNone(ratelimit.check(request, 'x', rules, now=75))
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'\tТест пополнения ведра: {status}')
+
+    def test_counter_cache_is_atomic_and_shared(self):
+        """Счётчик в базе: incr - один запрос, и его видит другой воркер."""
+        counters = caches['ratelimit']
+        self.assertIsInstance(counters, ratelimit.DatabaseCounterCache)
+        self.assertEqual(ratelimit.take(counters, 'k', 60), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ratelimit.take(counters, 'k', 60), 2)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('value + ', queries[0]['sql'])
+        other_worker = ratelimit.DatabaseCounterCache('default', {})
+        self.assertEqual(other_worker.incr('k'), 3)
+        self.assertEqual(counters.decr('k'), 2)
+        self.assertFalse(counters.add('k', 0, 60))
+        counters.set('k', 5, -1)
+        self.assertIsNone(counters.get('k'))
+        with self.assertRaises(ValueError):
+            counters.incr('k')
+        self.assertTrue(counters.add('k', 7, 60))
+        self.assertEqual(counters.get('k'), 7)
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'\tТест счётчиков в базе: {status}')
+
+    def test_process_local_cache_warns(self):
+        """check --deploy предупреждает о locmem и файловом кэше ведер."""
+        self.assertEqual(ratelimit.check_rate_limit_cache(), [])
+        for backend in (
+            'django.core.cache.backends.locmem.LocMemCache',
+            'django.core.cache.backends.filebased.FileBasedCache',
+        ):
+            with override_settings(CACHES={
+                'default': {'BACKEND': backend, 'LOCATION': 'ratelimit'},
+            }, RATE_LIMIT_CACHE='default'):
+                self.assertEqual(
+                    [error.id for error in ratelimit.check_rate_limit_cache()],
+                    ['yanote.W002'],
+                )
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'\tТест проверки кэша ведер: {status}')
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_client_ip_behind_trusted_proxy(self):
+        """X-Forwarded-For читается только от доверенного прокси."""
+        factory = RequestFactory()
+        chain = '198.51.100.1, 203.0.113.9, 10.0.0.2'
+        behind_proxy = factory.get(
+            '/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=chain
+        )
+        self.assertEqual(ratelimit.identity(behind_proxy, 'ip'), '203.0.113.9')
+        direct = factory.get(
+            '/', REMOTE_ADDR='192.0.2.5', HTTP_X_FORWARDED_FOR=chain
+        )
+        self.assertEqual(ratelimit.identity(direct, 'ip'), '192.0.2.5')
+        no_header = factory.get('/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(ratelimit.identity(no_header, 'ip'), '10.0.0.1')
+
+        if PRINT:
+            status = f'{Fore.GREEN} >> OK{Fore.RESET}'
+            print(f'\tТест адреса за прокси: {status}')
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from notes import views
+from notes import api, views
 
 app_name = 'notes'
 
@@ -9,7 +9,23 @@ urlpatterns = [
     path('add/', views.NoteCreate.as_view(), name='add'),
     path('edit/<slug:slug>/', views.NoteUpdate.as_view(), name='edit'),
     path('note/<slug:slug>/', views.NoteDetail.as_view(), name='detail'),
+    path(
+        'note/<slug:slug>/history/',
+        views.NoteHistory.as_view(),
+        name='history',
+    ),
+    path(
+        'note/<slug:slug>/history/<int:number>/',
+        views.NoteRestore.as_view(),
+        name='revision',
+    ),
     path('delete/<slug:slug>/', views.NoteDelete.as_view(), name='delete'),
     path('notes/', views.NotesList.as_view(), name='list'),
+    path('notes/bulk/', views.NoteBulk.as_view(), name='bulk'),
+    path('search/', views.NoteSearch.as_view(), name='search'),
+    path('export/', views.NoteExport.as_view(), name='export'),
+    path('api/batch/', api.NoteBatch.as_view(), name='api_batch'),
+    path('api/tags/', api.NoteTagsBatch.as_view(), name='api_tags'),
+    path('api/changes/', api.NoteChanges.as_view(), name='api_changes'),
     path('done/', views.NoteSuccess.as_view(), name='success'),
 ]
@@ -1,15 +1,39 @@
+import hashlib
+
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import (
+    http_date, quote_etag, url_has_allowed_host_and_scheme,
+)
 from django.views import generic
 
-from .forms import NoteForm
-from .models import Note
+from . import exchange, jobs, replicas, search, sharding
+from .forms import BulkActionForm, NoteForm
+from .models import (
+    AuthorStats, AuthorVersion, Note, NoteRevision, NoteTag, Tag,
+)
+from .pagination import KeysetPaginationMixin
 
 
 class Home(generic.TemplateView):
     """Домашняя страница."""
     template_name = 'notes/home.html'
 
+    def get_context_data(self, **kwargs):
+        """Сводка автора - одна строка по ключу, без агрегатов по заметкам."""
+        context = super().get_context_data(**kwargs)
+        user = self.request.user
+        if user.is_authenticated:
+            context['stats'] = AuthorStats.objects.using(
+                sharding.shard_for(user)
+            ).filter(author=user).first()
+        return context
+
 
 class NoteSuccess(LoginRequiredMixin, generic.TemplateView):
     """Страница успешного выполнения операции."""
@@ -20,40 +44,369 @@ class NoteBase(LoginRequiredMixin):
     """Базовый класс для остальных CBV."""
     model = Note
     success_url = reverse_lazy('notes:success')
+    # Только читающие представления могут ходить в реплики.
+    read_only = False
+    # Отрисовка и индексация сохранённой заметки уходят в очередь задач.
+    defer_side_effects = False
+
+    def dispatch(self, request, *args, **kwargs):
+        with replicas.use_replicas(
+            self.read_only and not replicas.is_pinned(request)
+        ), jobs.deferred(self.defer_side_effects):
+            return super().dispatch(request, *args, **kwargs)
+
+    def get_shard(self):
+        """База, в которой лежат заметки текущего пользователя."""
+        return replicas.read_alias(sharding.shard_for(self.request.user))
 
     def get_queryset(self):
         """Пользователь может работать только со своими заметками."""
-        return self.model.objects.filter(author=self.request.user)
+        return self.model.objects.using(self.get_shard()).filter(
+            author=self.request.user
+        )
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 на If-None-Match/If-Modified-Since, не рендеря шаблон.
+
+    Наследник реализует get_validators(), который одним дешёвым
+    запросом возвращает пару (etag, last_modified) или None, если
+    валидаторов нет и страницу нужно отрендерить как обычно.
+
+    Те же валидаторы служат версией для {% cache %} в шаблоне
+    (fragment_version): любое изменение заметок даёт новый ключ, и
+    старые фрагменты не нужно удалять - они просто истекают.
+
+    Страница с формой (has_csrf_form) добавляет к ETag отпечаток
+    CSRF-токена: после входа токен меняется, и страница из кэша
+    браузера отправила бы устаревший.
+    """
+    fragment_version = None
+    has_csrf_form = False
+
+    def get_validators(self):
+        raise NotImplementedError
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['fragment_version'] = self.fragment_version
+        return context
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        etag, last_modified = validators
+        self.fragment_version = (
+            f'{etag}-{last_modified.timestamp() if last_modified else 0}'
+        )
+        if self.has_csrf_form:
+            # get_token() каждый раз маскирует секрет заново; постоянна
+            # только кука, которую он заодно создаёт при первом визите.
+            get_token(request)
+            etag = f'{etag}-' + hashlib.md5(
+                request.META['CSRF_COOKIE'].encode()
+            ).hexdigest()[:8]
+        etag = quote_etag(etag)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 class NoteCreate(NoteBase, generic.CreateView):
     """Добавление заметки."""
     template_name = 'notes/form.html'
     form_class = NoteForm
+    defer_side_effects = True
+
+    def get_form_kwargs(self):
+        """Автор известен заранее: по нему форма выбирает шард."""
+        kwargs = super().get_form_kwargs()
+        kwargs['instance'] = self.model(author=self.request.user)
+        return kwargs
 
     def form_valid(self, form):
-        new_note = form.save(commit=False)
-        new_note.author = self.request.user
-        new_note.save()
-        return super().form_valid(form)
+        """Сохраняет заметку один раз: super().form_valid() сохранил бы
+        её повторно, с лишней правкой в ленте изменений. Автор уже
+        задан в экземпляре формы."""
+        self.object = form.save()
+        return HttpResponseRedirect(self.get_success_url())
 
 
 class NoteUpdate(NoteBase, generic.UpdateView):
     """Редактирование заметки."""
     template_name = 'notes/form.html'
     form_class = NoteForm
+    defer_side_effects = True
+
+    def get_queryset(self):
+        """Готовый HTML форме не нужен; при правке текста он пересчитается."""
+        return super().get_queryset().defer('text_html')
 
 
 class NoteDelete(NoteBase, generic.DeleteView):
     """Удаление заметки."""
     template_name = 'notes/delete.html'
 
+    def get_queryset(self):
+        """Для подтверждения и удаления текст заметки не нужен."""
+        return super().get_queryset().defer('text', 'text_html')
+
 
-class NotesList(NoteBase, generic.ListView):
+class NotesList(
+    NoteBase, ConditionalGetMixin, KeysetPaginationMixin, generic.ListView
+):
     """Список всех заметок пользователя."""
     template_name = 'notes/list.html'
+    read_only = True
+    has_csrf_form = True
+
+    def get_validators(self):
+        """Версия списка - счётчик изменений заметок автора."""
+        version, updated_at = AuthorVersion.objects.using(
+            self.get_shard()
+        ).filter(
+            author=self.request.user
+        ).values_list('version', 'updated_at').first() or (0, None)
+        page = hashlib.md5(
+            self.request.GET.urlencode().encode()
+        ).hexdigest()[:8]
+        return f'{self.request.user.pk}-{version}-{page}', updated_at
+
+    def get_tags(self):
+        """Метки автора с хранимыми счётчиками, без подсчёта связей."""
+        return Tag.objects.using(self.get_shard()).filter(
+            author=self.request.user
+        ).only('name', 'slug', 'note_count')
+
+    def get_queryset(self):
+        """Шаблону списка нужны только id, заголовок и slug.
+
+        ?tag=<slug> оставляет заметки с этой меткой. Подзапрос по
+        индексу (tag, note) ведёт выборку от связей метки, уже в
+        порядке id: с JOIN SQLite перебирал бы все заметки автора.
+        """
+        queryset = super().get_queryset().only('id', 'title', 'slug')
+        self.tag = None
+        slug = self.request.GET.get('tag')
+        if slug:
+            self.tag = get_object_or_404(self.get_tags(), slug=slug)
+            queryset = queryset.filter(id__in=NoteTag.objects.using(
+                self.get_shard()
+            ).filter(tag=self.tag).values('note_id'))
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(
+            tag=self.tag, tags=self.get_tags(), bulk_form=BulkActionForm()
+        )
+        return context
+
+
+class NoteBulk(NoteBase, generic.FormView):
+    """Действие над заметками, отмеченными в списке.
+
+    Каждое действие - фиксированное число запросов на все отмеченные
+    заметки: выборка по filter(author=..., pk__in=...), затем один
+    DELETE или set-based привязка меток, в одной транзакции. Чужие и
+    уже удалённые id просто не попадают в выборку.
+    """
+    template_name = 'notes/bulk.html'
+    form_class = BulkActionForm
+    http_method_names = ('post',)
+
+    def form_valid(self, form):
+        action = form.cleaned_data['action']
+        queryset = self.get_queryset().filter(
+            pk__in=form.cleaned_data['notes']
+        )
+        using = queryset.db
+        with transaction.atomic(using=using):
+            if action == form.DELETE:
+                self.delete(queryset)
+            else:
+                self.tag(queryset, action, form.cleaned_data['tag'])
+        return redirect(self.get_success_url())
 
+    def delete(self, queryset):
+        """Удаляет заметки одним DELETE.
 
-class NoteDetail(NoteBase, generic.DetailView):
+        Производные данные - через after_bulk_write, как у пакетного
+        API: ему нужны slug, версия и длина текста удалённых заметок.
+        """
+        deleted = list(queryset.only(
+            'id', 'author_id', 'slug', 'version', 'text_length'
+        ))
+        if not deleted:
+            return
+        queryset.delete()
+        Note.after_bulk_write(
+            self.request.user.pk, deleted=deleted, using=queryset.db
+        )
+
+    def tag(self, queryset, action, name):
+        using = queryset.db
+        notes = list(queryset.values_list('id', 'slug'))
+        if not notes:
+            return
+        user_id = self.request.user.pk
+        if action == BulkActionForm.ADD_TAG:
+            NoteTag.assign(
+                user_id, notes,
+                add=Tag.for_names(user_id, [name], using=using),
+                using=using,
+            )
+        else:
+            NoteTag.assign(
+                user_id, notes,
+                remove=list(Tag.objects.using(using).filter(
+                    author_id=user_id, slug=Tag.slug_for(name)
+                )),
+                using=using,
+            )
+
+    def get_success_url(self):
+        """Назад на ту же страницу списка, если адрес свой."""
+        url = self.request.POST.get('next', '')
+        if url_has_allowed_host_and_scheme(
+            url,
+            allowed_hosts={self.request.get_host()},
+            require_https=self.request.is_secure(),
+        ):
+            return url
+        return reverse('notes:list')
+
+
+class NoteDetail(NoteBase, ConditionalGetMixin, generic.DetailView):
     """Заметка подробно."""
     template_name = 'notes/detail.html'
+    read_only = True
+
+    def get_validators(self):
+        """Валидаторы берутся по индексу slug без чтения текста заметки.
+
+        В ETag входит хэш HTML, чтобы перерисовка после смены версии
+        рендерера тоже давала новую версию страницы.
+        """
+        row = self.get_queryset().filter(
+            slug=self.kwargs[self.slug_url_kwarg]
+        ).values_list('id', 'updated_at', 'text_hash').first()
+        if row is None:
+            return None
+        pk, updated_at, text_hash = row
+        return f'{pk}-{updated_at.timestamp()}-{text_hash[-12:]}', updated_at
+
+    def get_queryset(self):
+        """Странице нужен готовый HTML, а не исходный текст."""
+        return super().get_queryset().defer('text')
+
+    def get_object(self, queryset=None):
+        note = super().get_object(queryset)
+        note.ensure_rendered()
+        return note
+
+
+class NoteSearch(NoteBase, generic.ListView):
+    """Полнотекстовый поиск по заметкам пользователя."""
+    template_name = 'notes/search.html'
+    results_limit = 50
+    read_only = True
+
+    def get_queryset(self):
+        """Ранжирует по bm25 и подмешивает подсветку к заметкам автора."""
+        self.query = self.request.GET.get('q', '').strip()
+        hits = search.search(
+            self.request.user, self.query, limit=self.results_limit,
+            using=self.get_shard(),
+        )
+        if not hits:
+            return []
+        notes = super().get_queryset().only('id', 'title', 'slug').in_bulk(
+            [pk for pk, _, _ in hits]
+        )
+        results = []
+        for pk, title, snippet in hits:
+            note = notes.get(pk)
+            if note is None:
+                continue
+            note.title_highlight = title
+            note.snippet = snippet
+            results.append(note)
+        return results
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.query
+        return context
+
+
+class NoteExport(NoteBase, generic.View):
+    """Потоковая выгрузка всех заметок пользователя в JSONL или CSV."""
+    read_only = True
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get('format')
+        if fmt not in exchange.FORMATS:
+            fmt = exchange.FORMATS[0]
+        response = StreamingHttpResponse(
+            exchange.export_notes(request.user, fmt, using=self.get_shard()),
+            content_type=exchange.CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="notes.{fmt}"'
+        )
+        return response
+
+
+class NoteHistory(NoteBase, generic.DetailView):
+    """Список прежних версий заметки."""
+    template_name = 'notes/history.html'
+    read_only = True
+
+    def get_queryset(self):
+        return super().get_queryset().defer('text', 'text_html')
+
+    def get_context_data(self, **kwargs):
+        """Ревизии без текста и дельт - только номера, заголовки и даты."""
+        context = super().get_context_data(**kwargs)
+        context['revisions'] = NoteRevision.objects.using(
+            self.object._state.db
+        ).filter(note_id=self.object.pk).defer('data')
+        return context
+
+
+class NoteRestore(NoteBase, generic.DetailView):
+    """Прежняя версия заметки и её восстановление."""
+    template_name = 'notes/revision.html'
+
+    def get_revision(self, note):
+        try:
+            return NoteRevision.rebuild(note, self.kwargs['number'])
+        except NoteRevision.DoesNotExist:
+            raise Http404('Такой версии нет.')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        title, text = self.get_revision(self.object)
+        context.update(
+            number=self.kwargs['number'],
+            revision_title=title,
+            revision_text=text,
+        )
+        return context
+
+    def post(self, request, *args, **kwargs):
+        """Восстановление - обычная правка, и она тоже попадает в историю."""
+        note = self.get_object()
+        note.title, note.text = self.get_revision(note)
+        note.save()
+        return redirect('notes:detail', slug=note.slug)
@@ -0,0 +1,97 @@
+"""Пользователь сессии из кэша вместо SELECT по auth_user на каждый запрос.
+
+При общем кэше (настройки включают это вместе с YANOTE_CACHE_DIR)
+сессии хранятся в cached_db (SESSION_ENGINE), а CachedModelBackend
+кладёт в кэш загруженного пользователя. Запись пользователя в кэше
+сбрасывается при любом save()/delete() пользователя (смена пароля,
+блокировка, правка профиля) и при выходе из системы. Проверка хэша
+пароля сессии в django.contrib.auth.get_user() остаётся прежней, поэтому
+после смены пароля старые сессии перестают действовать сразу - при
+общем для всех воркеров кэше.
+
+Изменения в обход save() (QuerySet.update()) кэш не видит: после них
+нужно вызвать forget_user().
+
+Сброс доходит до других процессов, только если кэш у них общий
+(файловый, memcached, redis). С locmem у каждого воркера своя копия:
+выход или смена пароля в одном воркере не сбросят сессию и пользователя
+в остальных до истечения таймаута. Поэтому check_shared_cache() в
+``manage.py check --deploy`` требует общий кэш.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+KEY_TEMPLATE = 'auth:user:{pk}'
+DEFAULT_TIMEOUT = 300
+CACHED_SESSION_ENGINES = (
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+def cache_key(pk):
+    return KEY_TEMPLATE.format(pk=pk)
+
+
+def forget_user(pk):
+    cache.delete(cache_key(pk))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который достаёт пользователя сессии из кэша."""
+
+    def get_user(self, user_id):
+        key = cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, getattr(
+                    settings, 'AUTH_USER_CACHE_TIMEOUT', DEFAULT_TIMEOUT
+                ))
+        return user
+
+
+def user_changed(sender, instance, **kwargs):
+    """post_save/post_delete пользователя."""
+    forget_user(instance.pk)
+
+
+def user_logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
+
+
+def is_process_local(alias):
+    return isinstance(caches[alias], LocMemCache)
+
+
+def check_shared_cache(app_configs=None, **kwargs):
+    """Сессии и пользователи из кэша требуют кэша, общего для воркеров."""
+    cached = (
+        (
+            'Пользователи (CachedModelBackend)',
+            f'{__name__}.CachedModelBackend'
+            in settings.AUTHENTICATION_BACKENDS,
+            DEFAULT_CACHE_ALIAS,
+        ),
+        (
+            f'Сессии ({settings.SESSION_ENGINE})',
+            settings.SESSION_ENGINE in CACHED_SESSION_ENGINES,
+            settings.SESSION_CACHE_ALIAS,
+        ),
+    )
+    return [
+        checks.Error(
+            f'{what} хранятся в кэше {alias!r}, который живёт внутри '
+            f'процесса: выход и смена пароля не дойдут до других воркеров.',
+            hint='Задайте общий кэш (YANOTE_CACHE_DIR, memcached, redis) '
+                 'или верните ModelBackend и SESSION_ENGINE db.',
+            id='yanote.E001',
+        )
+        for what, enabled, alias in cached
+        if enabled and is_process_local(alias)
+    ]
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def fragment_cache(request):
+    """Время жизни фрагментов для {% cache fragment_timeout ... %}."""
+    return {'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT}
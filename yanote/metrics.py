@@ -0,0 +1,242 @@
+"""Метрики задержки и SQL-запросов по именам URL в формате Prometheus.
+
+MetricsMiddleware замеряет каждый запрос: время ответа, число SQL-
+запросов и время в базе (через connection.execute_wrapper). Данные
+копятся в словарях отдельных потоков без блокировок и сводятся вместе
+только при чтении /metrics; словари завершившихся потоков сливаются в
+общий. Метрики живут в памяти процесса: при нескольких воркерах каждый
+отдаёт свои.
+"""
+import secrets
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNRESOLVED = '<unresolved>'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Series:
+    """Накопленные значения по одному имени URL в одном потоке."""
+    __slots__ = (
+        'count', 'seconds', 'latency', 'queries', 'sql_seconds',
+        'query_counts',
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.query_counts = [0] * (len(QUERY_BUCKETS) + 1)
+
+    def observe(self, seconds, queries, sql_seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.queries += queries
+        self.sql_seconds += sql_seconds
+        self.query_counts[bisect_left(QUERY_BUCKETS, queries)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.seconds += other.seconds
+        self.queries += other.queries
+        self.sql_seconds += other.sql_seconds
+        for index, value in enumerate(other.latency):
+            self.latency[index] += value
+        for index, value in enumerate(other.query_counts):
+            self.query_counts[index] += value
+
+
+_local = threading.local()
+# ident потока -> (поток, его словарь серий).
+_shards = {}
+# Серии завершившихся потоков: счётчики Prometheus не должны убывать.
+_retired = {}
+_shards_lock = threading.Lock()
+
+
+def _retire_dead():
+    """Переносит серии завершившихся потоков в _retired; под _shards_lock.
+
+    Без этого сервер, создающий поток на запрос, копил бы словари
+    навсегда, и каждое чтение /metrics обходило бы их все.
+    """
+    for ident, (thread, shard) in list(_shards.items()):
+        if not thread.is_alive():
+            del _shards[ident]
+            for name, series in list(shard.items()):
+                _retired.setdefault(name, Series()).merge(series)
+
+
+def _shard():
+    """Словарь серий текущего потока; блокировка - только при создании."""
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        thread = threading.current_thread()
+        with _shards_lock:
+            _retire_dead()
+            _shards[thread.ident] = (thread, shard)
+    return shard
+
+
+def observe(view_name, seconds, queries=0, sql_seconds=0.0):
+    shard = _shard()
+    series = shard.get(view_name)
+    if series is None:
+        series = shard[view_name] = Series()
+    series.observe(seconds, queries, sql_seconds)
+
+
+def snapshot():
+    """Сводит серии всех потоков в один словарь."""
+    merged = {}
+    with _shards_lock:
+        _retire_dead()
+        for name, series in _retired.items():
+            merged.setdefault(name, Series()).merge(series)
+        shards = [shard for _, shard in _shards.values()]
+    for shard in shards:
+        for name, series in list(shard.items()):
+            merged.setdefault(name, Series()).merge(series)
+    return merged
+
+
+def reset():
+    with _shards_lock:
+        _retired.clear()
+        for _, shard in _shards.values():
+            shard.clear()
+
+
+class QueryStats:
+    """execute_wrapper, считающий запросы и время в базе."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Замеряет запрос целиком; ставится первым в MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        stats = QueryStats()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        observe(
+            match.view_name if match else UNRESOLVED,
+            perf_counter() - start,
+            stats.count,
+            stats.seconds,
+        )
+        return response
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n'
+    )
+
+
+def _histogram(lines, metric, label, buckets, counts, total, count):
+    cumulative = 0
+    for bound, value in zip(buckets, counts):
+        cumulative += value
+        lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {count}')
+    lines.append(f'{metric}_sum{{{label}}} {total}')
+    lines.append(f'{metric}_count{{{label}}} {count}')
+
+
+def render():
+    """Текст в формате Prometheus exposition 0.0.4."""
+    data = sorted(snapshot().items())
+    lines = [
+        '# HELP yanote_request_duration_seconds Время ответа по имени URL.',
+        '# TYPE yanote_request_duration_seconds histogram',
+    ]
+    for name, series in data:
+        _histogram(
+            lines, 'yanote_request_duration_seconds',
+            f'view="{_label(name)}"', LATENCY_BUCKETS, series.latency,
+            series.seconds, series.count,
+        )
+    lines += [
+        '# HELP yanote_db_queries_per_request SQL-запросов на один ответ.',
+        '# TYPE yanote_db_queries_per_request histogram',
+    ]
+    for name, series in data:
+        _histogram(
+            lines, 'yanote_db_queries_per_request',
+            f'view="{_label(name)}"', QUERY_BUCKETS, series.query_counts,
+            series.queries, series.count,
+        )
+    lines += [
+        '# HELP yanote_db_query_seconds_total Время в SQL-запросах.',
+        '# TYPE yanote_db_query_seconds_total counter',
+    ]
+    for name, series in data:
+        lines.append(
+            f'yanote_db_query_seconds_total{{view="{_label(name)}"}} '
+            f'{series.sql_seconds}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+def is_allowed(request):
+    """Токен из METRICS_TOKEN или, если его нет, адрес из
+    METRICS_ALLOWED_IPS.
+
+    За обратным прокси на той же машине REMOTE_ADDR у всех запросов
+    локальный, поэтому без токена запросы с X-Forwarded-For не
+    пропускаются: прокси должен либо не отдавать /metrics наружу, либо
+    метрики нужно закрыть токеном.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        return secrets.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+        )
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    return (
+        'HTTP_X_FORWARDED_FOR' not in request.META
+        and request.META.get('REMOTE_ADDR') in allowed
+    )
+
+
+def metrics_view(request):
+    """Отдаёт метрики только сборщику, см. is_allowed()."""
+    if not is_allowed(request):
+        raise Http404
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
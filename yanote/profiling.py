@@ -0,0 +1,267 @@
+"""Профилирование отдельных запросов по подписанному токену.
+
+Токен выдаёт сотрудник на странице /admin/profiles/ - себе или
+пользователю, у которого тормозит список или заметка. Запрос с
+токеном в заголовке X-Yanote-Profile или параметре ?_profile= от того
+пользователя, на кого токен выписан, выполняется под cProfile; все SQL
+записываются со временем и планом EXPLAIN QUERY PLAN. Отчёт ложится
+JSON-файлом в PROFILING_DIR, где хранятся только последние
+PROFILING_KEEP отчётов, а в ответ добавляется X-Profile-Id.
+
+Запросы без токена проверяются одним поиском в заголовках и строке
+запроса и больше ничем не платят.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import secrets
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import connections
+from django.http import Http404
+from django.shortcuts import render
+
+HEADER = 'HTTP_X_YANOTE_PROFILE'
+PARAM = '_profile'
+SALT = 'yanote.profiling.token'
+DEFAULT_KEEP = 50
+DEFAULT_TOKEN_MAX_AGE = 3600
+DEFAULT_MAX_QUERIES = 500
+PROFILE_LINES = 40
+EXPLAINED = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+_report_id = re.compile(r'^\d{20}-[0-9a-f]{8}$')
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def make_token(user):
+    """Токен профилирования запросов пользователя user."""
+    return signing.TimestampSigner(salt=SALT).sign(str(user.pk))
+
+
+def token_user_id(token):
+    """id пользователя из живого токена или None."""
+    try:
+        value = signing.TimestampSigner(salt=SALT).unsign(
+            token,
+            max_age=setting('PROFILING_TOKEN_MAX_AGE', DEFAULT_TOKEN_MAX_AGE),
+        )
+    except signing.BadSignature:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+class ProfileStore:
+    """Кольцевой буфер отчётов: по файлу на отчёт, старые удаляются."""
+
+    def __init__(self, directory=None, keep=None):
+        self.directory = Path(directory or settings.PROFILING_DIR)
+        self.keep = keep or setting('PROFILING_KEEP', DEFAULT_KEEP)
+
+    def save(self, report):
+        """Пишет отчёт атомарно (через os.replace); возвращает его id."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        report_id = f'{time.time_ns():020d}-{secrets.token_hex(4)}'
+        path = self.directory / f'{report_id}.json'
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(
+            json.dumps({'id': report_id, **report}, ensure_ascii=False),
+            encoding='utf-8',
+        )
+        os.replace(tmp, path)
+        for old in self.paths()[:-self.keep]:
+            old.unlink(missing_ok=True)
+        return report_id
+
+    def paths(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob('*.json'))
+
+    def get(self, report_id):
+        if not _report_id.match(report_id):
+            return None
+        try:
+            return json.loads(
+                (self.directory / f'{report_id}.json').read_text('utf-8')
+            )
+        except FileNotFoundError:
+            return None
+
+    def list(self):
+        """Отчёты от новых к старым, без запросов и профиля."""
+        reports = []
+        for path in reversed(self.paths()):
+            try:
+                report = json.loads(path.read_text('utf-8'))
+            except (FileNotFoundError, ValueError):
+                continue
+            report['query_count'] = len(report.pop('queries'))
+            report.pop('profile')
+            reports.append(report)
+        return reports
+
+
+class QueryLog:
+    """execute_wrapper одной базы: SQL, параметры и время запросов."""
+
+    def __init__(self, alias, queries, limit):
+        self.alias = alias
+        self.queries = queries
+        self.limit = limit
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < self.limit:
+                self.queries.append({
+                    'alias': self.alias,
+                    'sql': sql,
+                    'params': (
+                        list(params[0]) if many and params
+                        else list(params or ())
+                    ),
+                    'many': many,
+                    'seconds': perf_counter() - start,
+                })
+
+
+def explain(query):
+    """Строки EXPLAIN QUERY PLAN для запроса SQLite; None для прочих.
+
+    EXPLAIN только строит план и не выполняет запрос, поэтому его можно
+    звать и для изменяющих запросов уже после ответа.
+    """
+    connection = connections[query['alias']]
+    if (
+        connection.vendor != 'sqlite'
+        or not query['sql'].lstrip().upper().startswith(EXPLAINED)
+    ):
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'EXPLAIN QUERY PLAN {query["sql"]}', query['params']
+            )
+            return [row[-1] for row in cursor.fetchall()]
+    except Exception as error:
+        return [f'ошибка EXPLAIN: {error}']
+
+
+def printable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return f'<{len(value)} байт>'
+    return str(value)
+
+
+class ProfilingMiddleware:
+    """Ставится после AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = setting('PROFILING_ENABLED', False)
+
+    def __call__(self, request):
+        if self.enabled:
+            token = request.META.get(HEADER)
+            if token is None and f'{PARAM}=' in request.META.get(
+                'QUERY_STRING', ''
+            ):
+                token = request.GET.get(PARAM)
+            if token and self.allowed(request, token):
+                return self.profile(request)
+        return self.get_response(request)
+
+    def allowed(self, request, token):
+        user_id = token_user_id(token)
+        return (
+            user_id is not None
+            and request.user.is_authenticated
+            and request.user.pk == user_id
+        )
+
+    def profile(self, request):
+        queries = []
+        limit = setting('PROFILING_MAX_QUERIES', DEFAULT_MAX_QUERIES)
+        profiler = cProfile.Profile()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(
+                    QueryLog(connection.alias, queries, limit)
+                ))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        seconds = perf_counter() - start
+        for query in queries:
+            query['plan'] = explain(query)
+            query['params'] = [printable(value) for value in query['params']]
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(
+            'cumulative'
+        ).print_stats(PROFILE_LINES)
+        match = getattr(request, 'resolver_match', None)
+        response['X-Profile-Id'] = ProfileStore().save({
+            'created_at': datetime.now(dt_timezone.utc).isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.view_name if match else None,
+            'user_id': request.user.pk,
+            'status': response.status_code,
+            'seconds': seconds,
+            'sql_seconds': sum(query['seconds'] for query in queries),
+            'queries': queries,
+            'profile': stream.getvalue(),
+        })
+        return response
+
+
+def profile_list(request):
+    """Список отчётов и выдача токена; за admin.site.admin_view."""
+    token = None
+    username = request.POST.get('username', '').strip()
+    if request.method == 'POST' and username:
+        user = get_user_model().objects.filter(
+            username=username, is_active=True
+        ).first()
+        if user is not None:
+            token = make_token(user)
+    return render(request, 'admin/profiles/list.html', {
+        'title': 'Профили запросов',
+        'reports': ProfileStore().list(),
+        'username': username,
+        'token': token,
+        'header': HEADER[len('HTTP_'):].replace('_', '-'),
+        'param': PARAM,
+        'enabled': setting('PROFILING_ENABLED', False),
+    })
+
+
+def profile_detail(request, report_id):
+    report = ProfileStore().get(report_id)
+    if report is None:
+        raise Http404(report_id)
+    return render(request, 'admin/profiles/detail.html', {
+        'title': f'Профиль {report["path"]}',
+        'report': report,
+    })
@@ -0,0 +1,299 @@
+"""Ограничение частоты запросов к входу, регистрации и записи.
+
+Правила задаются в settings.RATE_LIMITS по имени URL: список
+(ключ, ёмкость, секунды), где ключ - 'ip' или 'user'. Ведро ёмкостью
+capacity токенов полностью наполняется за seconds секунд; запрос,
+которому не хватило токена, получает 429 с Retry-After. Ограничиваются
+только методы из RATE_LIMIT_METHODS: дорогие хэш пароля и запись в
+SQLite стоят за POST.
+
+Ведро хранится в кэше RATE_LIMIT_CACHE двумя счётчиками окон длиной
+seconds и меняется только атомарными add/incr/decr, без чтения и
+записи целого состояния. Уровень ведра - запросы текущего окна плюс
+доля прошлого окна, ещё не «вытекшая» к этому моменту; это и есть
+ведро с равномерным пополнением, посчитанное без блокировок.
+
+Атомарность incr обеспечивает бэкенд кэша. По умолчанию это отдельный
+алиас 'ratelimit' на DatabaseCounterCache: счётчики лежат в таблице
+базы и меняются одним UPDATE ... SET value = value + n, общим для всех
+воркеров. memcached и redis тоже подходят; locmem считает внутри
+процесса, а у файлового кэша incr не атомарен - об этом предупреждает
+check_rate_limit_cache() в ``manage.py check --deploy``.
+
+Адрес клиента - REMOTE_ADDR. За обратным прокси это адрес прокси, и все
+клиенты делили бы одно ведро, поэтому для адресов и сетей из
+RATE_LIMIT_TRUSTED_PROXIES клиентом считается ближайший недоверенный
+адрес из X-Forwarded-For, справа налево. Заголовок от прочих адресов
+не читается: его может подставить сам клиент.
+"""
+import functools
+import ipaddress
+import math
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+
+DEFAULT_METHODS = ('POST',)
+KEY_PREFIX = 'ratelimit'
+STATUS_TOO_MANY_REQUESTS = 429
+
+
+def get_rules(view_name):
+    return getattr(settings, 'RATE_LIMITS', {}).get(view_name, ())
+
+
+def get_cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+@functools.lru_cache(maxsize=None)
+def trusted_networks(proxies):
+    return tuple(
+        ipaddress.ip_network(proxy, strict=False) for proxy in proxies
+    )
+
+
+def is_trusted(address, networks):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_ip(request):
+    """Адрес клиента с учётом доверенных прокси."""
+    address = request.META.get('REMOTE_ADDR')
+    networks = trusted_networks(tuple(
+        getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', ())
+    ))
+    if not networks or not is_trusted(address, networks):
+        return address
+    forwarded = [
+        hop.strip()
+        for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+        if hop.strip()
+    ]
+    for hop in reversed(forwarded):
+        if not is_trusted(hop, networks):
+            return hop
+        address = hop
+    return address
+
+
+def identity(request, kind):
+    """Чьё ведро: адрес клиента или id пользователя (None - не считать)."""
+    if kind == 'ip':
+        return client_ip(request)
+    if kind == 'user':
+        user = getattr(request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+    raise ValueError(f'Неизвестный ключ ограничения: {kind}')
+
+
+def take(cache, key, timeout):
+    """Атомарно берёт токен из счётчика окна; новое значение счётчика.
+
+    Обычно счётчик уже есть, и хватает одного incr; add нужен только
+    первому запросу окна.
+    """
+    while True:
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, 1, timeout):
+                return 1
+            # Счётчик успел создать параллельный запрос.
+
+
+def retry_after(capacity, seconds, used, previous, fraction):
+    """Через сколько секунд в ведре появится токен.
+
+    used - запросы текущего окна без отклонённого, previous - прошлого
+    окна, fraction - прошедшая доля текущего окна.
+    """
+    if used + 1 > capacity:
+        # Текущее окно исчерпано само: ждём следующего, где оно станет
+        # прошлым и будет вытекать.
+        wait = 1 - fraction
+        if used:
+            wait += max(0.0, 1 - (capacity - 1) / used)
+    else:
+        wait = (1 - (capacity - 1 - used) / previous) - fraction
+    return max(1, math.ceil(wait * seconds))
+
+
+def check(request, view_name, rules, now=None):
+    """Берёт по токену из каждого ведра правил.
+
+    Возвращает None, если запрос пропущен, или Retry-After в секундах.
+    При отказе взятые токены возвращаются: отклонённый запрос не
+    отодвигает момент, когда клиенту можно будет повторить.
+    """
+    cache = get_cache()
+    now = time.time() if now is None else now
+    taken = []
+    for kind, capacity, seconds in rules:
+        who = identity(request, kind)
+        if who is None:
+            continue
+        window, fraction = divmod(now / seconds, 1)
+        base = f'{KEY_PREFIX}:{view_name}:{kind}:{who}:{seconds}'
+        key = f'{base}:{int(window)}'
+        used = take(cache, key, 2 * seconds + 1)
+        taken.append(key)
+        previous = cache.get(f'{base}:{int(window) - 1}', 0)
+        if previous * (1 - fraction) + used > capacity:
+            for taken_key in taken:
+                try:
+                    cache.decr(taken_key)
+                except ValueError:
+                    pass
+            return retry_after(
+                capacity, seconds, used - 1, previous, fraction
+            )
+    return None
+
+
+class DatabaseCounterCache(BaseCache):
+    """Кэш целых счётчиков в таблице notes.RateLimitCounter.
+
+    LOCATION - алиас базы (по умолчанию default), роутеры не участвуют.
+    incr - один UPDATE ... RETURNING, add - один INSERT ... ON CONFLICT,
+    поэтому счёт атомарен для всех процессов, работающих с этой базой.
+    Истёкшие счётчики удаляются, когда add начинает новый.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.using = location or DEFAULT_DB_ALIAS
+
+    @property
+    def table(self):
+        return apps.get_model('notes', 'RateLimitCounter')._meta.db_table
+
+    def _execute(self, sql, params):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql.format(table=self.table), params)
+            row = cursor.fetchone() if cursor.description else None
+            return cursor.rowcount, row
+
+    def _expires(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return math.inf if expires is None else expires
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        now = time.time()
+        added, _ = self._execute(
+            'INSERT INTO {table} (key, value, expires) VALUES (%s, %s, %s) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires WHERE {table}.expires <= %s',
+            [key, int(value), self._expires(timeout), now],
+        )
+        if added:
+            self._execute('DELETE FROM {table} WHERE expires <= %s', [now])
+        return bool(added)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        _, row = self._execute(
+            'SELECT value FROM {table} WHERE key = %s AND expires > %s',
+            [key, time.time()],
+        )
+        return default if row is None else row[0]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        self._execute(
+            'INSERT INTO {table} (key, value, expires) VALUES (%s, %s, %s) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires',
+            [key, int(value), self._expires(timeout)],
+        )
+
+    def incr(self, key, delta=1, version=None):
+        full_key = self.make_key(key, version)
+        self.validate_key(full_key)
+        _, row = self._execute(
+            'UPDATE {table} SET value = value + %s '
+            'WHERE key = %s AND expires > %s RETURNING value',
+            [delta, full_key, time.time()],
+        )
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        return row[0]
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        deleted, _ = self._execute(
+            'DELETE FROM {table} WHERE key = %s', [key]
+        )
+        return bool(deleted)
+
+    def clear(self):
+        self._execute('DELETE FROM {table}', [])
+
+
+def check_rate_limit_cache(app_configs=None, **kwargs):
+    """Счётчикам ограничений нужен атомарный incr, общий для воркеров."""
+    alias = getattr(settings, 'RATE_LIMIT_CACHE', 'default')
+    if not isinstance(caches[alias], (LocMemCache, FileBasedCache)):
+        return []
+    return [
+        checks.Warning(
+            f'Ограничения частоты считаются в кэше {alias!r} '
+            f'({type(caches[alias]).__name__}): locmem ведёт счёт в каждом '
+            f'воркере отдельно, а у файлового кэша incr не атомарен.',
+            hint='Укажите в RATE_LIMIT_CACHE алиас на DatabaseCounterCache, '
+                 'memcached или redis.',
+            id='yanote.W002',
+        )
+    ]
+
+
+def too_many_requests(retry):
+    response = HttpResponse(
+        'Слишком много запросов, повторите позже.\n',
+        status=STATUS_TOO_MANY_REQUESTS,
+        content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(retry)
+    return response
+
+
+class RateLimitMiddleware:
+    """Ставится после AuthenticationMiddleware: ключу 'user' нужен
+    request.user."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in getattr(
+            settings, 'RATE_LIMIT_METHODS', DEFAULT_METHODS
+        ):
+            return None
+        view_name = request.resolver_match.view_name
+        rules = get_rules(view_name)
+        if not rules:
+            return None
+        retry = check(request, view_name, rules)
+        if retry is not None:
+            return too_many_requests(retry)
+        return None
@@ -1,3 +1,5 @@
+import os
+import sys
 from pathlib import Path
 
 from django.urls import reverse_lazy
@@ -22,13 +24,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yanote.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yanote.ratelimit.RateLimitMiddleware',
+    'yanote.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'notes.replicas.PinPrimaryMiddleware',
 ]
 
 ROOT_URLCONF = 'yanote.urls'
@@ -44,6 +50,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'yanote.context_processors.fragment_cache',
             ],
         },
     },
@@ -52,13 +59,100 @@ TEMPLATES = [
 WSGI_APPLICATION = 'yanote.wsgi.application'
 
 
+# Профиль SQLite: PRAGMA выставляются на каждое новое соединение
+# (yanote.sqlite.configure_connection), CONN_MAX_AGE держит соединение
+# открытым между запросами.
+DATABASE_PROFILES = {
+    'default': {
+        'CONN_MAX_AGE': 0,
+        'PRAGMAS': {},
+    },
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'PRAGMAS': {
+            'busy_timeout': 5000,
+            'journal_mode': 'wal',
+            'synchronous': 'normal',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -32 * 1024,
+            'temp_store': 'memory',
+        },
+    },
+}
+DATABASE_PROFILE = os.environ.get('YANOTE_DATABASE_PROFILE', 'production')
+SQLITE_PRAGMAS = DATABASE_PROFILES[DATABASE_PROFILE]['PRAGMAS']
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': DATABASE_PROFILES[DATABASE_PROFILE]['CONN_MAX_AGE'],
     }
 }
 
+# Шарды заметок (notes.sharding): при YANOTE_NOTE_SHARDS=N заметки
+# авторов раскладываются по файлам notes_0.sqlite3 ... notes_{N-1}.sqlite3,
+# иначе всё хранится в default.
+NOTE_SHARDS = [
+    f'notes_{index}'
+    for index in range(int(os.environ.get('YANOTE_NOTE_SHARDS', '0')))
+] or ['default']
+for alias in NOTE_SHARDS:
+    DATABASES.setdefault(alias, {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'{alias}.sqlite3',
+    })
+
+# Реплики для чтения (notes.replicas): {основная база: [алиасы реплик]}.
+# После записи чтения пользователя REPLICA_PIN_SECONDS идут в основную.
+DATABASE_REPLICAS = {}
+REPLICA_PIN_SECONDS = 10
+
+# Кэш фрагментов шаблонов. locmem живёт внутри процесса; при нескольких
+# воркерах задайте YANOTE_CACHE_DIR, чтобы они делили файловый кэш.
+# Ключи фрагментов версионируются, поэтому при изменении заметок ничего
+# не удаляется, а старые записи вытесняются по TIMEOUT и MAX_ENTRIES.
+CACHE_DIR = os.environ.get('YANOTE_CACHE_DIR')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yanote',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    } if not CACHE_DIR else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+FRAGMENT_CACHE_TIMEOUT = 600
+
+# С общим кэшем (YANOTE_CACHE_DIR) сессия и пользователь читаются из
+# него, в базу идут только записи и промахи (yanote.auth). Кэш locmem у
+# каждого воркера свой, и выход или смена пароля сбросили бы только его
+# копию, поэтому без общего кэша сессии и пользователи читаются из базы.
+if CACHE_DIR:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    AUTHENTICATION_BACKENDS = ['yanote.auth.CachedModelBackend']
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+AUTH_USER_CACHE_TIMEOUT = 300
+
+# Фоновые задачи заметок (notes.jobs, manage.py run_workers). По
+# умолчанию правки из форм рисуют HTML и обновляют поиск сразу. Включайте
+# YANOTE_JOBS_DEFERRED=1 только вместе с запущенными воркерами: иначе
+# правки не попадут в поиск (HTML отрисуется при первом просмотре).
+JOBS_DEFERRED = os.environ.get('YANOTE_JOBS_DEFERRED', '0') == '1'
+JOBS_WORKER_PROCESSES = 2
+JOBS_MAX_ATTEMPTS = 5
+JOBS_BACKOFF_SECONDS = 5
+JOBS_LEASE_SECONDS = 300
+
+DATABASE_ROUTERS = [
+    'notes.replicas.ReplicaRouter',
+    'notes.sharding.AuthorShardRouter',
+]
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -82,8 +176,68 @@ USE_TZ = True
 
 
 STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STATICFILES_DIRS = [BASE_DIR / 'static']
+# Имена с хэшем содержимого и .gz рядом (yanote.staticfiles). STATIC_SERVE
+# включает раздачу из STATIC_ROOT самим приложением; выключить, если
+# статику отдаёт веб-сервер.
+STATICFILES_STORAGE = (
+    'yanote.staticfiles.CompressedManifestStaticFilesStorage'
+)
+STATIC_SERVE = True
+# Без манифеста (collectstatic не запускался) {% static %} отдаёт
+# исходные имена только при DEBUG и в тестах; в остальных случаях это
+# ошибка, чтобы пропущенный collectstatic не остался незамеченным.
+TESTING = sys.argv[1:2] == ['test']
+STATIC_MANIFEST_FALLBACK = DEBUG or TESTING
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = reverse_lazy('users:login')
 LOGIN_REDIRECT_URL = reverse_lazy('notes:home')
+
+# Ограничение частоты (yanote.ratelimit): по имени URL - вёдра
+# (ключ 'ip' или 'user', ёмкость, за сколько секунд наполняется).
+RATE_LIMITS = {
+    'users:login': (('ip', 10, 60),),
+    'users:signup': (('ip', 5, 600),),
+    'notes:add': (('user', 30, 60), ('ip', 60, 60)),
+}
+RATE_LIMIT_METHODS = ('POST',)
+# Счётчики ведер: отдельный алиас кэша с атомарным incr, общим для воркеров
+# (yanote.ratelimit.DatabaseCounterCache в базе default).
+RATE_LIMIT_CACHE = 'ratelimit'
+CACHES[RATE_LIMIT_CACHE] = {
+    'BACKEND': 'yanote.ratelimit.DatabaseCounterCache',
+    'LOCATION': 'default',
+}
+# Адреса и сети обратных прокси (через запятую): за ними адрес клиента
+# берётся из X-Forwarded-For.
+RATE_LIMIT_TRUSTED_PROXIES = [
+    proxy.strip()
+    for proxy in os.environ.get(
+        'YANOTE_RATE_LIMIT_TRUSTED_PROXIES', ''
+    ).split(',')
+    if proxy.strip()
+]
+
+# Прогрев воркера при загрузке wsgi/asgi (yanote.warmup): импорты, URLconf,
+# шаблоны и соединения с базами до первого запроса.
+WARMUP_ON_LOAD = os.environ.get('YANOTE_WARMUP', '0') == '1'
+WARMUP_STEPS = ('imports', 'urls', 'templates', 'database')
+
+# Профилирование запросов по токену со страницы /admin/profiles/
+# (yanote.profiling): хранятся последние PROFILING_KEEP отчётов.
+PROFILING_ENABLED = True
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_KEEP = 50
+PROFILING_TOKEN_MAX_AGE = 3600
+PROFILING_MAX_QUERIES = 500
+
+# Метрики в формате Prometheus. С YANOTE_METRICS_TOKEN /metrics требует
+# заголовок «Authorization: Bearer <токен>» (bearer_token в Prometheus);
+# без него доступен только с этих адресов и не через прокси. За прокси
+# на той же машине задайте токен или закройте путь на самом прокси.
+METRICS_ENABLED = True
+METRICS_TOKEN = os.environ.get('YANOTE_METRICS_TOKEN')
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
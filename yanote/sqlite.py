@@ -0,0 +1,40 @@
+"""Настройка соединений SQLite по профилю из settings.SQLITE_PRAGMAS."""
+import re
+
+from django.conf import settings
+
+_NAME = re.compile(r'^[a-z_]+$')
+_VALUE = re.compile(r'^-?[\w]+$')
+
+
+def pragma_statements(pragmas):
+    """PRAGMA-инструкции для словаря {имя: значение}.
+
+    busy_timeout ставится первым, чтобы смена journal_mode не падала
+    сразу, если база занята другим процессом.
+    """
+    statements = []
+    for name, value in sorted(
+        pragmas.items(), key=lambda item: item[0] != 'busy_timeout'
+    ):
+        value = str(value)
+        if not _NAME.match(name) or not _VALUE.match(value):
+            raise ValueError(f'Недопустимая PRAGMA {name}={value}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def apply_pragmas(cursor, pragmas):
+    for statement in pragma_statements(pragmas):
+        cursor.execute(statement)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: применяет PRAGMA профиля."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas)
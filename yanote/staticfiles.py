@@ -0,0 +1,193 @@
+"""Статика без внешних CDN: отпечатки в именах, .gz и вечный кэш.
+
+collectstatic с CompressedManifestStaticFilesStorage кладёт в
+STATIC_ROOT копии файлов с хэшем содержимого в имени, манифест
+staticfiles.json и рядом с текстовыми файлами - их сжатые .gz
+варианты. serve() отдаёт .gz клиентам, принимающим gzip, а файлам с
+хэшем в имени ставит Cache-Control immutable на год: новое содержимое
+получит новое имя.
+
+Сторонние файлы (VENDOR_ASSETS) лежат в static/vendor и скачиваются
+командой ``manage.py vendor_static`` со сверкой хэша SRI. Пока своей
+копии нет, тег {% vendor_stylesheet %} ссылается на CDN с тем же SRI.
+"""
+import gzip
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core import checks
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage,
+)
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+# Путь в STATICFILES_DIRS -> откуда скачан и хэш SRI содержимого.
+VENDOR_ASSETS = {
+    'vendor/bootstrap/5.0.1/bootstrap.min.css': {
+        'url': (
+            'https://cdn.jsdelivr.net/npm/bootstrap@5.0.1/dist/css/'
+            'bootstrap.min.css'
+        ),
+        'integrity': (
+            'sha384-+0n0xVW2eSR5OomGNYDnhzAbDsOXxcvSN1TPprVMTNDbiYZCxYbOOl7'
+            '+AMvyTG2x'
+        ),
+    },
+}
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.txt', '.json', '.map')
+# Меньшие файлы сжатие почти не уменьшает, а заголовки добавляет.
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Имена без хэша могут смениться содержимым при следующем деплое.
+MUTABLE_CACHE_CONTROL = 'public, max-age=60'
+
+_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Манифест с хэшами имён плюс .gz рядом с текстовыми файлами."""
+
+    def stored_name(self, name):
+        # Без манифеста (collectstatic не запускался) при DEBUG и в
+        # тестах {% static %} отдаёт исходное имя; в остальных случаях
+        # остаётся строгая проверка ManifestStaticFilesStorage.
+        if not self.hashed_files and getattr(
+            settings, 'STATIC_MANIFEST_FALLBACK', False
+        ):
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = []
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run=dry_run, **options
+        ):
+            if isinstance(hashed_name, str):
+                names.append(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in dict.fromkeys([*paths, *names]):
+            if self.compress(name):
+                yield name, f'{name}.gz', True
+
+    def compress(self, name):
+        """Пишет name.gz, если он заметно меньше; True, если записан.
+
+        mtime=0 в заголовке gzip: одинаковый файл даёт одинаковый .gz
+        при каждой сборке.
+        """
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return False
+        path = Path(self.path(name))
+        if not path.is_file():
+            return False
+        content = path.read_bytes()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return False
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content) * 0.95:
+            return False
+        path.with_name(f'{path.name}.gz').write_bytes(compressed)
+        return True
+
+    def is_immutable(self, name):
+        """Имя с хэшем из манифеста: содержимое под ним не меняется."""
+        try:
+            immutable = self._immutable_names
+        except AttributeError:
+            immutable = self._immutable_names = frozenset(
+                self.hashed_files.values()
+            )
+        return name in immutable
+
+
+@require_safe
+def serve(request, path):
+    """Отдаёт файл из STATIC_ROOT, сжатый вариант - если клиент готов.
+
+    Для развёртываний, где статику раздаёт само приложение; за nginx
+    маршрут выключается настройкой STATIC_SERVE.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = Path(safe_join(settings.STATIC_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404(path)
+    if not fullpath.is_file():
+        raise Http404(path)
+    content_type, encoding = mimetypes.guess_type(fullpath.name)
+    compressed = fullpath.with_name(f'{fullpath.name}.gz')
+    if (
+        encoding is None
+        and _accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        and compressed.is_file()
+    ):
+        fullpath, encoding = compressed, 'gzip'
+    stat = fullpath.stat()
+    if not was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime
+    ):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(
+            fullpath.open('rb'),
+            content_type=content_type or 'application/octet-stream',
+        )
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Cache-Control'] = (
+        IMMUTABLE_CACHE_CONTROL if is_immutable(path)
+        else MUTABLE_CACHE_CONTROL
+    )
+    return response
+
+
+def is_immutable(name):
+    check = getattr(staticfiles_storage, 'is_immutable', None)
+    return bool(check and check(name))
+
+
+def is_vendored(name):
+    """Есть ли своя копия файла: в манифесте или, до collectstatic,
+    среди исходников статики."""
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    if hashed_files:
+        return staticfiles_storage.hash_key(name) in hashed_files
+    return finders.find(name) is not None
+
+
+def vendor_asset(name):
+    """(адрес, SRI) стороннего файла: своя копия без SRI или CDN."""
+    if is_vendored(name):
+        return staticfiles_storage.url(name), None
+    asset = VENDOR_ASSETS[name]
+    return asset['url'], asset['integrity']
+
+
+def check_vendor_assets(app_configs=None, **kwargs):
+    """Без скачанных VENDOR_ASSETS страницы грузят их с CDN."""
+    root = Path(settings.STATICFILES_DIRS[0])
+    return [
+        checks.Warning(
+            f'Нет стороннего статического файла {name}, '
+            f'страницы берут его с CDN.',
+            hint='Выполните manage.py vendor_static и закоммитьте файл.',
+            id='yanote.W001',
+        )
+        for name in VENDOR_ASSETS
+        if not (root / name).is_file()
+    ]
@@ -1,12 +1,28 @@
+import re
+
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.forms import UserCreationForm
-from django.urls import include, path
+from django.conf import settings
+from django.urls import include, path, re_path
 from django.views.generic import CreateView
 
+from yanote import metrics, profiling, staticfiles
+
 urlpatterns = [
     path('', include('notes.urls')),
+    path(
+        'admin/profiles/',
+        admin.site.admin_view(profiling.profile_list),
+        name='profile_list',
+    ),
+    path(
+        'admin/profiles/<str:report_id>/',
+        admin.site.admin_view(profiling.profile_detail),
+        name='profile_detail',
+    ),
     path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
 
 auth_urls = ([
@@ -34,3 +50,12 @@ auth_urls = ([
 ], 'users')
 
 urlpatterns += [path('auth/', include(auth_urls))]
+
+if settings.STATIC_SERVE:
+    urlpatterns += [
+        re_path(
+            r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')),
+            staticfiles.serve,
+            name='static',
+        ),
+    ]
@@ -0,0 +1,114 @@
+"""Прогрев воркера при загрузке приложения.
+
+Первый запрос свежего воркера платит за ленивые импорты (админка,
+формы auth, pytils, Markdown), разбор URLconf, компиляцию шаблонов и
+открытие соединения с базой. warm_up() делает это заранее; wsgi.py и
+asgi.py вызывают on_load() сразу после создания приложения, и прогрев
+включается настройкой WARMUP_ON_LOAD.
+
+Шаблоны компилируются в кэш cached.Loader, который Django включает при
+DEBUG = False; с DEBUG шаг ничего не даёт. Соединение с базой
+переживает первый запрос только при CONN_MAX_AGE > 0. С gunicorn
+--preload прогрев идёт в мастере до fork: шаг database тогда нужно
+убрать из WARMUP_STEPS, чтобы воркеры не делили одно соединение.
+"""
+import logging
+from importlib import import_module
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Модули, которые иначе импортируются только первым запросом.
+MODULES = (
+    'django.contrib.admin.views.main',
+    'django.contrib.auth.forms',
+    'django.contrib.auth.views',
+    'django.contrib.messages.storage.fallback',
+    'pytils.translit',
+    'markdown',
+    'bleach',
+    'notes.forms',
+    'notes.views',
+    'notes.api',
+    'notes.rendering',
+)
+STEPS = ('imports', 'urls', 'templates', 'database')
+
+
+def warm_imports():
+    for name in MODULES:
+        import_module(name)
+    return len(MODULES)
+
+
+def warm_urls():
+    """Разбирает URLconf и строит таблицы reverse() всех пространств."""
+    resolver = get_resolver()
+    count = len(resolver.reverse_dict)
+    for _, sub_resolver in resolver.namespace_dict.values():
+        count += len(sub_resolver.reverse_dict)
+    return count
+
+
+def warm_templates():
+    """Компилирует все шаблоны из каталогов TEMPLATES['DIRS']."""
+    count = 0
+    for engine in engines.all():
+        dirs = getattr(engine, 'dirs', ())
+        for directory in map(Path, dirs):
+            for path in sorted(directory.rglob('*.html')):
+                engine.get_template(path.relative_to(directory).as_posix())
+                count += 1
+    return count
+
+
+def warm_database():
+    """Открывает соединения со всеми базами из DATABASES."""
+    for connection in connections.all():
+        connection.ensure_connection()
+    return len(settings.DATABASES)
+
+
+def warm_up(steps=None):
+    """Выполняет шаги прогрева; список (шаг, сколько, секунды).
+
+    Упавший шаг пишется в лог и не мешает остальным: воркер, который
+    не прогрелся, всё равно должен запуститься.
+    """
+    functions = {
+        'imports': warm_imports,
+        'urls': warm_urls,
+        'templates': warm_templates,
+        'database': warm_database,
+    }
+    report = []
+    for step in steps or STEPS:
+        started = perf_counter()
+        try:
+            count = functions[step]()
+        except Exception:
+            logger.exception('Прогрев: шаг %s упал', step)
+            count = None
+        report.append((step, count, perf_counter() - started))
+    return report
+
+
+def on_load():
+    """Прогрев из wsgi.py/asgi.py, если он включён в настройках."""
+    if not getattr(settings, 'WARMUP_ON_LOAD', False):
+        return None
+    report = warm_up(getattr(settings, 'WARMUP_STEPS', None))
+    logger.info(
+        'Прогрев: %s',
+        ', '.join(
+            f'{step} {count} за {seconds * 1000:.1f} мс'
+            for step, count, seconds in report
+        ),
+    )
+    return report